@@ -1,24 +1,44 @@
+import asyncio
+import hmac
+import json
 import os
 import sys
+import time
+from datetime import datetime, timezone
 from pathlib import Path
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Header, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import cv2
 import numpy as np
-from typing import List
+from typing import List, Optional
 
 # Add the backend directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent))
 
-from mapping.swara_map import map_swara_to_num, get_swara_details
-from database import save_scan, get_history
-from schemas import DetectResponse, Detection
-from inference.detector import run_detection
-from inference.post_process import PostProcessor
-
-# Initialize post-processor
-# Initialize post-processor with lower threshold for "90% accuracy" mission
-post_processor = PostProcessor(confidence_threshold=0.15, iou_threshold=0.5)
+import config
+import metrics
+import compact
+from mapping.swara_map import parse_phrase
+from database import (
+    HAS_FTS5, HISTORY_FIELDS, SUMMARY_FIELDS, enqueue_scan, enqueue_scans, get_scan, init_db, iter_history,
+    save_scan, search_sequences, stop_writer, writer_queue_depth
+)
+from schemas import DetectResponse
+from inference.detector import run_detection, tile_cache, tile_scheduler_stats
+from inference.batcher import SchedulerTimeout
+from inference.scale_policy import SCALE_POLICIES, SCALE_MERGES
+from inference.pipeline import (
+    post_processor, analyze_image, build_result, decode_image, split_pages, pipeline_settings, ImageTooLargeError,
+    InvalidImageError
+)
+from inference.preprocess import PREPROCESS_PROFILES, deskew, enhance_notation
+from inference.live import LiveTracker, downscale
+from inference.model_registry import MODELS_DIR, model_registry
+from inference.worker_pool import InferencePool, PoolSaturated, SwapInProgress
+from result_cache import ResultCache
+from jobs import JobError, JobProgress, JobQueue, JobRunner
 
 import logging
 logging.basicConfig(level=logging.INFO)
@@ -31,146 +51,775 @@ app.add_middleware(
     allow_origins=['*'],
     allow_methods=['*'],
     allow_headers=['*'],
+    expose_headers=['X-Next-Before-Id', 'Server-Timing'],
 )
+if config.GZIP_MIN_SIZE > 0:
+    app.add_middleware(GZipMiddleware, minimum_size=config.GZIP_MIN_SIZE)
 
-def deskew(img: np.ndarray) -> np.ndarray:
-    """Corrects image rotation for better horizontal alignment."""
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    gray = cv2.bitwise_not(gray)
-    thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
-    
-    coords = np.column_stack(np.where(thresh > 0))
-    angle = cv2.minAreaRect(coords)[-1]
-    
-    if angle < -45:
-        angle = -(90 + angle)
-    else:
-        angle = -angle
-        
-    (h, w) = img.shape[:2]
-    center = (w // 2, h // 2)
-    M = cv2.getRotationMatrix2D(center, angle, 1.0)
-    rotated = cv2.warpAffine(img, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
-    return rotated
-
-def enhance_notation(img: np.ndarray) -> np.ndarray:
-    """
-    Precision Swaralipi X-Engine Pre-processing v2
-    """
-    # 1. Deskew
-    img = deskew(img)
-    
-    # 2. Convert to grayscale for contrast work
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    
-    # 3. Balanced CLAHE (Lower clipLimit to prevent blowout)
-    clahe = cv2.createCLAHE(clipLimit=1.5, tileGridSize=(8,8))
-    gray = clahe.apply(gray)
-    
-    # 4. Precision Sharpening (Unsharp Masking)
-    # This specifically highlights small details like dots
-    gaussian = cv2.GaussianBlur(gray, (0, 0), 2.0)
-    gray = cv2.addWeighted(gray, 2.0, gaussian, -1.0, 0)
-    
-    # 5. Denoise slightly but keep edges (FastNlMeansDenoising is good for scanned docs)
-    gray = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
-    
-    # 6. Convert back to BGR for model compatibility
-    img = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
-    
-    return img
+
+@app.middleware('http')
+async def trace_requests(request: Request, call_next):
+    # Spans recorded while handling the request (including in to_thread helpers) land in this trace
+    trace = metrics.start_trace()
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Route templates keep /history/{scan_id} and /jobs/{job_id} to one series each
+    route = request.scope.get('route')
+    metrics.request_seconds.observe(
+        time.perf_counter() - start, method=request.method,
+        route=route.path if route is not None else 'unmatched', status=response.status_code
+    )
+    if config.SERVER_TIMING and trace.stages:
+        response.headers['Server-Timing'] = trace.server_timing()
+    return response
+
+# CPU-heavy scan work runs here so the event loop stays free for /health and /history
+inference_pool = InferencePool(
+    workers=config.INFERENCE_WORKERS,
+    mode=config.INFERENCE_WORKER_MODE,
+    max_queue=config.INFERENCE_QUEUE_SIZE,
+    retry_after=config.INFERENCE_RETRY_AFTER,
+)
+
+result_cache = ResultCache(
+    max_entries=config.CACHE_MAX_ENTRIES,
+    max_disk_entries=config.CACHE_MAX_DISK_ENTRIES,
+    ttl_seconds=config.CACHE_TTL_SECONDS,
+    persistent=config.CACHE_PERSISTENT,
+)
+
+
+job_queue = JobQueue(retention_seconds=config.JOB_RETENTION_SECONDS, max_attempts=config.JOB_MAX_ATTEMPTS,
+                     lease_seconds=config.JOB_LEASE_SECONDS)
+
+metrics.registry.gauge(
+    'swaralipi_model_ready', 'Whether a worker has loaded and warmed up the model.',
+    lambda: int(inference_pool.readiness()['state'] == 'ready'))
+metrics.registry.gauge(
+    'swaralipi_model_version_info', 'Model version serving new requests (value is always 1).',
+    lambda: {inference_pool.stats()['model_version']: 1} if inference_pool.stats()['model_version'] else None,
+    labelname='version')
+metrics.registry.gauge(
+    'swaralipi_inference_pool', 'Inference pool occupancy.',
+    lambda: metrics.flatten(inference_pool.stats(), ('workers', 'in_flight', 'queue_depth', 'queue_capacity')),
+    labelname='field')
+metrics.registry.gauge(
+    'swaralipi_inference_tasks_total', 'Inference pool tasks by outcome.',
+    lambda: metrics.flatten(inference_pool.stats(), ('completed', 'failed', 'rejected')),
+    labelname='outcome', kind='counter')
+metrics.registry.gauge(
+    'swaralipi_scheduler_pending_tiles', 'Tiles waiting for the shared tile scheduler.',
+    lambda: (tile_scheduler_stats() or {}).get('pending_tiles'))
+metrics.registry.gauge(
+    'swaralipi_scheduler_batches_total', 'Forward passes run by the shared tile scheduler.',
+    lambda: (tile_scheduler_stats() or {}).get('batches'), kind='counter')
+metrics.registry.gauge(
+    'swaralipi_cache_lookups_total', 'Result cache lookups by outcome.',
+    lambda: metrics.flatten(result_cache.stats(), ('hits_memory', 'hits_disk', 'misses')),
+    labelname='result', kind='counter')
+metrics.registry.gauge(
+    'swaralipi_tile_cache_lookups_total', 'Tile cache lookups in this process by outcome.',
+    lambda: metrics.flatten(tile_cache.stats(), ('hits', 'misses')), labelname='result', kind='counter')
+metrics.registry.gauge(
+    'swaralipi_cache_entries', 'Results held in the in-memory cache.',
+    lambda: result_cache.stats()['entries'])
+metrics.registry.gauge(
+    'swaralipi_live_sessions', 'Open live camera WebSocket sessions.', lambda: live_sessions)
+metrics.registry.gauge(
+    'swaralipi_jobs', 'Jobs in jobs.db by status.', job_queue.counts, labelname='status')
+metrics.registry.gauge(
+    'swaralipi_scan_writer_queue_depth', 'Scan batches waiting for the background writer.', writer_queue_depth)
+
+
+STARTED_AT = time.monotonic()
+
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+
+@app.on_event('startup')
+def start_inference_pool():
+    init_db()
+    # Returns immediately; workers load and warm up the model in the background (see /readyz)
+    inference_pool.start()
+    job_runner.start()
+
+
+@app.on_event('shutdown')
+def stop_inference_pool():
+    # Runners finish their current job first; anything cut short is requeued on the next start
+    job_runner.shutdown()
+    inference_pool.shutdown()
+    # Flush scans still waiting for a group commit
+    stop_writer()
+
+
+@app.get('/livez')
+def livez():
+    """The process is up and serving HTTP; says nothing about the model."""
+    return {"status": "alive", "uptime_s": round(time.monotonic() - STARTED_AT, 1)}
+
+
+@app.get('/readyz')
+def readyz():
+    """200 once a worker has loaded and warmed up the model, 503 until then (or if loading failed)."""
+    model = inference_pool.readiness()
+    body = {"ready": model["state"] == "ready", "uptime_s": round(time.monotonic() - STARTED_AT, 1), "model": model}
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
 
 
 @app.get('/health')
 def health():
+    model = inference_pool.readiness()
+    return {
+        "status": "healthy" if model["state"] == "ready" else model["state"],
+        "engine": "SAHI",
+        "backend": config.INFERENCE_BACKEND,
+        "model": model,
+        "models": model_registry.stats(),
+        "inference": inference_pool.stats(),
+        "scheduler": tile_scheduler_stats(),
+        "cache": result_cache.stats(),
+        "tile_cache": tile_cache.stats(),
+        "jobs": job_queue.counts()
+    }
+
+
+@app.get('/metrics', response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Counters, gauges and stage latency histograms in the Prometheus text format."""
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def _require_admin(token: Optional[str]):
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled (set SWARALIPI_ADMIN_TOKEN)")
+    if token is None or not hmac.compare_digest(token, config.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.get('/admin/model')
+def model_status(x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    active = model_registry.active()
     return {
-        "status": "healthy",
-        "engine": "SAHI"
+        "active": active.info() if active is not None else None,
+        "models": model_registry.stats(),
+        "pool": inference_pool.readiness(),
+        "available": _available_weights(),
     }
 
 
-@app.post('/detect', response_model=DetectResponse)
-async def detect(file: UploadFile = File(...), confidence: float = 0.15):
-    content = await file.read()
+def _available_weights() -> List[str]:
+    """Weights files in models/; empty when the directory is missing (it is not tracked) or unreadable."""
+    if not MODELS_DIR.is_dir():
+        return []
     try:
-        # Decode image
-        nparr = np.frombuffer(content, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image file")
-
-        # Apply Clear-Ink Filter
-        enhanced_img = enhance_notation(img)
-
-        # Run detection
-        result = run_detection(enhanced_img)
-        
-        # Convert result to expected format
-        detections = []
-        for pred in result.object_prediction_list:
-            detections.append({
-                'label': pred.category.name,
-                'score': float(pred.score.value),
-                'bbox': [int(pred.bbox.minx), int(pred.bbox.miny), int(pred.bbox.maxx), int(pred.bbox.maxy)]
-            })
-        
-        # Minimal post-processing (just overlap removal)
-        detections = post_processor.process(detections)
-        
+        return sorted(p.name for p in MODELS_DIR.iterdir() if p.suffix in ('.pt', '.onnx', '.xml'))
+    except OSError as e:
+        logger.warning(f"Listing {MODELS_DIR} failed: {e}")
+        return []
+
+
+@app.post('/admin/model')
+async def swap_model(weights: str, backend: str | None = None, x_admin_token: Optional[str] = Header(None)):
+    """
+    Switches the server to another weights file in models/ without a restart. New workers load
+    and warm up the model first; requests already accepted finish on the old one.
+    """
+    _require_admin(x_admin_token)
+    path = (MODELS_DIR / weights).resolve()
+    if path.parent != MODELS_DIR.resolve() or not path.is_file():
+        raise HTTPException(status_code=404, detail=f"No weights named {weights!r} in {MODELS_DIR.name}/")
+    try:
+        version = await asyncio.to_thread(model_registry.version_for, path, backend)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    active = model_registry.active()
+    if active is not None and active.tag == version.tag:
+        return {"previous": active.tag, "active": active.tag, "swap_ms": 0.0, "model": active.info()}
+    try:
+        result = await asyncio.to_thread(inference_pool.swap_model, version)
+    except SwapInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Model swap to {version.tag} failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Model swap failed, still serving the previous model: {e}")
+    return {**result, "model": version.info()}
+
+
+@app.post('/detect', response_model=DetectResponse, responses={200: {'content': {
+    compact.COMPACT_JSON_TYPE: {}, compact.MSGPACK_TYPES[0]: {}
+}}})
+async def detect(request: Request, response: Response, file: UploadFile = File(...), confidence: float = 0.15,
+                 scale_policy: str | None = None, scale_merge: str | None = None,
+                 profile: str | None = None, use_cache: bool = True):
+    """
+    Analyses one page. The Accept header picks the response format: JSON (default), or the
+    columnar form (see compact.py) as compact JSON (application/vnd.swaralipi.compact+json)
+    or MessagePack (application/msgpack, needs the optional 'msgpack' package).
+    """
+    _validate_options(scale_policy, scale_merge, profile)
+    media_type = _negotiate(request)
+
+    content = await _read_upload(file)
+    settings = pipeline_settings(scale_policy=scale_policy, scale_merge=scale_merge, profile=profile)
+    try:
+        # Decoding and hashing a multi-megapixel page is too slow for the event loop
+        img, cache_key, cached = await asyncio.to_thread(_decode_and_lookup, content, settings, use_cache)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidImageError:
+        raise HTTPException(status_code=400, detail="Invalid image file")
+    del content
+
+    if cached is not None:
+        logger.info(f"--- Cache hit {cache_key[:12]} ---")
+        metrics.pages_counter.inc(source='cache')
+        result = {**cached, 'timestamp': datetime.utcnow().isoformat() + 'Z', 'cached': True}
+        _persist(result)
+        return _encode(result, media_type, response)
+
+    try:
+        # Clear-Ink Filter, detection and post-processing on a worker
+        detections, info = await inference_pool.run(
+            analyze_image, img, scale_policy=scale_policy, scale_merge=scale_merge, profile=profile
+        )
+
         # Diagnostic Logging
         raw_labels = [d['label'] for d in detections]
         label_counts = {}
         for l in raw_labels:
             label_counts[l] = label_counts.get(l, 0) + 1
         logger.info(f"--- RAW Detection Count: {label_counts} ---")
+        metrics.record_pipeline(info)
+        logger.info(f"--- Stage ms: preprocess {info['timings']} detect {info['detect_ms']} ---")
 
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except PoolSaturated as e:
+        logger.warning(f"Inference queue full: {inference_pool.stats()}")
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy analysing other scans. Please retry shortly.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except SchedulerTimeout as e:
+        logger.warning(f"{e}: {tile_scheduler_stats()}")
+        raise HTTPException(status_code=504, detail="Analysis took too long. Please retry shortly.")
     except Exception as e:
         logger.error(f"Detection failed: {e}")
         import traceback
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail="Backend Analysis Failed. Check server logs.")
 
-    det_objs = []
-    for d in detections:
-        details = get_swara_details(d['label'])
-        det = Detection(
-            label=d['label'],
-            english_name=details['english'],
-            symbol=details['symbol'],
-            score=d['score'],
-            bbox=d['bbox'],
-            numeric=details['numeric'],
-            octave=details['octave']
+    result = _build_result(detections, info)
+
+    if use_cache:
+        await asyncio.to_thread(_cache_put, cache_key, result, settings)
+
+    _persist(result)
+    return _encode(result, media_type, response)
+
+
+def _negotiate(request: Request) -> str:
+    media_type = compact.negotiate(request.headers.get('accept'))
+    if media_type is None:
+        accept = request.headers.get('accept', '')
+        missing = " (MessagePack needs the optional 'msgpack' package)" if 'msgpack' in accept else ""
+        raise HTTPException(
+            status_code=406,
+            detail=f"Acceptable formats: {compact.JSON_TYPE}, {compact.COMPACT_JSON_TYPE}, "
+                   f"{', '.join(compact.MSGPACK_TYPES)}{missing}"
         )
-        det_objs.append(det)
-
-    # Simplified sequence logic
-    ordered_labels = [d.label for d in det_objs]
-    numeric_sequence = [d.numeric for d in det_objs if d.numeric != -1]
-    overall_confidence = float(sum(d.score for d in det_objs) / len(det_objs)) if det_objs else 0.0
-
-    from datetime import datetime
-    response = DetectResponse(
-        detections=det_objs, 
-        ordered_labels=ordered_labels,
-        numeric_sequence=numeric_sequence, 
-        overall_confidence=overall_confidence,
-        timestamp=datetime.utcnow().isoformat() + 'Z',
-        model_info="YOLOv8-Swaralipi-Direct"
-    )
+    return media_type
+
+
+def _encode(result: dict, media_type: str, response: Response):
+    """
+    The response in the negotiated format. JSON is returned as the DetectResponse dict, so
+    FastAPI validates and serialises it against response_model; the compact formats are
+    serialised straight from the columnar result and sent as they are.
+    """
+    with metrics.span('encode'):
+        if media_type == compact.JSON_TYPE:
+            response.headers['Vary'] = 'Accept'
+            return compact.expand(result)
+        return Response(compact.encode(result, media_type), media_type=media_type, headers={'Vary': 'Accept'})
+
+
+async def _read_upload(file: UploadFile) -> bytes:
+    """The upload's bytes, refusing anything over MAX_UPLOAD_MB before it is all held in memory."""
+    limit = config.MAX_UPLOAD_MB * 2 ** 20
+    too_large = HTTPException(status_code=413, detail=f"Upload exceeds the {config.MAX_UPLOAD_MB} MB limit")
+    # Multipart uploads are spooled to a temporary file, so their size is known before reading
+    if file.size is not None:
+        if limit and file.size > limit:
+            raise too_large
+        return await file.read()
+    chunks, size = [], 0
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if limit and size > limit:
+            raise too_large
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def _validate_options(scale_policy: str | None, scale_merge: str | None, profile: str | None):
+    if scale_policy is not None and scale_policy not in SCALE_POLICIES:
+        raise HTTPException(status_code=400, detail=f"scale_policy must be one of {list(SCALE_POLICIES)}")
+    if scale_merge is not None and scale_merge not in SCALE_MERGES:
+        raise HTTPException(status_code=400, detail=f"scale_merge must be one of {list(SCALE_MERGES)}")
+    if profile is not None and profile not in PREPROCESS_PROFILES:
+        raise HTTPException(status_code=400, detail=f"profile must be one of {list(PREPROCESS_PROFILES)}")
+
+
+def _build_result(detections, info) -> dict:
+    with metrics.span('mapping'):
+        return build_result(detections, info)
+
+
+def _cacheable(result: dict) -> dict:
+    return {k: v for k, v in result.items()
+            if k not in ('timestamp', 'cached', 'preprocess_ms', 'page_memory', 'tile_stats')}
+
+
+def _decode_and_lookup(content, settings: dict, use_cache: bool):
+    if isinstance(content, bytes):
+        with metrics.span('decode'):
+            img = decode_image(content)
+    else:
+        img = content
+    if not use_cache:
+        return img, None, None
+    with metrics.span('cache_lookup'):
+        key = result_cache.make_key(img, settings)
+        return img, key, result_cache.get(key)
+
+
+def _cache_put(key: str, result: dict, settings: dict):
+    if result['model_info'] != settings['model_version']:
+        # The model was swapped while this page was analysed; its key names the old version
+        return
+    with metrics.span('cache_store'):
+        result_cache.put(key, _cacheable(result))
 
-    # persist
+
+def _persist(result: dict):
+    # Written by the background writer; /detect does not wait for the commit
+    start = time.perf_counter()
     try:
-        save_scan(response.model_dump())
+        future = enqueue_scan(result)
     except Exception:
+        return
+
+    def done(f):
+        if f.exception():
+            logger.error(f"Saving scan failed: {f.exception()}")
+        else:
+            # Queue wait plus group commit; the request has usually returned by now
+            metrics.record_stage('persist', (time.perf_counter() - start) * 1000)
+
+    future.add_done_callback(done)
+
+
+@app.post('/detect_batch')
+async def detect_batch(request: Request, files: List[UploadFile] = File(...), confidence: float = 0.15,
+                       scale_policy: str | None = None, scale_merge: str | None = None,
+                       profile: str | None = None, use_cache: bool = True, format: str | None = None):
+    """
+    Analyses many pages in one request: several files, zips of images, or multi-page TIFF/PDF.
+    Pages run in parallel and each result is streamed as soon as it finishes, as NDJSON lines
+    (default) or Server-Sent Events (format=sse or Accept: text/event-stream). Every line carries
+    the page index and source name; the last one reports the scan ids, which are saved in a
+    single transaction once the whole batch is done.
+    """
+    _validate_options(scale_policy, scale_merge, profile)
+    sse = format == 'sse' or (format is None and 'text/event-stream' in request.headers.get('accept', ''))
+    if format not in (None, 'ndjson', 'sse'):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'")
+
+    uploads = [(f.filename, await _read_upload(f)) for f in files]
+    try:
+        pages = await asyncio.to_thread(_expand_uploads, uploads)
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not pages:
+        raise HTTPException(status_code=400, detail="No images found in the upload")
+
+    settings = pipeline_settings(scale_policy=scale_policy, scale_merge=scale_merge, profile=profile)
+    options = {'scale_policy': scale_policy, 'scale_merge': scale_merge, 'profile': profile}
+
+    def encode(event: str, payload: dict) -> str:
+        data = json.dumps(payload, ensure_ascii=False)
+        return f"event: {event}\ndata: {data}\n\n" if sse else data + '\n'
+
+    async def generate():
+        semaphore = asyncio.Semaphore(max(1, config.BATCH_CONCURRENCY))
+        tasks = [
+            asyncio.create_task(_batch_page(i, source, page, settings, options, use_cache, semaphore))
+            for i, (source, page) in enumerate(pages)
+        ]
+        columnar = {}
+        try:
+            for next_page in asyncio.as_completed(tasks):
+                item, result = await next_page
+                if result is not None:
+                    columnar[item['index']] = result
+                yield encode('page', item)
+
+            results = [columnar[i] for i in range(len(pages)) if i in columnar]
+            summary = {'done': True, 'pages': len(pages), 'failed': len(pages) - len(results), 'scan_ids': []}
+            if results:
+                try:
+                    with metrics.span('persist'):
+                        summary['scan_ids'] = await asyncio.wrap_future(enqueue_scans(results))
+                except Exception as e:
+                    logger.error(f"Saving batch of {len(results)} scans failed: {e}")
+                    summary['error'] = "Saving the batch failed"
+            yield encode('done', summary)
+        finally:
+            # Client went away: stop pages that have not started yet
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream' if sse else 'application/x-ndjson',
+        headers={'Cache-Control': 'no-cache'},
+    )
+
+
+def _expand_uploads(uploads):
+    pages = []
+    for filename, content in uploads:
+        pages.extend(split_pages(content, filename, config.BATCH_MAX_PAGES))
+        if len(pages) > config.BATCH_MAX_PAGES:
+            raise InvalidImageError(f"Batch exceeds {config.BATCH_MAX_PAGES} pages")
+    return pages
+
+
+async def _batch_page(index: int, source: str, page, settings: dict, options: dict,
+                      use_cache: bool, semaphore: asyncio.Semaphore):
+    """
+    One page of /detect_batch: its stream item and columnar result (None if it failed).
+    Failures are reported in the item instead of ending the batch.
+    """
+    item = {'index': index, 'source': source}
+    async with semaphore:
+        try:
+            img, cache_key, cached = await asyncio.to_thread(_decode_and_lookup, page, settings, use_cache)
+            if cached is not None:
+                metrics.pages_counter.inc(source='cache')
+                result = {**cached, 'timestamp': datetime.utcnow().isoformat() + 'Z', 'cached': True}
+            else:
+                while True:
+                    try:
+                        detections, info = await inference_pool.run(analyze_image, img, **options)
+                        break
+                    except PoolSaturated as e:
+                        # Batches wait for a free slot instead of failing the page
+                        await asyncio.sleep(e.retry_after)
+                metrics.record_pipeline(info)
+                result = _build_result(detections, info)
+                if use_cache:
+                    await asyncio.to_thread(_cache_put, cache_key, result, settings)
+        except ImageTooLargeError as e:
+            item['error'] = str(e)
+            return item, None
+        except InvalidImageError:
+            item['error'] = "Invalid image file"
+            return item, None
+        except SchedulerTimeout as e:
+            logger.warning(f"{e}: {tile_scheduler_stats()}")
+            item['error'] = "Analysis took too long"
+            return item, None
+        except Exception as e:
+            logger.error(f"Detection failed for batch page {source}: {e}")
+            item['error'] = "Backend Analysis Failed. Check server logs."
+            return item, None
+    item['result'] = compact.expand(result)
+    return item, result
+
+
+live_sessions = 0
+
+
+@app.websocket('/live')
+async def live(websocket: WebSocket, profile: str | None = None):
+    """
+    Live camera preview. The client sends downscaled camera frames (JPEG/PNG) as binary
+    messages and gets one JSON message per processed frame:
+    {frame, kind: "tracked" | "keyframe", detections, motion, keyframe_pending, dropped, latency_ms}.
+    Only keyframes run the detector (see LiveTracker); other frames reuse the keyframe's boxes,
+    moved by the estimated camera motion. Frames that arrive while one is being processed
+    replace each other, so a slow connection or server sees the newest frame, not a backlog.
+    """
+    global live_sessions
+    if profile is not None and profile not in PREPROCESS_PROFILES:
+        await websocket.close(code=1008, reason=f"profile must be one of {list(PREPROCESS_PROFILES)}")
+        return
+    profile = profile or config.LIVE_PROFILE
+    await websocket.accept()
+    live_sessions += 1
+
+    tracker = LiveTracker(config.LIVE_KEYFRAME_INTERVAL_S, config.LIVE_MIN_MOTION_RESPONSE, config.LIVE_MAX_DRIFT)
+    waiting = None
+    arrived = asyncio.Event()
+    received = 0
+    dropped = 0
+
+    async def receive_frames():
+        nonlocal waiting, received, dropped
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            content = message.get('bytes')
+            if not content:
+                continue
+            received += 1
+            metrics.live_frames_counter.inc(kind='received')
+            if waiting is not None:
+                dropped += 1
+                metrics.live_frames_counter.inc(kind='dropped')
+            waiting = (received, content, time.perf_counter())
+            arrived.set()
+
+    receiver = asyncio.create_task(receive_frames())
+    keyframe = None
+    frame_id = None
+    try:
+        while True:
+            arrival = asyncio.create_task(arrived.wait())
+            done, _ = await asyncio.wait([receiver, arrival] + ([keyframe] if keyframe else []),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if arrival not in done:
+                arrival.cancel()
+            if receiver in done:
+                break
+
+            if keyframe in done:
+                detections = None
+                try:
+                    found, info = keyframe.result()
+                    metrics.record_pipeline(info)
+                    result = _build_result(found, info)
+                    detections = compact.expand(result)['detections']
+                except Exception as e:
+                    logger.warning(f"Live keyframe failed: {e}")
+                keyframe = None
+                if tracker.finish_keyframe(detections):
+                    metrics.live_frames_counter.inc(kind='keyframe')
+                    await websocket.send_json({
+                        'frame': frame_id, 'kind': 'keyframe', 'detections': tracker.current(),
+                        'model_info': result['model_info'], 'keyframe_pending': False, 'dropped': dropped,
+                    })
+
+            if arrival not in done:
+                continue
+            arrived.clear()
+            frame_id, content, received_at = waiting
+            waiting = None
+            if len(content) > config.LIVE_MAX_FRAME_KB * 1024:
+                await websocket.send_json({'frame': frame_id, 'error': "Frame too large"})
+                continue
+            try:
+                frame, motion = await asyncio.to_thread(_observe_live_frame, tracker, content)
+            except InvalidImageError:
+                await websocket.send_json({'frame': frame_id, 'error': "Invalid image file"})
+                continue
+
+            if motion['keyframe_reason'] and not tracker.keyframe_pending:
+                try:
+                    # Submitted here rather than in a task, so a saturated pool raises right away
+                    keyframe = asyncio.wrap_future(inference_pool.submit(analyze_image, frame, profile=profile))
+                    tracker.start_keyframe(frame_id)
+                except PoolSaturated:
+                    # Keep tracking; a later frame asks again
+                    pass
+            metrics.live_frames_counter.inc(kind='tracked')
+            await websocket.send_json({
+                'frame': frame_id, 'kind': 'tracked', 'detections': tracker.current(), 'motion': motion,
+                'keyframe_pending': tracker.keyframe_pending, 'dropped': dropped,
+                'latency_ms': round((time.perf_counter() - received_at) * 1000, 1),
+            })
+    except WebSocketDisconnect:
         pass
+    finally:
+        live_sessions -= 1
+        receiver.cancel()
+        if keyframe is not None:
+            # Nobody is left to send it to
+            keyframe.cancel()
 
-    return response
+
+def _observe_live_frame(tracker: LiveTracker, content: bytes):
+    frame = downscale(decode_image(content), config.LIVE_MAX_SIDE)
+    with metrics.span('live_motion'):
+        motion = tracker.observe(frame)
+    return frame, motion
+
+
+@app.post('/jobs', status_code=202)
+async def submit_job(file: UploadFile = File(...), priority: int = 0,
+                     scale_policy: str | None = None, scale_merge: str | None = None,
+                     profile: str | None = None, use_cache: bool = True):
+    """
+    Queues a scan and returns its job id right away; poll GET /jobs/{id} for progress and the result.
+    Higher priority jobs run first. Jobs are stored in jobs.db and survive restarts.
+    """
+    _validate_options(scale_policy, scale_merge, profile)
+    content = await _read_upload(file)
+    if not content:
+        raise HTTPException(status_code=400, detail="Invalid image file")
+    counts = await asyncio.to_thread(job_queue.counts)
+    if counts['queued'] >= config.JOB_MAX_QUEUED:
+        raise HTTPException(status_code=503, detail="Job queue is full. Please retry later.",
+                            headers={"Retry-After": str(config.INFERENCE_RETRY_AFTER)})
+
+    options = {'scale_policy': scale_policy, 'scale_merge': scale_merge, 'profile': profile, 'use_cache': use_cache}
+    job_id = await asyncio.to_thread(job_queue.submit, content, options, priority, file.filename)
+    job_runner.notify()
+    return {"job_id": job_id, "status": "queued", "priority": priority}
+
+
+@app.get('/jobs/{job_id}')
+def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+def _run_job(job: dict):
+    """JobRunner handler: same pipeline as /detect, run from a runner thread with tile progress."""
+    options = dict(job['options'])
+    use_cache = options.pop('use_cache', True)
+    settings = pipeline_settings(**options)
+    try:
+        img, cache_key, cached = _decode_and_lookup(job['payload'], settings, use_cache)
+    except ImageTooLargeError as e:
+        raise JobError(str(e))
+    except InvalidImageError:
+        raise JobError("Invalid image file")
+
+    if cached is not None:
+        metrics.pages_counter.inc(source='cache')
+        result = {**cached, 'timestamp': datetime.utcnow().isoformat() + 'Z', 'cached': True}
+    else:
+        while True:
+            try:
+                future = inference_pool.submit(analyze_image, img, progress=JobProgress(job['id']), **options)
+                break
+            except PoolSaturated as e:
+                # Queued jobs yield to interactive /detect traffic rather than failing
+                time.sleep(e.retry_after)
+        try:
+            detections, info = future.result()
+        except ImageTooLargeError as e:
+            raise JobError(str(e))
+        except SchedulerTimeout:
+            raise JobError("Analysis took too long")
+        metrics.record_pipeline(info)
+        result = _build_result(detections, info)
+        if use_cache:
+            _cache_put(cache_key, result, settings)
+
+    with metrics.span('persist'):
+        scan_id = save_scan(result)
+    return compact.expand(result), scan_id
+
+
+job_runner = JobRunner(job_queue, _run_job, workers=config.JOB_WORKERS)
+
+
+def _utc_iso(value: Optional[datetime]) -> Optional[str]:
+    """Formats a query datetime like the stored scan timestamps so they compare as strings."""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(timespec='microseconds') + 'Z'
 
 
 @app.get('/history')
-def history(limit: int = 50):
-    return get_history(limit)
+def history(response: Response, limit: int = 50, before_id: Optional[int] = None, fields: Optional[str] = None,
+            summary: bool = False, since: Optional[datetime] = None, until: Optional[datetime] = None,
+            min_confidence: Optional[float] = None, max_confidence: Optional[float] = None, stream: bool = False):
+    """
+    Newest scans first. Page with before_id (the X-Next-Before-Id header of the previous page),
+    project with fields=id,timestamp,... or fields=summary, filter by since/until and confidence.
+    stream=true sends the JSON array incrementally instead of building it in memory.
+    """
+    if not 1 <= limit <= config.HISTORY_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {config.HISTORY_MAX_LIMIT}")
+    if summary or fields == 'summary':
+        projection = SUMMARY_FIELDS
+    elif fields:
+        projection = tuple(f.strip() for f in fields.split(',') if f.strip())
+    else:
+        projection = ('id', 'timestamp', 'result', 'overall_confidence')
+    unknown = set(projection) - set(HISTORY_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}. Choose from: summary, {', '.join(HISTORY_FIELDS)}"
+        )
+
+    # The cursor needs ids even when the caller did not ask for them
+    query_fields = projection if 'id' in projection else ('id',) + projection
+    items = iter_history(
+        limit, fields=query_fields, before_id=before_id, since=_utc_iso(since), until=_utc_iso(until),
+        min_confidence=min_confidence, max_confidence=max_confidence,
+    )
+
+    def project(item):
+        return item if 'id' in projection else {k: v for k, v in item.items() if k != 'id'}
+
+    if stream:
+        def generate():
+            yield '['
+            for i, item in enumerate(items):
+                yield (',' if i else '') + json.dumps(project(item), ensure_ascii=False)
+            yield ']'
+        return StreamingResponse(generate(), media_type='application/json')
+
+    page = list(items)
+    if len(page) == limit:
+        response.headers['X-Next-Before-Id'] = str(page[-1]['id'])
+    return [project(item) for item in page]
+
+
+@app.get('/history/{scan_id}')
+def history_item(scan_id: int):
+    scan = get_scan(scan_id)
+    if scan is None:
+        raise HTTPException(status_code=404, detail=f"Scan {scan_id} not found")
+    return scan
+
+
+@app.get('/search')
+def search(q: str, transpose: bool = False, limit: int = 20, offset: int = 0):
+    """
+    Stored scans containing a phrase, best match first. q is the phrase as swaras
+    ('Sa Re Ga Ma Pa'), semitones ('1 3 5 6 8') or Devanagari ('स रे ग म प'); transpose=true
+    also finds it at any other pitch. Each result says where the phrase starts in its
+    numeric_sequence and by how many semitones it is shifted there.
+    """
+    if not HAS_FTS5:
+        raise HTTPException(status_code=501, detail="Search needs SQLite with FTS5")
+    if not 1 <= limit <= config.SEARCH_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {config.SEARCH_MAX_LIMIT}")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="offset must not be negative")
+    try:
+        notes = parse_phrase(q)
+        results = search_sequences(notes, transpose=transpose, limit=limit, offset=offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"query": notes, "transpose": transpose, "offset": offset, "results": results}
 
 
 if __name__ == '__main__':
@@ -0,0 +1,258 @@
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import config
+import database
+from compare_preprocess import IMAGE_SUFFIXES
+from inference.backends import DetectorBackend
+from inference.detector import load_detection_model, tile_cache
+from inference.pipeline import analyze_image, build_result, decode_image, pipeline_settings
+from mapping.swara_map import load_model_classes
+
+PERCENTILES = (50, 95, 99)
+
+
+class StubBackend(DetectorBackend):
+    """
+    Model stand-in so the pipeline can be benchmarked without weights: one box per
+    connected blob of ink in each tile, optionally sleeping `tile_ms` per tile to
+    mimic the cost of a real forward pass.
+    """
+
+    name = 'stub'
+
+    def __init__(self, tile_ms: float = 0.0, min_area: int = 12):
+        self.names = load_model_classes()
+        self.image_size = config.MODEL_INPUT_SIZE
+        self.tile_ms = tile_ms
+        self.min_area = min_area
+
+    def predict(self, tiles, batch_size=8, progress=None):
+        outputs = []
+        for i, tile in enumerate(tiles):
+            gray = cv2.cvtColor(tile, cv2.COLOR_BGR2GRAY)
+            # A fixed level, so blank paper gives no boxes (Otsu would split paper noise into blobs)
+            _, ink = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY_INV)
+            count, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+            stats = stats[1:count]
+            stats = stats[stats[:, cv2.CC_STAT_AREA] >= self.min_area]
+            det = np.zeros((len(stats), 6), dtype=np.float32)
+            det[:, 0] = stats[:, cv2.CC_STAT_LEFT]
+            det[:, 1] = stats[:, cv2.CC_STAT_TOP]
+            det[:, 2] = det[:, 0] + stats[:, cv2.CC_STAT_WIDTH]
+            det[:, 3] = det[:, 1] + stats[:, cv2.CC_STAT_HEIGHT]
+            det[:, 4] = 0.9
+            det[:, 5] = np.arange(len(stats)) % len(self.names)
+            outputs.append(det)
+            if self.tile_ms:
+                time.sleep(self.tile_ms / 1000)
+            if progress is not None and (i + 1) % batch_size == 0:
+                progress(i + 1)
+        if progress is not None:
+            progress(len(tiles))
+        return outputs
+
+
+def synthetic_page(long_side: int, seed: int = 0) -> np.ndarray:
+    """A scanned-looking notation page: rows of glyphs, a slight skew and sensor noise."""
+    rng = np.random.default_rng(seed)
+    width, height = long_side * 3 // 4, long_side
+    page = np.full((height, width, 3), 245, dtype=np.uint8)
+    scale = long_side / 1200
+    glyph = max(8, int(28 * scale))
+    for y in range(int(80 * scale), height - glyph, int(glyph * 2.6)):
+        x = int(40 * scale)
+        while x < width - 2 * glyph:
+            text = ''.join(rng.choice(list('SRGMPDN123'), size=rng.integers(1, 3)))
+            cv2.putText(page, text, (x, y + glyph), cv2.FONT_HERSHEY_SIMPLEX, glyph / 22, (20, 20, 20),
+                        max(1, int(2 * scale)), cv2.LINE_AA)
+            x += int(glyph * rng.uniform(1.8, 3.0)) * len(text)
+    rotation = cv2.getRotationMatrix2D((width / 2, height / 2), float(rng.uniform(-1.5, 1.5)), 1.0)
+    page = cv2.warpAffine(page, rotation, (width, height), borderValue=(245, 245, 245))
+    noise = rng.normal(0, 6, page.shape)
+    return np.clip(page + noise, 0, 255).astype(np.uint8)
+
+
+def load_pages(images: str, sizes, synthetic: int):
+    """(resolution, name, encoded PNG bytes) for every page at every long side."""
+    originals = []
+    if images:
+        for path in sorted(p for p in Path(images).rglob('*') if p.suffix.lower() in IMAGE_SUFFIXES):
+            img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+            if img is not None:
+                originals.append((path.name, img))
+
+    pages = []
+    for size in sizes:
+        for i in range(synthetic):
+            pages.append((size, f'synthetic-{i}', cv2.imencode('.png', synthetic_page(size, seed=i))[1].tobytes()))
+        for name, img in originals:
+            factor = size / max(img.shape[:2])
+            resized = cv2.resize(img, None, fx=factor, fy=factor,
+                                 interpolation=cv2.INTER_AREA if factor < 1 else cv2.INTER_LINEAR)
+            pages.append((size, name, cv2.imencode('.png', resized)[1].tobytes()))
+    return pages
+
+
+def run_page(content: bytes, model, args, save_scan):
+    """
+    Every stage /detect runs for one upload, with its duration in milliseconds, and the
+    highest current RSS the pipeline sampled while it ran (None where it cannot be read).
+    """
+    stages = {}
+    total = time.perf_counter()
+
+    start = time.perf_counter()
+    img = decode_image(content)
+    stages['decode'] = (time.perf_counter() - start) * 1000
+
+    detections, info = analyze_image(img, model, scale_policy=args.scale_policy, profile=args.profile)
+    stages.update({f'preprocess.{k}': v for k, v in info['timings'].items()})
+    stages.update({f'detect.{k}': v for k, v in info['detect_ms'].items()})
+
+    start = time.perf_counter()
+    result = build_result(detections, info)
+    stages['mapping'] = (time.perf_counter() - start) * 1000
+
+    if save_scan is not None:
+        start = time.perf_counter()
+        save_scan(result)
+        stages['save_scan'] = (time.perf_counter() - start) * 1000
+
+    stages['total'] = (time.perf_counter() - total) * 1000
+    return stages, (info.get('memory') or {}).get('process_rss_peak_mb')
+
+
+def summarize(samples) -> dict:
+    values = np.asarray(samples, dtype=np.float64)
+    summary = {f'p{p}': round(float(np.percentile(values, p)), 2) for p in PERCENTILES}
+    summary['mean'] = round(float(values.mean()), 2)
+    return summary
+
+
+def peak_rss_mb() -> float:
+    """Highest RSS of the whole process so far (it never goes down, so it is only reported per run)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end /detect pipeline benchmark with per-stage latencies")
+    parser.add_argument('--images', help="Directory of real notation pages (rescaled to every --sizes)")
+    parser.add_argument('--synthetic', type=int, default=3, help="Generated pages per resolution")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1200, 2400, 3600],
+                        help="Page long sides in pixels")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs of every page")
+    parser.add_argument('--warmup', type=int, default=1, help="Untimed runs before each resolution")
+    parser.add_argument('--workers', type=int, default=1, help="Pages processed concurrently (threads)")
+    parser.add_argument('--backend', default='stub', choices=['stub', 'torch', 'onnx', 'openvino'])
+    parser.add_argument('--stub-ms', type=float, default=0.0, help="Simulated model time per tile for the stub")
+    parser.add_argument('--profile', default=config.PREPROCESS_PROFILE)
+    parser.add_argument('--scale-policy', default=config.SCALE_POLICY)
+    parser.add_argument('--no-save', action='store_true', help="Skip the save_scan stage")
+    parser.add_argument('--tile-cache', type=int, default=0, metavar='ENTRIES',
+                        help="Turn the tile cache on with this many entries (repeated pages are then "
+                             "mostly served from it); off by default")
+    parser.add_argument('--json', help="Also write the report to this file")
+    args = parser.parse_args()
+
+    tile_cache.max_entries = args.tile_cache
+
+    pages = load_pages(args.images, args.sizes, args.synthetic)
+    if not pages:
+        print("No pages to benchmark")
+        sys.exit(1)
+
+    if args.backend == 'stub':
+        model = StubBackend(args.stub_ms)
+    else:
+        model = load_detection_model(args.backend)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        save_scan = None
+        if not args.no_save:
+            # Never write benchmark scans into the real history
+            database.DB_PATH = str(Path(tmp) / 'bench.db')
+            database.init_db()
+            save_scan = database.save_scan
+
+        report = {}
+        for size in args.sizes:
+            batch = [content for page_size, _, content in pages if page_size == size]
+            for content in batch[:args.warmup]:
+                run_page(content, model, args, save_scan)
+
+            work = batch * args.repeat
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+                runs = list(pool.map(lambda c: run_page(c, model, args, save_scan), work))
+            elapsed = time.perf_counter() - start
+
+            stages = {}
+            for run, _ in runs:
+                for stage, ms in run.items():
+                    stages.setdefault(stage, []).append(ms)
+            rss = [r for _, r in runs if r is not None]
+            report[str(size)] = {
+                'pages': len(work),
+                'pages_per_second': round(len(work) / elapsed, 3),
+                'stage_ms': {stage: summarize(ms) for stage, ms in stages.items()},
+                # Current RSS sampled inside the pipeline while this resolution ran
+                'sampled_rss_mb': max(rss) if rss else None,
+            }
+            total = report[str(size)]['stage_ms']['total']
+            print(f"{size:>6}px  {len(work):>4} pages  {report[str(size)]['pages_per_second']:>7.2f} pages/s  "
+                  f"p50 {total['p50']:>8.1f} ms  p95 {total['p95']:>8.1f} ms  p99 {total['p99']:>8.1f} ms")
+
+        if save_scan is not None:
+            database.stop_writer()
+
+    settings = pipeline_settings(scale_policy=args.scale_policy, profile=args.profile)
+    settings['backend'] = args.backend
+    output = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'workers': args.workers,
+            'repeat': args.repeat,
+            'stub_ms': args.stub_ms if args.backend == 'stub' else None,
+            'tile_cache': args.tile_cache,
+            'settings': settings,
+        },
+        'resolutions': report,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    print(json.dumps(output, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import copy
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from inference.post_process import PostProcessor
+
+
+class LegacyPostProcessor(PostProcessor):
+    """The original dict-based O(n^2) implementation, kept here as the reference."""
+
+    def process(self, detections):
+        filtered = [d for d in detections if not d['score'] < self.confidence_threshold]
+        if not filtered:
+            return []
+        return self._legacy_sort(self._legacy_resolve(filtered))
+
+    def _legacy_resolve(self, detections):
+        dets = sorted(detections, key=lambda x: x['score'], reverse=True)
+        keep = []
+        while dets:
+            best = dets.pop(0)
+            keep.append(best)
+            dets = [d for d in dets if self._legacy_iou(best['bbox'], d['bbox']) < self.iou_threshold]
+        return keep
+
+    @staticmethod
+    def _legacy_iou(boxA, boxB):
+        xA = max(boxA[0], boxB[0])
+        yA = max(boxA[1], boxB[1])
+        xB = min(boxA[2], boxB[2])
+        yB = min(boxA[3], boxB[3])
+        interArea = max(0, xB - xA) * max(0, yB - yA)
+        boxAArea = (boxA[2] - boxA[0]) * (boxA[3] - boxA[1])
+        boxBArea = (boxB[2] - boxB[0]) * (boxB[3] - boxB[1])
+        if boxAArea + boxBArea - interArea == 0:
+            return 0
+        return interArea / float(boxAArea + boxBArea - interArea)
+
+    @staticmethod
+    def _legacy_sort(detections):
+        for d in detections:
+            bbox = d['bbox']
+            d['cy'] = (bbox[1] + bbox[3]) / 2
+            d['h'] = bbox[3] - bbox[1]
+        dets = sorted(detections, key=lambda x: x['cy'])
+        line_threshold = np.mean([d['h'] for d in dets]) * 0.6
+        rows = []
+        current_row = [dets[0]]
+        for curr in dets[1:]:
+            if abs(curr['cy'] - current_row[-1]['cy']) < line_threshold:
+                current_row.append(curr)
+            else:
+                rows.append(sorted(current_row, key=lambda x: x['bbox'][0]))
+                current_row = [curr]
+        rows.append(sorted(current_row, key=lambda x: x['bbox'][0]))
+        return [d for row in rows for d in row]
+
+
+def synthetic_page(n: int, seed: int = 0):
+    """
+    Notation-like layout: glyphs on lines, each seen about twice (two slice scales)
+    with jittered duplicates, plus a few low-confidence specks.
+    """
+    rng = np.random.default_rng(seed)
+    unique = max(1, n // 2)
+    per_line = 24
+    idx = np.arange(unique)
+    x1 = 40 + (idx % per_line) * 70 + rng.integers(-6, 6, unique)
+    y1 = 60 + (idx // per_line) * 90 + rng.integers(-8, 8, unique)
+    w = rng.integers(30, 50, unique)
+    h = rng.integers(35, 55, unique)
+
+    detections = []
+    for i in range(n):
+        j = i % unique
+        jitter = rng.integers(-4, 5, 4) if i >= unique else np.zeros(4, dtype=int)
+        box = [int(x1[j] + jitter[0]), int(y1[j] + jitter[1]), int(x1[j] + w[j] + jitter[2]), int(y1[j] + h[j] + jitter[3])]
+        detections.append({'label': f"c{rng.integers(0, 26)}", 'score': float(rng.uniform(0.05, 0.99)), 'bbox': box})
+    return detections
+
+
+def bench(processor, detections, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        dets = copy.deepcopy(detections)
+        start = time.perf_counter()
+        processor.process(dets)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PostProcessor micro-benchmark (vectorized vs legacy)")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--legacy-repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    legacy = LegacyPostProcessor(confidence_threshold=0.15, iou_threshold=0.5)
+    vectorized = PostProcessor(confidence_threshold=0.15, iou_threshold=0.5)
+
+    print(f"{'boxes':>8} {'legacy ms':>12} {'vectorized ms':>14} {'speedup':>8}  identical")
+    for n in args.sizes:
+        detections = synthetic_page(n)
+        identical = legacy.process(copy.deepcopy(detections)) == vectorized.process(copy.deepcopy(detections))
+        t_legacy = bench(legacy, detections, args.legacy_repeat)
+        t_vector = bench(vectorized, detections, args.repeat)
+        print(f"{n:>8} {t_legacy * 1000:>12.2f} {t_vector * 1000:>14.2f} {t_legacy / t_vector:>7.1f}x  {identical}")
+        if not identical:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import config
+from bench_pipeline import StubBackend, load_pages
+from compare_preprocess import match_detections
+from inference.detector import load_detection_model, tile_cache
+from inference.pipeline import analyze_image, decode_image
+
+
+def run(img, model, ratio: float, profile: str):
+    config.SKIP_INK_RATIO = ratio
+    detections, info = analyze_image(img, model, profile=profile)
+    detect_ms = sum(ms for stage, ms in info['detect_ms'].items() if stage.startswith(('infer@', 'skip_blank')))
+    return detections, info['counts'], detect_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall of blank-tile skipping against full sliced inference")
+    parser.add_argument('--images', help="Directory of real notation pages")
+    parser.add_argument('--synthetic', type=int, default=3, help="Generated pages per resolution")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1600])
+    parser.add_argument('--ratios', type=float, nargs='+', default=[0.0002, 0.0005, 0.001, 0.002, 0.005])
+    parser.add_argument('--backend', default='torch', choices=['stub', 'torch', 'onnx', 'openvino'])
+    parser.add_argument('--stub-ms', type=float, default=20.0, help="Simulated model time per tile for the stub")
+    parser.add_argument('--profile', default=config.PREPROCESS_PROFILE)
+    parser.add_argument('--iou', type=float, default=0.5)
+    parser.add_argument('--min-recall', type=float, default=None,
+                        help="Exit with status 1 if the configured SKIP_INK_RATIO falls below this recall")
+    parser.add_argument('--json', help="Also write the report to this file")
+    args = parser.parse_args()
+
+    pages = load_pages(args.images, args.sizes, args.synthetic)
+    if not pages:
+        print("No pages to check")
+        sys.exit(1)
+
+    # Every run must reach the model; reused tiles would hide what skipping changes
+    tile_cache.max_entries = 0
+    model = StubBackend(args.stub_ms) if args.backend == 'stub' else load_detection_model(args.backend)
+    configured = config.SKIP_INK_RATIO
+    ratios = sorted(set(args.ratios) | ({configured} if configured > 0 else set()))
+    totals = {r: {'matched': 0, 'detections': 0, 'reference': 0, 'tiles': 0, 'skipped': 0, 'ms': 0.0}
+              for r in [0.0] + ratios}
+
+    for size, name, content in pages:
+        img = decode_image(content)
+        reference, counts, ms = run(img, model, 0.0, args.profile)
+        totals[0.0]['tiles'] += counts['tiles']
+        totals[0.0]['ms'] += ms
+        for ratio in ratios:
+            detections, counts, ms = run(img, model, ratio, args.profile)
+            t = totals[ratio]
+            t['matched'] += match_detections(reference, detections, args.iou)
+            t['detections'] += len(detections)
+            t['reference'] += len(reference)
+            t['tiles'] += counts['tiles']
+            t['skipped'] += counts['tiles_skipped']
+            t['ms'] += ms
+        print(f"{name} @ {size}px: {len(reference)} detections")
+    config.SKIP_INK_RATIO = configured
+
+    full_ms = totals[0.0]['ms']
+    report = {}
+    for ratio in ratios:
+        t = totals[ratio]
+        report[str(ratio)] = {
+            'skip_ratio': round(t['skipped'] / t['tiles'], 4) if t['tiles'] else 0.0,
+            'recall_vs_full': round(t['matched'] / t['reference'], 4) if t['reference'] else 1.0,
+            'precision_vs_full': round(t['matched'] / t['detections'], 4) if t['detections'] else 1.0,
+            'detect_ms': round(t['ms'], 1),
+            'speedup': round(full_ms / t['ms'], 2) if t['ms'] else None,
+        }
+    output = {'pages': len(pages), 'configured_ratio': configured, 'full_detect_ms': round(full_ms, 1),
+              'ratios': report}
+    print(json.dumps(output, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+
+    if args.min_recall is not None and configured > 0:
+        recall = report[str(configured)]['recall_vs_full']
+        if recall < args.min_recall:
+            print(f"Recall {recall} at SKIP_INK_RATIO={configured} is below {args.min_recall}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from inference.slicing import nmm
+
+
+def random_predictions(rng, count: int, classes: int, page: int):
+    """Clusters of overlapping boxes, the way neighbouring tiles report the same glyph."""
+    centers = rng.uniform(0, page, size=(max(1, count // 4), 2))
+    picked = centers[rng.integers(0, len(centers), size=count)] + rng.normal(0, 6, size=(count, 2))
+    sizes = rng.uniform(8, 30, size=(count, 2))
+    picked = np.clip(picked, 0, None)
+    boxes = np.concatenate([picked, picked + sizes], axis=1).round().astype(np.float32)
+    # Coarse scores, so equal scores (and their tie-breaking) come up too
+    scores = rng.integers(1, 20, size=count).astype(np.float32) / 20
+    class_ids = rng.integers(0, classes, size=count).astype(np.int64)
+    return boxes, scores, class_ids
+
+
+def sahi_nmm(boxes, scores, class_ids, threshold: float, class_agnostic: bool):
+    from sahi.postprocess.combine import NMMPostprocess
+    from sahi.prediction import ObjectPrediction
+
+    predictions = [
+        ObjectPrediction(bbox=box.tolist(), category_id=int(c), category_name=str(c), score=float(s))
+        for box, s, c in zip(boxes, scores, class_ids)
+    ]
+    merged = NMMPostprocess(match_threshold=threshold, match_metric='IOS', class_agnostic=class_agnostic)(predictions)
+    return [(tuple(p.bbox.to_xyxy()), p.score.value, p.category.id) for p in merged]
+
+
+def as_set(rows):
+    return sorted((tuple(round(float(v), 2) for v in box), round(float(s), 4), int(c)) for box, s, c in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare inference.slicing.nmm with SAHI's NMMPostprocess")
+    parser.add_argument('--trials', type=int, default=200)
+    parser.add_argument('--boxes', type=int, default=40, help="Predictions per trial")
+    parser.add_argument('--classes', type=int, default=2)
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--class-agnostic', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    try:
+        import sahi  # noqa: F401
+    except ImportError:
+        print("This check needs the 'sahi' package")
+        sys.exit(1)
+
+    rng = np.random.default_rng(args.seed)
+    mismatches = 0
+    for trial in range(args.trials):
+        boxes, scores, class_ids = random_predictions(rng, args.boxes, args.classes, page=200)
+        ours = nmm(boxes, scores, class_ids, match_threshold=args.threshold, class_agnostic=args.class_agnostic)
+        expected = as_set(sahi_nmm(boxes, scores, class_ids, args.threshold, args.class_agnostic))
+        got = as_set(zip(*ours))
+        if got != expected:
+            mismatches += 1
+            if mismatches <= 3:
+                print(f"Trial {trial}: {len(got)} merged boxes, SAHI {len(expected)}")
+                print(f"  only ours: {[r for r in got if r not in expected][:5]}")
+                print(f"  only SAHI: {[r for r in expected if r not in got][:5]}")
+
+    print(f"{args.trials - mismatches}/{args.trials} trials match SAHI's NMMPostprocess")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import base64
+import importlib.util
+import json
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from mapping.swara_map import get_swara_details, label_table
+
+# Columnar /detect result. Each distinct label is listed once with its swara details; every
+# detection is an index into that list (label_ids), a score and four box coordinates (bboxes,
+# flat x1, y1, x2, y2 per detection). This is the form the pipeline builds, the result cache
+# and the scan writer store, and the compact response formats send.
+FORMAT = 'swaralipi.compact/1'
+COLUMN_FIELDS = ('format', 'labels', 'label_info', 'label_ids', 'scores', 'bboxes')
+
+JSON_TYPE = 'application/json'
+COMPACT_JSON_TYPE = 'application/vnd.swaralipi.compact+json'
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+
+# Optional: MessagePack responses need the 'msgpack' package
+HAS_MSGPACK = importlib.util.find_spec('msgpack') is not None
+
+# Result fields besides the detection columns, in DetectResponse order
+_RESULT_FIELDS = ('numeric_sequence', 'overall_confidence', 'timestamp', 'model_info', 'scales_used',
+                  'preprocess_profile', 'preprocess_ms', 'page_memory', 'tile_stats', 'cached')
+
+_INT16 = np.iinfo(np.int16)
+
+
+def columns(detections: List[Dict], names: Dict[int, str] = None) -> Dict:
+    """
+    Detection columns, numeric_sequence and overall_confidence of pipeline detections.
+    `names` (the model's class names) lets labels resolve through its LabelTable by class id.
+    """
+    table = label_table(names) if names else None
+    index = {}
+    labels, label_info = [], []
+    label_ids, scores, bboxes, numeric_sequence = [], [], [], []
+    for d in detections:
+        label = d['label']
+        i = index.get(label)
+        if i is None:
+            class_id = d.get('class_id')
+            details = table[class_id] if table is not None and class_id is not None else get_swara_details(label)
+            i = index[label] = len(labels)
+            labels.append(label)
+            label_info.append({
+                'english_name': details['english'],
+                'symbol': details['symbol'],
+                'numeric': details['numeric'],
+                'octave': details['octave'],
+            })
+        label_ids.append(i)
+        scores.append(float(d['score']))
+        bboxes.extend(d['bbox'])
+        numeric = label_info[i]['numeric']
+        if numeric != -1:
+            numeric_sequence.append(numeric)
+    return {
+        'format': FORMAT,
+        'labels': labels,
+        'label_info': label_info,
+        'label_ids': label_ids,
+        'scores': scores,
+        'bboxes': bboxes,
+        'numeric_sequence': numeric_sequence,
+        'overall_confidence': float(sum(scores) / len(scores)) if scores else 0.0,
+    }
+
+
+def expand(result: Dict) -> Dict:
+    """The DetectResponse dict of a columnar result (one dict per detection, labels repeated)."""
+    labels, label_info, bboxes = result['labels'], result['label_info'], result['bboxes']
+    detections = []
+    for n, (i, score) in enumerate(zip(result['label_ids'], result['scores'])):
+        details = label_info[i]
+        detections.append({
+            'label': labels[i],
+            'english_name': details['english_name'],
+            'symbol': details['symbol'],
+            'score': score,
+            'bbox': bboxes[4 * n:4 * n + 4],
+            'numeric': details['numeric'],
+            'octave': details['octave'],
+        })
+    expanded = {'detections': detections, 'ordered_labels': [labels[i] for i in result['label_ids']]}
+    for field in _RESULT_FIELDS:
+        expanded[field] = result.get(field)
+    expanded['cached'] = bool(expanded['cached'])
+    return expanded
+
+
+def pack(result: Dict) -> Dict:
+    """
+    Wire form of a columnar result: scores as little-endian float32 bytes and boxes as
+    little-endian int16 bytes (int32 when a coordinate does not fit; see bbox_dtype).
+    """
+    boxes = np.asarray(result['bboxes'], dtype=np.int64)
+    fits = boxes.size == 0 or (boxes.min() >= _INT16.min and boxes.max() <= _INT16.max)
+    packed = dict(result)
+    packed['scores'] = np.asarray(result['scores'], dtype='<f4').tobytes()
+    packed['bboxes'] = boxes.astype('<i2' if fits else '<i4').tobytes()
+    packed['bbox_dtype'] = 'int16' if fits else 'int32'
+    return packed
+
+
+def unpack(packed: Dict) -> Dict:
+    """Inverse of pack (scores come back as float32 values)."""
+    result = dict(packed)
+    bbox_dtype = result.pop('bbox_dtype', 'int16')
+    result['scores'] = np.frombuffer(packed['scores'], dtype='<f4').tolist()
+    result['bboxes'] = np.frombuffer(packed['bboxes'], dtype='<i2' if bbox_dtype == 'int16' else '<i4').tolist()
+    return result
+
+
+def encode(result: Dict, media_type: str) -> bytes:
+    """A columnar result as compact JSON (packed arrays base64-encoded) or MessagePack (raw bytes)."""
+    packed = pack(result)
+    if media_type in MSGPACK_TYPES:
+        import msgpack
+        return msgpack.packb(packed, use_bin_type=True)
+    packed['scores'] = base64.b64encode(packed['scores']).decode('ascii')
+    packed['bboxes'] = base64.b64encode(packed['bboxes']).decode('ascii')
+    return json.dumps(packed, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def decode(body: bytes, media_type: str) -> Dict:
+    """Columnar result of an encoded response body (for clients and scripts)."""
+    if media_type in MSGPACK_TYPES:
+        import msgpack
+        return unpack(msgpack.unpackb(body, raw=False))
+    packed = json.loads(body)
+    packed['scores'] = base64.b64decode(packed['scores'])
+    packed['bboxes'] = base64.b64decode(packed['bboxes'])
+    return unpack(packed)
+
+
+def negotiate(accept: Optional[str]) -> Optional[str]:
+    """
+    Media type to answer an Accept header with: JSON_TYPE (also for wildcards and no header),
+    COMPACT_JSON_TYPE or a MessagePack type. Highest q wins, the earlier entry on a tie.
+    None when the client accepts nothing we can produce.
+    """
+    if not accept:
+        return JSON_TYPE
+    offered = {JSON_TYPE, COMPACT_JSON_TYPE, *(MSGPACK_TYPES if HAS_MSGPACK else ())}
+    best, best_q = None, 0.0
+    for entry in accept.split(','):
+        media_type, *params = [part.strip() for part in entry.split(';')]
+        media_type = media_type.lower()
+        q = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media_type in ('*/*', 'application/*'):
+            media_type = JSON_TYPE
+        if media_type in offered and q > best_q:
+            best, best_q = media_type, q
+    return best
@@ -0,0 +1,117 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from compare_preprocess import IMAGE_SUFFIXES, match_detections
+from inference.backends import OnnxBackend, OpenVinoBackend
+from inference.detector import MODEL_PATH, TorchBackend
+from inference.pipeline import analyze_image
+
+
+def load_backend(name: str, args):
+    if name == 'torch':
+        return TorchBackend(str(MODEL_PATH))
+    if name == 'onnx':
+        return OnnxBackend(args.onnx, intra_op_threads=args.threads)
+    if name == 'onnx-int8':
+        return OnnxBackend(args.onnx_int8, intra_op_threads=args.threads)
+    if name == 'openvino':
+        return OpenVinoBackend(args.openvino, intra_op_threads=args.threads)
+    raise ValueError(f"Unknown backend: {name}")
+
+
+class TimedBackend:
+    """Wraps a backend to record the time spent inside predict() (the model-only share of a page)."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.names = backend.names
+        self.image_size = backend.image_size
+        self.seconds = 0.0
+
+    def predict(self, tiles, batch_size=8, progress=None):
+        start = time.perf_counter()
+        try:
+            return self.backend.predict(tiles, batch_size, progress)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy / latency of inference backends against the PyTorch path")
+    parser.add_argument('images', help="Directory of sample notation pages")
+    parser.add_argument('--backends', nargs='+', default=['onnx', 'onnx-int8'],
+                        choices=['onnx', 'onnx-int8', 'openvino'])
+    parser.add_argument('--onnx', default=str(MODEL_PATH.with_suffix('.onnx')))
+    parser.add_argument('--onnx-int8', default=str(MODEL_PATH.with_name(MODEL_PATH.stem + '.int8.onnx')))
+    parser.add_argument('--openvino', default=str(MODEL_PATH.with_suffix('.onnx')),
+                        help="OpenVINO model (.xml IR or .onnx)")
+    parser.add_argument('--threads', type=int, default=0, help="Intra-op threads for ONNX Runtime / OpenVINO")
+    parser.add_argument('--profile', default='quality')
+    parser.add_argument('--iou', type=float, default=0.5)
+    parser.add_argument('--json', help="Also write the report to this file")
+    args = parser.parse_args()
+
+    paths = sorted(p for p in Path(args.images).rglob('*') if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not paths:
+        print(f"No images found in {args.images}")
+        sys.exit(1)
+
+    names = ['torch'] + args.backends
+    backends = {name: TimedBackend(load_backend(name, args)) for name in names}
+    totals = {name: {'matched': 0, 'detections': 0, 'reference': 0, 'page_s': [], 'model_s': []} for name in names}
+
+    for path in paths:
+        img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+        if img is None:
+            print(f"Skipping unreadable {path}")
+            continue
+
+        reference = None
+        for name, backend in backends.items():
+            backend.seconds = 0.0
+            start = time.perf_counter()
+            detections, _ = analyze_image(img, model=backend, profile=args.profile)
+            t = totals[name]
+            t['page_s'].append(time.perf_counter() - start)
+            t['model_s'].append(backend.seconds)
+            if reference is None:
+                reference = detections
+            t['detections'] += len(detections)
+            t['reference'] += len(reference)
+            t['matched'] += match_detections(reference, detections, args.iou)
+        print(f"{path.name}: " + ", ".join(f"{n}={totals[n]['model_s'][-1] * 1000:.0f}ms" for n in names))
+
+    report = {}
+    for name, t in totals.items():
+        precision = t['matched'] / t['detections'] if t['detections'] else 1.0
+        recall = t['matched'] / t['reference'] if t['reference'] else 1.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        model_ms = np.array(t['model_s']) * 1000
+        report[name] = {
+            'pages': len(t['page_s']),
+            'precision_vs_torch': round(precision, 4),
+            'recall_vs_torch': round(recall, 4),
+            'f1_vs_torch': round(f1, 4),
+            'model_ms_mean': round(float(model_ms.mean()), 1),
+            'model_ms_p95': round(float(np.percentile(model_ms, 95)), 1),
+            'page_ms_mean': round(float(np.mean(t['page_s']) * 1000), 1),
+            'speedup_vs_torch': round(float(np.sum(totals['torch']['model_s']) / np.sum(t['model_s'])), 2),
+        }
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from inference.pipeline import analyze_image
+from inference.preprocess import PREPROCESS_PROFILES
+
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+
+def match_detections(reference, candidate, iou_threshold: float = 0.5):
+    """Greedy one-to-one matching on label + IoU. Returns the number of matched pairs."""
+    used = set()
+    matched = 0
+    for ref in reference:
+        best, best_iou = None, iou_threshold
+        for j, cand in enumerate(candidate):
+            if j in used or cand['label'] != ref['label']:
+                continue
+            iou = box_iou(ref['bbox'], cand['bbox'])
+            if iou >= best_iou:
+                best, best_iou = j, iou
+        if best is not None:
+            used.add(best)
+            matched += 1
+    return matched
+
+
+def box_iou(a, b):
+    iw = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    ih = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = iw * ih
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare preprocessing profiles against the 'quality' pipeline")
+    parser.add_argument('images', help="Directory of sample notation pages")
+    parser.add_argument('--profiles', nargs='+', default=[p for p in PREPROCESS_PROFILES if p != 'quality'])
+    parser.add_argument('--iou', type=float, default=0.5)
+    parser.add_argument('--json', help="Also write the report to this file")
+    args = parser.parse_args()
+
+    paths = sorted(p for p in Path(args.images).rglob('*') if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not paths:
+        print(f"No images found in {args.images}")
+        sys.exit(1)
+
+    profiles = ['quality'] + [p for p in args.profiles if p != 'quality']
+    totals = {p: {'matched': 0, 'detections': 0, 'reference': 0, 'stage_ms': {}, 'pages': 0} for p in profiles}
+
+    for path in paths:
+        img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+        if img is None:
+            print(f"Skipping unreadable {path}")
+            continue
+
+        reference = None
+        for profile in profiles:
+            detections, info = analyze_image(img, profile=profile)
+            if reference is None:
+                reference = detections
+            t = totals[profile]
+            t['pages'] += 1
+            t['detections'] += len(detections)
+            t['reference'] += len(reference)
+            t['matched'] += match_detections(reference, detections, args.iou)
+            for stage, ms in info['timings'].items():
+                t['stage_ms'].setdefault(stage, []).append(ms)
+        print(f"{path.name}: " + ", ".join(f"{p}={totals[p]['detections']}" for p in profiles))
+
+    report = {}
+    for profile, t in totals.items():
+        precision = t['matched'] / t['detections'] if t['detections'] else 1.0
+        recall = t['matched'] / t['reference'] if t['reference'] else 1.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        stages = {stage: round(float(np.mean(ms)), 2) for stage, ms in t['stage_ms'].items()}
+        report[profile] = {
+            'pages': t['pages'],
+            'precision_vs_quality': round(precision, 4),
+            'recall_vs_quality': round(recall, 4),
+            'f1_vs_quality': round(f1, 4),
+            'mean_stage_ms': stages,
+            'mean_preprocess_ms': round(sum(stages.values()), 2),
+        }
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
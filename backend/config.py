@@ -0,0 +1,120 @@
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_str(name: str, default: str) -> str:
+    value = os.environ.get(name)
+    return value if value not in (None, '') else default
+
+
+# Inference worker pool
+# 'thread' workers share the process (torch releases the GIL during the forward pass),
+# 'process' workers each get their own interpreter; both share one copy of the weights
+# (process workers fork after loading) except ONNX/OpenVINO process workers, which load their own.
+INFERENCE_WORKERS = _env_int('SWARALIPI_INFERENCE_WORKERS', 2)
+INFERENCE_WORKER_MODE = _env_str('SWARALIPI_INFERENCE_WORKER_MODE', 'thread')
+# Requests allowed to wait for a free worker before /detect answers 503
+INFERENCE_QUEUE_SIZE = _env_int('SWARALIPI_INFERENCE_QUEUE_SIZE', 8)
+# Lower bound for the Retry-After header sent with a 503
+INFERENCE_RETRY_AFTER = _env_int('SWARALIPI_INFERENCE_RETRY_AFTER', 2)
+# Shared secret for the /admin endpoints (model hot-swap), sent as X-Admin-Token; empty disables them
+ADMIN_TOKEN = _env_str('SWARALIPI_ADMIN_TOKEN', '')
+
+# Detection backend: 'torch' (brain.pt via Ultralytics), 'onnx' (ONNX Runtime) or 'openvino'.
+# The exported backends load models/brain.onnx, or brain.int8.onnx with precision 'int8'
+# (see export_model.py), unless SWARALIPI_EXPORTED_MODEL_PATH points elsewhere.
+INFERENCE_BACKEND = _env_str('SWARALIPI_INFERENCE_BACKEND', 'torch')
+INFERENCE_PRECISION = _env_str('SWARALIPI_INFERENCE_PRECISION', 'fp32')
+EXPORTED_MODEL_PATH = _env_str('SWARALIPI_EXPORTED_MODEL_PATH', '')
+# Intra-op threads per ONNX Runtime / OpenVINO model (0 = runtime default, or cores / workers in process mode)
+INTRA_OP_THREADS = _env_int('SWARALIPI_INTRA_OP_THREADS', 0)
+
+# Default preprocessing profile: 'quality', 'balanced' or 'fast' (overridable per /detect request)
+PREPROCESS_PROFILE = _env_str('SWARALIPI_PREPROCESS_PROFILE', 'quality')
+
+# Large scans. Uploads above MAX_UPLOAD_MB and pages above MAX_IMAGE_PIXELS are refused (413);
+# pages above DOWNSCALE_MAX_PIXELS are analysed downscaled, with boxes mapped back to the upload (0 disables)
+MAX_UPLOAD_MB = _env_int('SWARALIPI_MAX_UPLOAD_MB', 50)
+MAX_IMAGE_PIXELS = _env_int('SWARALIPI_MAX_IMAGE_PIXELS', 150_000_000)
+DOWNSCALE_MAX_PIXELS = _env_int('SWARALIPI_DOWNSCALE_MAX_PIXELS', 24_000_000)
+# Estimated working memory allowed per page; larger pages are preprocessed and detected in
+# horizontal strips of at most STRIP_HEIGHT rows that overlap by STRIP_OVERLAP
+MAX_PAGE_MEMORY_MB = _env_int('SWARALIPI_MAX_PAGE_MEMORY_MB', 512)
+STRIP_HEIGHT = _env_int('SWARALIPI_STRIP_HEIGHT', 2048)
+STRIP_OVERLAP = _env_int('SWARALIPI_STRIP_OVERLAP', 256)
+
+# Tile-level cache of detector outputs per worker, so re-uploads of an edited, cropped or shifted
+# page only re-infer the tiles whose pixels changed (0 disables). Off by default: while it is on,
+# the slice grid is anchored to the ink bounding box instead of the page origin, which changes the
+# tiling (and so the detections) of every page. INK_THRESHOLD is the grey level below which a pixel
+# counts as ink.
+TILE_CACHE_ENTRIES = _env_int('SWARALIPI_TILE_CACHE_ENTRIES', 0)
+INK_THRESHOLD = _env_int('SWARALIPI_INK_THRESHOLD', 128)
+# Tiles whose share of ink pixels is below this ratio are not sent to the model (0 disables);
+# check_blank_skip.py measures what a threshold costs in recall
+SKIP_INK_RATIO = float(_env_str('SWARALIPI_SKIP_INK_RATIO', '0.0005'))
+
+# Live camera mode (/live WebSocket). Frames are capped at LIVE_MAX_SIDE pixels and LIVE_MAX_FRAME_KB;
+# the detector runs on keyframes only, requested when the phase-correlation response between frames
+# drops below LIVE_MIN_MOTION_RESPONSE (scene change), when the tracked boxes have moved more than
+# LIVE_MAX_DRIFT of the frame, or every LIVE_KEYFRAME_INTERVAL_S seconds
+LIVE_MAX_SIDE = _env_int('SWARALIPI_LIVE_MAX_SIDE', 960)
+LIVE_MAX_FRAME_KB = _env_int('SWARALIPI_LIVE_MAX_FRAME_KB', 1024)
+LIVE_PROFILE = _env_str('SWARALIPI_LIVE_PROFILE', 'fast')
+LIVE_KEYFRAME_INTERVAL_S = float(_env_str('SWARALIPI_LIVE_KEYFRAME_INTERVAL_S', '3'))
+LIVE_MIN_MOTION_RESPONSE = float(_env_str('SWARALIPI_LIVE_MIN_MOTION_RESPONSE', '0.2'))
+LIVE_MAX_DRIFT = float(_env_str('SWARALIPI_LIVE_MAX_DRIFT', '0.25'))
+
+# Sliced inference
+SLICE_SCALES = [int(s) for s in _env_str('SWARALIPI_SLICE_SCALES', '400,600').split(',')]
+SLICE_OVERLAP = float(_env_str('SWARALIPI_SLICE_OVERLAP', '0.3'))
+# Default scale policy / cross-scale merge (both can be overridden per /detect request)
+SCALE_POLICY = _env_str('SWARALIPI_SCALE_POLICY', 'fixed')
+SCALE_MERGE = _env_str('SWARALIPI_SCALE_MERGE', 'concat')
+# Adaptive policies pick the scale that resizes glyphs closest to this height at the model input,
+# keeping any other scale within this ratio of the best match
+ADAPTIVE_GLYPH_TARGET_PX = float(_env_str('SWARALIPI_ADAPTIVE_GLYPH_TARGET_PX', '64'))
+ADAPTIVE_SCALE_BAND = float(_env_str('SWARALIPI_ADAPTIVE_SCALE_BAND', '1.15'))
+MODEL_INPUT_SIZE = _env_int('SWARALIPI_MODEL_INPUT_SIZE', 640)
+# Tiles sent to the YOLO model per forward pass
+TILE_BATCH_SIZE = _env_int('SWARALIPI_TILE_BATCH_SIZE', 8)
+
+# Cross-request micro-batching: workers hand their tiles to one shared scheduler
+# instead of calling their own model
+MICRO_BATCHING = _env_str('SWARALIPI_MICRO_BATCHING', '0') == '1'
+SCHEDULER_MAX_BATCH_SIZE = _env_int('SWARALIPI_SCHEDULER_MAX_BATCH_SIZE', 16)
+SCHEDULER_MAX_WAIT_MS = float(_env_str('SWARALIPI_SCHEDULER_MAX_WAIT_MS', '10'))
+# End-to-end limit for one request's tiles, after which /detect answers 504
+SCHEDULER_MAX_LATENCY_MS = float(_env_str('SWARALIPI_SCHEDULER_MAX_LATENCY_MS', '30000'))
+
+# /detect result cache (in-memory LRU in front of a table in scans.db)
+CACHE_MAX_ENTRIES = _env_int('SWARALIPI_CACHE_MAX_ENTRIES', 256)
+CACHE_MAX_DISK_ENTRIES = _env_int('SWARALIPI_CACHE_MAX_DISK_ENTRIES', 10000)
+CACHE_TTL_SECONDS = _env_int('SWARALIPI_CACHE_TTL_SECONDS', 7 * 24 * 3600)
+CACHE_PERSISTENT = _env_str('SWARALIPI_CACHE_PERSISTENT', '1') == '1'
+
+# Responses at least this large are gzip-compressed for clients that accept it (0 disables)
+GZIP_MIN_SIZE = _env_int('SWARALIPI_GZIP_MIN_SIZE', 1024)
+# Per-stage durations in a Server-Timing header on /detect responses (always recorded for /metrics)
+SERVER_TIMING = _env_str('SWARALIPI_SERVER_TIMING', '0') == '1'
+# Upper bound for /history?limit=
+HISTORY_MAX_LIMIT = _env_int('SWARALIPI_HISTORY_MAX_LIMIT', 500)
+# Upper bound for /search?limit=
+SEARCH_MAX_LIMIT = _env_int('SWARALIPI_SEARCH_MAX_LIMIT', 100)
+
+# /detect_batch: pages of one batch analysed at once, and the most pages one batch may expand to
+BATCH_CONCURRENCY = _env_int('SWARALIPI_BATCH_CONCURRENCY', INFERENCE_WORKERS)
+BATCH_MAX_PAGES = _env_int('SWARALIPI_BATCH_MAX_PAGES', 500)
+
+# /jobs: background runners pulling from the persistent queue in jobs.db
+JOB_WORKERS = _env_int('SWARALIPI_JOB_WORKERS', 1)
+JOB_MAX_QUEUED = _env_int('SWARALIPI_JOB_MAX_QUEUED', 1000)
+JOB_RETENTION_SECONDS = _env_int('SWARALIPI_JOB_RETENTION_SECONDS', 7 * 24 * 3600)
+# A job claimed this many times without finishing (its process died each time) fails instead of running again
+JOB_MAX_ATTEMPTS = _env_int('SWARALIPI_JOB_MAX_ATTEMPTS', 3)
+# Seconds a claimed job stays leased to its process without a renewal; expired leases are reclaimed
+JOB_LEASE_SECONDS = _env_int('SWARALIPI_JOB_LEASE_SECONDS', 60)
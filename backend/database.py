@@ -1,13 +1,99 @@
 import sqlite3
 import json
+import logging
 import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
 from datetime import datetime
 
+from compact import COLUMN_FIELDS
+
+logger = logging.getLogger(__name__)
+
 DB_PATH = os.path.join(os.path.dirname(__file__), 'scans.db')
+
+# Group commit: the writer waits this long for more inserts before committing a batch
+WRITE_BATCH_SIZE = 64
+WRITE_BATCH_WAIT = 0.02
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def get_connection() -> sqlite3.Connection:
+    """Per-thread connection, opened once and reused for every later call on that thread."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        init_db()
+        conn = _connect()
+        _local.conn = conn
+    return conn
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    # WAL lets /history read while the writer commits; NORMAL only fsyncs at checkpoints
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    # Off by default in SQLite; without it deleting a scan would leave its detections behind
+    conn.execute('PRAGMA foreign_keys=ON')
+    return conn
+
+
+SCHEMA_VERSION = 3
+
+# Notes (and steps between notes) per token of the sequence index
+SEQUENCE_NGRAM = 3
+
+# Response fields stored as scans columns / detections rows; anything else goes to extra_json
+_SCAN_FIELDS = ('detections', 'ordered_labels', 'numeric_sequence', 'overall_confidence', 'model_info')
+_OPTIONAL_DETECTION_FIELDS = ('english_name', 'symbol', 'numeric', 'octave')
+_SCAN_COLUMNS = {
+    'model_info': 'TEXT',
+    'num_detections': 'INTEGER',
+    'numeric_sequence': 'TEXT',
+    'extra_json': 'TEXT',
+}
+
+
+def _fts5_available() -> bool:
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute('CREATE VIRTUAL TABLE probe USING fts5(x)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+# SQLite builds without FTS5 still store and list scans; only /search is then unavailable
+HAS_FTS5 = _fts5_available()
+
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(
+    """Creates (or migrates) the schema once per process; later calls are free."""
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        conn = _connect()
+        try:
+            with conn:
+                _create_schema(conn)
+                migrate(conn)
+        finally:
+            conn.close()
+        _initialized = True
+
+
+def _create_schema(conn: sqlite3.Connection):
+    conn.execute(
         '''
         CREATE TABLE IF NOT EXISTS scans (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -17,35 +103,497 @@ def init_db():
         )
         '''
     )
-    conn.commit()
-    conn.close()
+    # Columns added in schema v2 (older databases get them through ALTER TABLE)
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(scans)')}
+    for column, kind in _SCAN_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f'ALTER TABLE scans ADD COLUMN {column} {kind}')
 
-def save_scan(result: dict) -> int:
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS detections (
+            id INTEGER PRIMARY KEY,
+            scan_id INTEGER NOT NULL REFERENCES scans(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            label TEXT,
+            english_name TEXT,
+            symbol TEXT,
+            numeric INTEGER,
+            octave TEXT,
+            score REAL,
+            x1 INTEGER,
+            y1 INTEGER,
+            x2 INTEGER,
+            y2 INTEGER
+        )
+        '''
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_scans_timestamp ON scans(timestamp)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_scans_confidence ON scans(overall_confidence)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_detections_scan ON detections(scan_id, position)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_detections_label ON detections(label)')
+
+    if HAS_FTS5:
+        # Schema v3: phrase index over numeric_sequence, one row per scan (rowid = scans.id).
+        # Contentless, so it stores only the posting lists; the sequence itself stays in scans
+        conn.execute(
+            '''
+            CREATE VIRTUAL TABLE IF NOT EXISTS scan_sequences
+            USING fts5(pitches, intervals, content='')
+            '''
+        )
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Converts v1 rows (whole response in result_json) into scans columns + detections rows,
+    and fills the v3 sequence index for scans stored before it existed.
+    Runs inside the caller's transaction; returns the number of scans converted.
+    """
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    # Without FTS5 the index cannot exist; stay at v2 so it is built once SQLite supports it
+    target = SCHEMA_VERSION if HAS_FTS5 else 2
+    if version >= target:
+        return 0
+
+    converted = 0
+    rows = conn.execute('SELECT id, result_json FROM scans WHERE result_json IS NOT NULL').fetchall()
+    for scan_id, result_json in rows:
+        try:
+            result = json.loads(result_json)
+        except ValueError:
+            logger.warning(f"Scan {scan_id} has unreadable result_json; left as is")
+            continue
+        scan_values, detection_rows = _prepare_scan(result)
+        conn.execute(
+            '''
+            UPDATE scans SET model_info = ?, num_detections = ?, numeric_sequence = ?, extra_json = ?,
+                             result_json = NULL
+            WHERE id = ?
+            ''',
+            (scan_values['model_info'], scan_values['num_detections'], scan_values['numeric_sequence'],
+             scan_values['extra_json'], scan_id)
+        )
+        conn.execute('DELETE FROM detections WHERE scan_id = ?', (scan_id,))
+        _insert_detections(conn, scan_id, detection_rows)
+        converted += 1
+
+    indexed = 0
+    if HAS_FTS5 and version < 3:
+        rows = conn.execute('SELECT id, numeric_sequence FROM scans WHERE numeric_sequence IS NOT NULL')
+        for scan_id, numeric_sequence in rows.fetchall():
+            _index_sequence(conn, scan_id, json.loads(numeric_sequence))
+            indexed += 1
+
+    conn.execute(f'PRAGMA user_version = {target}')
+    if converted:
+        logger.info(f"Migrated {converted} scans to schema v{target}")
+    if indexed:
+        logger.info(f"Indexed the sequences of {indexed} stored scans")
+    return converted
+
+
+def _prepare_scan(result: dict):
+    """
+    Splits a result into scans column values and detections rows. Takes the columnar form
+    the pipeline builds (see compact.columns) or a DetectResponse dict.
+    """
+    if 'label_ids' in result:
+        labels, label_info, bboxes = result['labels'], result['label_info'], result['bboxes']
+        detection_rows = []
+        for position, (i, score) in enumerate(zip(result['label_ids'], result['scores'])):
+            details = label_info[i]
+            detection_rows.append((
+                position, labels[i], details['english_name'], details['symbol'], details['numeric'],
+                details['octave'], score, *bboxes[4 * position:4 * position + 4]
+            ))
+        extra = {k: v for k, v in result.items() if k not in _SCAN_FIELDS and k not in COLUMN_FIELDS}
+    else:
+        detections = result.get('detections') or []
+        detection_rows = []
+        for position, d in enumerate(detections):
+            bbox = list(d.get('bbox') or [None] * 4)
+            detection_rows.append((
+                position, d.get('label'), d.get('english_name'), d.get('symbol'), d.get('numeric'),
+                d.get('octave'), d.get('score'), *bbox[:4]
+            ))
+        extra = {k: v for k, v in result.items() if k not in _SCAN_FIELDS}
+    scan_values = {
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'overall_confidence': float(result.get('overall_confidence', 0.0)),
+        'model_info': result.get('model_info'),
+        'num_detections': len(detection_rows),
+        'numeric_sequence': json.dumps(result.get('numeric_sequence') or []),
+        'extra_json': json.dumps(extra, ensure_ascii=False),
+    }
+    return scan_values, detection_rows
+
+
+def _insert_scan(conn: sqlite3.Connection, prepared) -> int:
+    scan_values, detection_rows = prepared
+    scan_id = conn.execute(
+        '''
+        INSERT INTO scans (timestamp, overall_confidence, model_info, num_detections, numeric_sequence, extra_json)
+        VALUES (:timestamp, :overall_confidence, :model_info, :num_detections, :numeric_sequence, :extra_json)
+        ''',
+        scan_values
+    ).lastrowid
+    _insert_detections(conn, scan_id, detection_rows)
+    if HAS_FTS5:
+        _index_sequence(conn, scan_id, json.loads(scan_values['numeric_sequence']))
+    return scan_id
+
+
+def _sequence_tokens(numeric_sequence):
+    """
+    Index text of a sequence: a 'p<a>x<b>x<c>' token for every run of SEQUENCE_NGRAM notes and an
+    'i<x>x<y>x<z>' token for every run of SEQUENCE_NGRAM steps between notes (semitones up, mod 12),
+    which a phrase shares with all its transpositions. Single notes would each occur on nearly
+    every page; n-grams keep the posting lists a phrase query intersects short.
+    """
+    n = SEQUENCE_NGRAM
+    steps = [(b - a) % 12 for a, b in zip(numeric_sequence, numeric_sequence[1:])]
+    pitches = ' '.join('p' + 'x'.join(map(str, numeric_sequence[i:i + n]))
+                       for i in range(len(numeric_sequence) - n + 1))
+    intervals = ' '.join('i' + 'x'.join(map(str, steps[i:i + n])) for i in range(len(steps) - n + 1))
+    return pitches, intervals
+
+
+def _index_sequence(conn: sqlite3.Connection, scan_id: int, numeric_sequence):
+    conn.execute(
+        'INSERT INTO scan_sequences (rowid, pitches, intervals) VALUES (?,?,?)',
+        (scan_id, *_sequence_tokens(numeric_sequence))
+    )
+
+
+def _insert_detections(conn: sqlite3.Connection, scan_id: int, detection_rows):
+    conn.executemany(
+        '''
+        INSERT INTO detections (scan_id, position, label, english_name, symbol, numeric, octave, score, x1, y1, x2, y2)
+        VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
+        ''',
+        [(scan_id, *row) for row in detection_rows]
+    )
+
+
+class ScanWriter:
+    """
+    Background writer that batches scan inserts into group commits,
+    so request threads never wait on SQLite's write lock or fsync.
+    """
+
+    def __init__(self, batch_size: int = WRITE_BATCH_SIZE, batch_wait: float = WRITE_BATCH_WAIT):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='scan-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, scans) -> Future:
+        """Queues prepared scans (see _prepare_scan); resolves to their ids."""
+        self.start()
+        future = Future()
+        self._queue.put((scans, future))
+        return future
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stop(self):
+        """Flushes everything queued so far and stops the writer thread."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _run(self):
+        conn = _connect()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                batch = [item]
+                deadline = time.monotonic() + self.batch_wait
+                stopping = False
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._commit(conn, batch)
+                if stopping:
+                    return
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _commit(conn: sqlite3.Connection, batch):
+        try:
+            ids = []
+            with conn:
+                for scans, _ in batch:
+                    ids.append([_insert_scan(conn, prepared) for prepared in scans])
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"Saving a scan batch failed: {e}")
+                batch[0][1].set_exception(e)
+                return
+            # The group commit rolled back as a whole; commit each submission on its own
+            # so only the one that cannot be stored sees the error
+            logger.warning(f"Group commit of {len(batch)} scan batches failed ({e}); retrying them one by one")
+            for item in batch:
+                ScanWriter._commit(conn, [item])
+            return
+        for (_, future), row_ids in zip(batch, ids):
+            future.set_result(row_ids)
+
+
+_writer = ScanWriter()
+
+
+def enqueue_scan(result: dict) -> Future:
+    """Queues a scan for the background writer; the future resolves to its row id."""
     init_db()
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    ts = datetime.utcnow().isoformat() + 'Z'
-    cur.execute('INSERT INTO scans (timestamp, result_json, overall_confidence) VALUES (?,?,?)',
-                (ts, json.dumps(result, ensure_ascii=False), float(result.get('overall_confidence', 0.0))))
-    conn.commit()
-    rowid = cur.lastrowid
-    conn.close()
-    return rowid
-
-
-def get_history(limit: int = 100):
+    outer = Future()
+    inner = _writer.submit([_prepare_scan(result)])
+    inner.add_done_callback(
+        lambda f: outer.set_exception(f.exception()) if f.exception() else outer.set_result(f.result()[0])
+    )
+    return outer
+
+
+def enqueue_scans(results) -> Future:
+    """Queues several scans to be committed in one transaction; resolves to their row ids."""
     init_db()
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute('SELECT id, timestamp, result_json, overall_confidence FROM scans ORDER BY id DESC LIMIT ?', (limit,))
-    rows = cur.fetchall()
-    conn.close()
+    return _writer.submit([_prepare_scan(result) for result in results])
+
+
+def save_scan(result: dict) -> int:
+    return enqueue_scan(result).result()
+
+
+def insert_scans(conn: sqlite3.Connection, results) -> list:
+    """
+    Inserts results on the caller's connection, inside whatever transaction it has open,
+    and returns their row ids. For tools that commit scans together with rows of their own.
+    """
+    return [_insert_scan(conn, _prepare_scan(result)) for result in results]
+
+
+def stop_writer():
+    _writer.stop()
+
+
+def writer_queue_depth() -> int:
+    """Scan batches waiting for the background writer."""
+    return _writer.queue_depth
+
+
+HISTORY_FIELDS = ('id', 'timestamp', 'overall_confidence', 'model_info', 'num_detections',
+                  'numeric_sequence', 'result')
+SUMMARY_FIELDS = ('id', 'timestamp', 'overall_confidence', 'numeric_sequence')
+
+# Scans fetched per query while iterating history; each chunk is its own keyset query
+HISTORY_CHUNK_SIZE = 200
+
+
+def iter_history(limit: int = 100, fields=None, before_id: int = None, since: str = None, until: str = None,
+                 min_confidence: float = None, max_confidence: float = None):
+    """
+    Most recent scans first, paged by keyset (id < before_id) rather than OFFSET.
+    `fields` projects each item onto a subset of HISTORY_FIELDS; detections are only
+    read when 'result' is requested. since/until compare against the stored ISO timestamps.
+    """
+    fields = tuple(fields or HISTORY_FIELDS)
+    unknown = set(fields) - set(HISTORY_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown history fields: {', '.join(sorted(unknown))}")
+
+    filters, params = [], []
+    for clause, value in (('timestamp >= ?', since), ('timestamp < ?', until),
+                          ('overall_confidence >= ?', min_confidence), ('overall_confidence <= ?', max_confidence)):
+        if value is not None:
+            filters.append(clause)
+            params.append(value)
+
+    remaining = limit
+    cursor = before_id
+    while remaining > 0:
+        # A fresh query per chunk keeps no cursor open between yields, so a streaming
+        # response can resume the generator from any threadpool thread
+        where = filters + (['id < ?'] if cursor is not None else [])
+        chunk_params = params + ([cursor] if cursor is not None else [])
+        conn = get_connection()
+        rows = conn.execute(
+            f'''
+            SELECT id, timestamp, overall_confidence, model_info, num_detections, numeric_sequence, extra_json
+            FROM scans {'WHERE ' + ' AND '.join(where) if where else ''}
+            ORDER BY id DESC LIMIT ?
+            ''',
+            chunk_params + [min(remaining, HISTORY_CHUNK_SIZE)]
+        ).fetchall()
+        if not rows:
+            return
+
+        detections = _load_detections(conn, [r[0] for r in rows]) if 'result' in fields else {}
+        for r in rows:
+            item = {
+                'id': r[0],
+                'timestamp': r[1],
+                'overall_confidence': r[2],
+                'model_info': r[3],
+                'num_detections': r[4],
+            }
+            if 'numeric_sequence' in fields or 'result' in fields:
+                item['numeric_sequence'] = json.loads(r[5] or '[]')
+            if 'result' in fields:
+                item['result'] = _build_result(r, detections.get(r[0], []), item['numeric_sequence'])
+            yield {field: item[field] for field in fields}
+
+        remaining -= len(rows)
+        cursor = rows[-1][0]
+
+
+def get_history(limit: int = 100, summary: bool = False, **filters):
+    """List form of iter_history; summary=True is shorthand for fields=SUMMARY_FIELDS."""
+    if summary:
+        filters['fields'] = SUMMARY_FIELDS
+    elif 'fields' not in filters:
+        filters['fields'] = ('id', 'timestamp', 'result', 'overall_confidence')
+    return list(iter_history(limit, **filters))
+
+
+def get_scan(scan_id: int):
+    """One stored scan with its full result, or None."""
+    scans = list(iter_history(1, fields=('id', 'timestamp', 'result', 'overall_confidence'), before_id=scan_id + 1))
+    return scans[0] if scans and scans[0]['id'] == scan_id else None
+
+
+
+
+def search_sequences(notes, transpose: bool = False, limit: int = 20, offset: int = 0):
+    """
+    Scans whose numeric_sequence contains the phrase `notes` (semitones 1-12), best first.
+    With transpose=True the phrase also matches at any other pitch (same steps between notes);
+    scans containing it at its own pitch (`exact`) come before scans that only contain it
+    transposed. Within each group ranking is bm25 over the sequence index, so pages where the
+    phrase is frequent relative to their length come first; ties go to the newest scan. Each
+    result lists where the phrase starts and its shift in semitones.
+    """
+    if not HAS_FTS5:
+        raise RuntimeError("The SQLite library lacks FTS5, so the sequence index is unavailable")
+    notes = list(notes)
+    # One index token covers SEQUENCE_NGRAM notes, or as many steps (one note more)
+    shortest = SEQUENCE_NGRAM + 1 if transpose else SEQUENCE_NGRAM
+    if len(notes) < shortest:
+        raise ValueError(f"A phrase needs at least {shortest} notes{' to search transposed' if transpose else ''}")
+    pitches, intervals = _sequence_tokens(notes)
+    exact_query = f'pitches : "{pitches}"'
+    query = exact_query
+    if transpose:
+        query += f' OR intervals : "{intervals}"'
+
+    conn = get_connection()
+    # Without transpose every hit is exact; otherwise the pitches-only match (evaluated once,
+    # it does not depend on the outer row) marks the scans that contain the phrase untransposed
+    exact = '1'
+    if transpose:
+        exact = 'scan_sequences.rowid IN (SELECT rowid FROM scan_sequences WHERE scan_sequences MATCH ?)'
+    rows = conn.execute(
+        f'''
+        SELECT s.id, s.timestamp, s.overall_confidence, s.model_info, s.num_detections, s.numeric_sequence,
+               bm25(scan_sequences, 2.0, 1.0) AS rank, {exact} AS exact
+        FROM scan_sequences JOIN scans s ON s.id = scan_sequences.rowid
+        WHERE scan_sequences MATCH ?
+        ORDER BY exact DESC, rank, s.id DESC LIMIT ? OFFSET ?
+        ''',
+        ((exact_query,) if transpose else ()) + (query, limit, offset)
+    ).fetchall()
+
     results = []
-    for r in rows:
+    for scan_id, timestamp, confidence, model_info, num_detections, numeric_sequence, rank, exact in rows:
+        sequence = json.loads(numeric_sequence or '[]')
         results.append({
-            'id': r[0],
-            'timestamp': r[1],
-            'result': json.loads(r[2]),
-            'overall_confidence': r[3]
+            'id': scan_id,
+            'timestamp': timestamp,
+            'overall_confidence': confidence,
+            'model_info': model_info,
+            'num_detections': num_detections,
+            'score': round(-rank, 4),
+            'exact': bool(exact),
+            'matches': _phrase_matches(sequence, notes, transpose),
         })
     return results
+
+
+def _phrase_matches(sequence, notes, transpose: bool):
+    """Start positions of `notes` in `sequence` with the shift (semitones up, mod 12) of each."""
+    n = len(notes)
+    steps = [(b - a) % 12 for a, b in zip(notes, notes[1:])]
+    matches = []
+    for start in range(len(sequence) - n + 1):
+        window = sequence[start:start + n]
+        shift = (window[0] - notes[0]) % 12
+        if shift and not transpose:
+            continue
+        if all((b - a) % 12 == step for a, b, step in zip(window, window[1:], steps)):
+            matches.append({'position': start, 'shift': shift})
+    return matches
+
+
+def _build_result(row, detections, numeric_sequence):
+    result = json.loads(row[6] or '{}')
+    result.update({
+        'detections': detections,
+        'ordered_labels': [d['label'] for d in detections],
+        'numeric_sequence': numeric_sequence,
+        'overall_confidence': row[2],
+        'model_info': row[3],
+    })
+    return result
+
+
+def _load_detections(conn: sqlite3.Connection, scan_ids):
+    """Detections of several scans in one query, grouped by scan id in stored order."""
+    grouped = {}
+    if not scan_ids:
+        return grouped
+    placeholders = ','.join('?' * len(scan_ids))
+    cur = conn.execute(
+        f'''
+        SELECT scan_id, label, english_name, symbol, score, x1, y1, x2, y2, numeric, octave
+        FROM detections WHERE scan_id IN ({placeholders}) ORDER BY scan_id, position
+        ''',
+        scan_ids
+    )
+    for row in cur:
+        detection = {
+            'label': row[1],
+            'english_name': row[2],
+            'symbol': row[3],
+            'score': row[4],
+            'bbox': [row[5], row[6], row[7], row[8]],
+            'numeric': row[9],
+            'octave': row[10],
+        }
+        # Scans saved by older versions lack some of these fields; keep them absent
+        for key in _OPTIONAL_DETECTION_FIELDS:
+            if detection[key] is None:
+                del detection[key]
+        grouped.setdefault(row[0], []).append(detection)
+    return grouped
@@ -11,16 +11,14 @@ def test_diag():
     model = YOLO('models/brain.pt')
     print(f"Model Names: {model.names}")
     
-    # Check mapping
-    from mapping.swara_map import SWARA_DETAILS
-    print(f"Mapping Keys: {list(SWARA_DETAILS.keys())}")
-    
-    # Comparison
+    # Comparison (labels resolve through the same class table /detect uses)
     for i, name in model.names.items():
-        if name not in SWARA_DETAILS:
-            print(f"WARNING: Model class '{name}' NOT in mapping!")
+        details = get_swara_details(name)
+        if details['numeric'] == -1:
+            print(f"WARNING: Model class '{name}' is not a swara in the mapping!")
         else:
-            print(f"SUCCESS: Model class '{name}' matches mapping.")
+            print(f"SUCCESS: Model class '{name}' -> {details['english']} {details['symbol']} "
+                  f"({details['numeric']}, {details['octave']})")
 
 if __name__ == "__main__":
     test_diag()
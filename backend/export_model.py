@@ -0,0 +1,58 @@
+import argparse
+import sys
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from inference.detector import MODEL_PATH
+
+
+def export_onnx(weights: Path, imgsz: int, opset: int) -> Path:
+    from ultralytics import YOLO
+
+    # Dynamic axes let one graph take any batch size and any tile shape, like the .pt model
+    exported = YOLO(str(weights)).export(format='onnx', imgsz=imgsz, dynamic=True, opset=opset, simplify=True)
+    return Path(exported)
+
+
+def export_openvino(weights: Path, imgsz: int) -> Path:
+    from ultralytics import YOLO
+
+    exported = YOLO(str(weights)).export(format='openvino', imgsz=imgsz, dynamic=True)
+    return Path(exported) / (weights.stem + '.xml')
+
+
+def quantize_int8(onnx_path: Path) -> Path:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    # Dynamic quantization: INT8 weights, activations quantized on the fly, no calibration set needed
+    output = onnx_path.with_name(onnx_path.stem + '.int8.onnx')
+    quantize_dynamic(str(onnx_path), str(output), weight_type=QuantType.QUInt8)
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export brain.pt for the onnx / openvino inference backends")
+    parser.add_argument('--weights', default=str(MODEL_PATH))
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--opset', type=int, default=17)
+    parser.add_argument('--int8', action='store_true', help="Also write a dynamically quantized <name>.int8.onnx")
+    parser.add_argument('--openvino', action='store_true', help="Also export an OpenVINO IR model")
+    args = parser.parse_args()
+
+    weights = Path(args.weights)
+    if not weights.exists():
+        print(f"Weights not found at {weights}")
+        sys.exit(1)
+
+    onnx_path = export_onnx(weights, args.imgsz, args.opset)
+    print(f"ONNX model: {onnx_path}")
+    if args.int8:
+        print(f"INT8 model: {quantize_int8(onnx_path)}")
+    if args.openvino:
+        print(f"OpenVINO model: {export_openvino(weights, args.imgsz)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+import ast
+import copy
+import json
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import cv2
+import numpy as np
+
+# Ultralytics predict() defaults that the exported-graph backends reproduce
+NMS_IOU = 0.7
+MAX_DET = 300
+LETTERBOX_STRIDE = 32
+LETTERBOX_FILL = 114
+
+CLASSES_PATH = Path(__file__).resolve().parents[2] / "model_classes.json"
+
+
+class DetectorBackend:
+    """
+    What the slicing pipeline needs from a detection model: class names, the model input
+    size, and batched tile prediction returning one (M, 6) [x1, y1, x2, y2, score, class_id]
+    array per tile in tile coordinates.
+    """
+
+    name = 'base'
+    names: Dict[int, str] = {}
+    image_size: int = None
+    confidence_threshold: float = 0.15
+    # Registry tag of the weights (see model_registry.version_tag)
+    version: str = None
+    # Whether a process forked after loading may keep predicting with this instance
+    fork_safe = False
+
+    def worker_view(self) -> 'DetectorBackend':
+        """An instance one more worker thread can predict with, sharing this one's weights."""
+        return self
+
+    def predict(self, tiles: List[np.ndarray], batch_size: int = 8,
+                progress: Callable[[int], None] = None) -> List[np.ndarray]:
+        raise NotImplementedError
+
+
+def letterbox(img: np.ndarray, size: int, auto: bool):
+    """
+    Ultralytics LetterBox: keep aspect ratio, pad with grey to `size` (or only to the
+    next stride multiple when `auto`). Returns the padded image, gain and (left, top) padding.
+    """
+    h, w = img.shape[:2]
+    gain = min(size / h, size / w)
+    new_w, new_h = int(round(w * gain)), int(round(h * gain))
+    pad_w, pad_h = size - new_w, size - new_h
+    if auto:
+        pad_w, pad_h = pad_w % LETTERBOX_STRIDE, pad_h % LETTERBOX_STRIDE
+    if (w, h) != (new_w, new_h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_h / 2 - 0.1)), int(round(pad_h / 2 + 0.1))
+    left, right = int(round(pad_w / 2 - 0.1)), int(round(pad_w / 2 + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT,
+                             value=(LETTERBOX_FILL,) * 3)
+    return img, gain, (left, top)
+
+
+def _nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Greedy IoU suppression, highest score first. Returns kept indices."""
+    order = np.argsort(-scores, kind='stable')
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        iw = np.clip(np.minimum(boxes[i, 2], boxes[rest, 2]) - np.maximum(boxes[i, 0], boxes[rest, 0]), 0, None)
+        ih = np.clip(np.minimum(boxes[i, 3], boxes[rest, 3]) - np.maximum(boxes[i, 1], boxes[rest, 1]), 0, None)
+        inter = iw * ih
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-7)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def decode_yolo(output: np.ndarray, conf: float, iou: float = NMS_IOU, max_det: int = MAX_DET) -> np.ndarray:
+    """
+    Raw YOLOv8 head output for one image, (4 + classes, anchors) with xywh boxes,
+    to (M, 6) detections after class-aware NMS (Ultralytics non_max_suppression, single label).
+    """
+    pred = output.T
+    class_scores = pred[:, 4:]
+    class_ids = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(pred)), class_ids]
+    keep = scores > conf
+    if not keep.any():
+        return np.zeros((0, 6), dtype=np.float32)
+    xywh, scores, class_ids = pred[keep, :4], scores[keep], class_ids[keep]
+    boxes = np.empty_like(xywh)
+    boxes[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+    boxes[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+
+    # Offsetting boxes per class makes one NMS pass class-aware, as Ultralytics does
+    offset = class_ids[:, None].astype(boxes.dtype) * 7680
+    kept = _nms(boxes + offset, scores, iou)[:max_det]
+    return np.column_stack([boxes[kept], scores[kept], class_ids[kept]]).astype(np.float32)
+
+
+def _names_from_metadata(metadata: Dict[str, str]) -> Dict[int, str]:
+    # Ultralytics writes the class names into the exported model's metadata as a dict literal
+    if 'names' in metadata:
+        return {int(k): v for k, v in ast.literal_eval(metadata['names']).items()}
+    with open(CLASSES_PATH, encoding='utf-8') as f:
+        return {int(k): v for k, v in json.load(f).items()}
+
+
+class OnnxBackend(DetectorBackend):
+    """YOLOv8 exported to ONNX (FP32 or dynamically quantized INT8), run with ONNX Runtime on CPU."""
+
+    name = 'onnx'
+
+    def __init__(self, model_path: str, confidence_threshold: float = 0.15, image_size: int = 640,
+                 intra_op_threads: int = 0):
+        self.model_path = str(model_path)
+        self.confidence_threshold = confidence_threshold
+        self.intra_op_threads = intra_op_threads
+        self._load()
+        # Fixed-size exports always pad to their input size; dynamic ones pad to the stride like .pt
+        spatial = self._input_shape[2:]
+        self.fixed_size = all(isinstance(d, int) for d in spatial)
+        self.image_size = int(spatial[0]) if self.fixed_size else image_size
+        self.max_batch = self._input_shape[0] if isinstance(self._input_shape[0], int) else None
+
+    def _load(self):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.intra_op_threads:
+            options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = 1
+        self._session = ort.InferenceSession(self.model_path, options, providers=['CPUExecutionProvider'])
+        model_input = self._session.get_inputs()[0]
+        self._input_name = model_input.name
+        self._input_shape = model_input.shape
+        self.names = _names_from_metadata(self._session.get_modelmeta().custom_metadata_map)
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        return self._session.run(None, {self._input_name: batch})[0]
+
+    def predict(self, tiles: List[np.ndarray], batch_size: int = 8,
+                progress: Callable[[int], None] = None) -> List[np.ndarray]:
+        if self.max_batch:
+            batch_size = min(batch_size, self.max_batch)
+        # Same grouping as the PyTorch path: equal tile shapes share a letterbox and a forward pass
+        by_shape = {}
+        for i, tile in enumerate(tiles):
+            by_shape.setdefault(tile.shape[:2], []).append(i)
+
+        outputs = [None] * len(tiles)
+        done = 0
+        for indices in by_shape.values():
+            for start in range(0, len(indices), batch_size):
+                chunk = indices[start:start + batch_size]
+                batch = None
+                for j, i in enumerate(chunk):
+                    padded, gain, pad = letterbox(tiles[i], self.image_size, auto=not self.fixed_size)
+                    if batch is None:
+                        batch = np.empty((len(chunk), 3) + padded.shape[:2], dtype=np.float32)
+                    # BGR HWC uint8 -> RGB CHW float, written straight into the batch buffer
+                    batch[j] = cv2.cvtColor(padded, cv2.COLOR_BGR2RGB).transpose(2, 0, 1)
+                batch *= 1 / 255.0
+                raw = self._run(batch)
+                for i, out in zip(chunk, raw):
+                    det = decode_yolo(out, self.confidence_threshold)
+                    h, w = tiles[i].shape[:2]
+                    det[:, [0, 2]] = np.clip((det[:, [0, 2]] - pad[0]) / gain, 0, w)
+                    det[:, [1, 3]] = np.clip((det[:, [1, 3]] - pad[1]) / gain, 0, h)
+                    outputs[i] = det
+                done += len(chunk)
+                if progress is not None:
+                    progress(done)
+        return outputs
+
+
+class OpenVinoBackend(OnnxBackend):
+    """Same pre/post-processing as OnnxBackend, executed by OpenVINO (reads .onnx or IR .xml)."""
+
+    name = 'openvino'
+
+    def _load(self):
+        import openvino as ov
+
+        core = ov.Core()
+        model = core.read_model(self.model_path)
+        properties = {'INFERENCE_NUM_THREADS': self.intra_op_threads} if self.intra_op_threads else {}
+        self._compiled = core.compile_model(model, 'CPU', properties)
+        self._request = self._compiled.create_infer_request()
+        self._output = self._compiled.output(0)
+        shape = model.input(0).get_partial_shape()
+        self._input_shape = [d.get_length() if d.is_static else None for d in shape]
+        metadata = {}
+        if model.has_rt_info(['model_info', 'names']):
+            metadata['names'] = str(model.get_rt_info(['model_info', 'names']))
+        self.names = _names_from_metadata(metadata)
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        return self._request.infer([batch])[self._output]
+
+    def worker_view(self) -> 'OpenVinoBackend':
+        # The compiled model is shared; an infer request serves one thread at a time
+        view = copy.copy(self)
+        view._request = self._compiled.create_infer_request()
+        return view
@@ -0,0 +1,137 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerTimeout(TimeoutError):
+    """Raised when a request's tiles are not inferred within the latency limit."""
+
+
+class _TileRequest:
+    __slots__ = ('tile', 'future', 'enqueued_at')
+
+    def __init__(self, tile: np.ndarray):
+        self.tile = tile
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class TileScheduler:
+    """
+    Dynamic micro-batching in front of the detection model.
+    Tiles from every in-flight request share one queue; a dispatcher thread runs a forward
+    pass as soon as max_batch_size tiles are waiting or the oldest has waited max_wait_ms,
+    then routes each tile's boxes back to the future of the request that sent it.
+    """
+
+    def __init__(self, predict_fn: Callable[[List[np.ndarray]], List[np.ndarray]], names: Dict[int, str],
+                 max_batch_size: int = 16, max_wait_ms: float = 10, max_latency_ms: float = 30000):
+        self.predict_fn = predict_fn
+        self.names = names
+        # Registry tag of the model behind predict_fn
+        self.version = None
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_latency = max_latency_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._tiles = 0
+        self._timeouts = 0
+        self._batch_sizes = deque(maxlen=256)
+        self._thread = threading.Thread(target=self._dispatch_loop, name='tile-scheduler', daemon=True)
+        self._thread.start()
+
+    def infer(self, tiles: List[np.ndarray], progress: Optional[Callable[[int], None]] = None) -> List[np.ndarray]:
+        """
+        Blocks until every tile has been through a shared forward pass (or the latency limit expires).
+        `progress` is called with the number of this request's tiles collected so far.
+        """
+        requests = [_TileRequest(tile) for tile in tiles]
+        for req in requests:
+            self._queue.put(req)
+
+        deadline = time.monotonic() + self.max_latency
+        try:
+            outputs = []
+            for req in requests:
+                outputs.append(req.future.result(timeout=max(0.0, deadline - time.monotonic())))
+                if progress is not None:
+                    progress(len(outputs))
+            return outputs
+        except FutureTimeout:
+            # Drop whatever has not been picked up yet so it does not occupy later batches
+            for req in requests:
+                req.future.cancel()
+            with self._lock:
+                self._timeouts += 1
+            raise SchedulerTimeout(f"Tile inference exceeded {self.max_latency * 1000:.0f} ms")
+
+    def close(self):
+        """Lets the dispatcher exit after the tiles already queued."""
+        self._queue.put(None)
+
+    def _collect_batch(self) -> Optional[List[_TileRequest]]:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = batch[0].enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                req = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if req is None:
+                # Closing: run what was collected, then stop on the next call
+                self._queue.put(None)
+                break
+            batch.append(req)
+        # Skip tiles whose request already gave up
+        return [req for req in batch if req.future.set_running_or_notify_cancel()]
+
+    def _dispatch_loop(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                return
+            if not batch:
+                continue
+            try:
+                outputs = self.predict_fn([req.tile for req in batch])
+            except Exception as e:
+                logger.error(f"Batched tile inference failed: {e}")
+                for req in batch:
+                    req.future.set_exception(e)
+                continue
+
+            for req, out in zip(batch, outputs):
+                req.future.set_result(out)
+            with self._lock:
+                self._batches += 1
+                self._tiles += len(batch)
+                self._batch_sizes.append(len(batch))
+
+    def stats(self) -> dict:
+        with self._lock:
+            sizes = list(self._batch_sizes)
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "max_latency_ms": self.max_latency * 1000,
+                "pending_tiles": self._queue.qsize(),
+                "batches": self._batches,
+                "tiles": self._tiles,
+                "timeouts": self._timeouts,
+                "avg_batch_size": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+            }
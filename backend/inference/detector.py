@@ -1,52 +1,364 @@
+import copy
+import threading
+import time
 from pathlib import Path
-import torch
+from typing import Callable, Dict, List
 import numpy as np
-from sahi.models.ultralytics import UltralyticsDetectionModel
-from sahi.predict import get_sliced_prediction
-
-# PyTorch 2.6+ compatibility fix
-if hasattr(torch, 'load'):
-    original_load = torch.load
-    def patched_load(*args, **kwargs):
-        if 'weights_only' not in kwargs:
-            kwargs['weights_only'] = False
-        return original_load(*args, **kwargs)
-    torch.load = patched_load
+
+import config
+from inference.backends import DetectorBackend, OnnxBackend, OpenVinoBackend
+from inference.batcher import TileScheduler
+from inference.scale_policy import (
+    SCALE_MERGES, SCALE_POLICIES, estimate_glyph_height_components, glyph_height_from_boxes, select_scales
+)
+from inference.slicing import DetectionResult, crop_tiles, nmm, plan_tiles, shift_to_page
+from inference.tile_cache import TileCache, blank_tiles, ink_mask, ink_region
+
+_torch_patched = False
+
+
+def _patch_torch_load():
+    """PyTorch 2.6+ compatibility fix, applied the first time a .pt model is loaded."""
+    global _torch_patched
+    if _torch_patched:
+        return
+    import torch
+
+    if hasattr(torch, 'load'):
+        original_load = torch.load
+        def patched_load(*args, **kwargs):
+            if 'weights_only' not in kwargs:
+                kwargs['weights_only'] = False
+            return original_load(*args, **kwargs)
+        torch.load = patched_load
+    _torch_patched = True
 
 # Absolute path to brain.pt
 MODEL_PATH = Path(__file__).resolve().parents[1] / "models" / "brain.pt"
 
-# Load YOLOv8 model with SAHI
-detection_model = UltralyticsDetectionModel(
-    model_path=str(MODEL_PATH),
-    confidence_threshold=0.15,
-    device="cpu"   # change to "cuda" if GPU is available
-)
 
-def run_detection(image: np.ndarray):
+class TorchBackend(DetectorBackend):
+    """The original path: brain.pt through SAHI's UltralyticsDetectionModel, FP32 PyTorch on CPU."""
+
+    name = 'torch'
+    fork_safe = True
+
+    def __init__(self, model_path: str = str(MODEL_PATH), confidence_threshold: float = 0.15):
+        # torch, ultralytics and sahi take seconds to import, so only the torch backend pays for them
+        _patch_torch_load()
+        from sahi.models.ultralytics import UltralyticsDetectionModel
+
+        self.model = UltralyticsDetectionModel(
+            model_path=model_path,
+            confidence_threshold=confidence_threshold,
+            device="cpu"   # change to "cuda" if GPU is available
+        )
+        # Fuse Conv+BN now instead of in the first predict(), so workers sharing these weights
+        # (threads, or processes forked after loading) never write to them
+        self.model.model.model.fuse(verbose=False)
+        self.model_path = model_path
+        self.confidence_threshold = confidence_threshold
+        self.image_size = self.model.image_size
+        self.names = {int(k): v for k, v in self.model.category_mapping.items()}
+
+    def worker_view(self) -> 'TorchBackend':
+        # The Ultralytics predictor keeps per-call state, so each thread gets its own
+        # predictor around the same nn.Module
+        yolo = copy.copy(self.model.model)
+        yolo.predictor = None
+        view = copy.copy(self)
+        view.model = copy.copy(self.model)
+        view.model.model = yolo
+        return view
+
+    def predict(self, tiles: List[np.ndarray], batch_size: int = 8,
+                progress: Callable[[int], None] = None) -> List[np.ndarray]:
+        model = self.model
+        kwargs = {"verbose": False, "conf": model.confidence_threshold, "device": model.device}
+        if model.image_size is not None:
+            kwargs["imgsz"] = model.image_size
+
+        # Batch equally sized tiles together so Ultralytics keeps the same letterboxing as batch-1 calls.
+        # enhance_notation returns gray replicated to 3 channels, so channel order does not matter here.
+        by_shape = {}
+        for i, tile in enumerate(tiles):
+            by_shape.setdefault(tile.shape[:2], []).append(i)
+
+        outputs = [None] * len(tiles)
+        done = 0
+        for indices in by_shape.values():
+            for start in range(0, len(indices), batch_size):
+                chunk = indices[start:start + batch_size]
+                results = model.model([np.ascontiguousarray(tiles[i]) for i in chunk], **kwargs)
+                for i, res in zip(chunk, results):
+                    outputs[i] = res.boxes.data.cpu().numpy()
+                done += len(chunk)
+                if progress is not None:
+                    progress(done)
+        return outputs
+
+
+def model_path_for(backend: str = None) -> Path:
+    """Weights file a backend loads: brain.pt, or the exported brain[.int8].onnx / OpenVINO model."""
+    backend = backend or config.INFERENCE_BACKEND
+    if backend == 'torch':
+        return MODEL_PATH
+    if config.EXPORTED_MODEL_PATH:
+        return Path(config.EXPORTED_MODEL_PATH)
+    suffix = '.int8.onnx' if config.INFERENCE_PRECISION == 'int8' else '.onnx'
+    return MODEL_PATH.with_name(MODEL_PATH.stem + suffix)
+
+
+def load_detection_model(backend: str = None, intra_op_threads: int = None, model_path=None) -> DetectorBackend:
+    """
+    Loads a fresh detection backend, chosen by SWARALIPI_INFERENCE_BACKEND, from `model_path`
+    or the backend's default weights. The server goes through model_registry instead, which
+    loads each version once and shares it between workers.
+    """
+    backend = backend or config.INFERENCE_BACKEND
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    model_path = str(model_path or model_path_for(backend))
+    if backend == 'torch':
+        return TorchBackend(model_path, confidence_threshold=0.15)
+    threads = intra_op_threads or config.INTRA_OP_THREADS
+    return INFERENCE_BACKENDS[backend](
+        model_path, confidence_threshold=0.15,
+        image_size=config.MODEL_INPUT_SIZE, intra_op_threads=threads
+    )
+
+INFERENCE_BACKENDS = {'torch': TorchBackend, 'onnx': OnnxBackend, 'openvino': OpenVinoBackend}
+
+def get_detection_model() -> DetectorBackend:
+    """Process-wide default model for callers that do not pass their own: the registry's active version."""
+    from inference.model_registry import model_registry
+
+    return model_registry.load(model_registry.active() or model_registry.version_for()).model
+
+
+def predict_tiles(model: DetectorBackend, tiles: List[np.ndarray], batch_size: int = 8,
+                  progress: Callable[[int], None] = None) -> List[np.ndarray]:
+    """
+    Runs the detection backend on many tiles per forward pass.
+    Returns one (M, 6) [x1, y1, x2, y2, score, class_id] array per tile, in tile coordinates.
+    `progress` is called with the number of tiles done after every forward pass.
+    """
+    return model.predict(tiles, batch_size, progress)
+
+
+def category_names(model: DetectorBackend) -> dict:
+    return model.names
+
+
+_tile_schedulers: Dict[str, TileScheduler] = {}
+_tile_scheduler = None
+_tile_scheduler_lock = threading.Lock()
+
+
+def get_tile_scheduler(model: DetectorBackend = None) -> TileScheduler:
+    """
+    Micro-batching scheduler in front of `model` (default: the registry's active version),
+    shared by every worker of the process and created on first use. A hot-swapped model
+    gets a scheduler of its own, so one forward pass never mixes two versions.
+    """
+    global _tile_scheduler
+    model = model or get_detection_model()
+    with _tile_scheduler_lock:
+        scheduler = _tile_schedulers.get(model.version)
+        if scheduler is None:
+            scheduler = TileScheduler(
+                lambda tiles: predict_tiles(model, tiles, config.SCHEDULER_MAX_BATCH_SIZE),
+                category_names(model),
+                max_batch_size=config.SCHEDULER_MAX_BATCH_SIZE,
+                max_wait_ms=config.SCHEDULER_MAX_WAIT_MS,
+                max_latency_ms=config.SCHEDULER_MAX_LATENCY_MS,
+            )
+            scheduler.version = model.version
+            _tile_schedulers[model.version] = scheduler
+        _tile_scheduler = scheduler
+        return scheduler
+
+
+def close_tile_scheduler(version: str):
+    """Stops the scheduler of a retired model version once its queued tiles are done."""
+    with _tile_scheduler_lock:
+        scheduler = _tile_schedulers.pop(version, None)
+    if scheduler is not None:
+        scheduler.close()
+
+
+def tile_scheduler_stats():
+    return _tile_scheduler.stats() if _tile_scheduler is not None else None
+
+
+tile_cache = TileCache(config.TILE_CACHE_ENTRIES)
+
+
+def _infer_tiles(model, tiles: List[np.ndarray], batch_size: int, progress: Callable[[int], None] = None):
+    if isinstance(model, TileScheduler):
+        return model.infer(tiles, progress), model.names
+    return predict_tiles(model, tiles, batch_size, progress), category_names(model)
+
+
+def warm_up(model):
+    """
+    One forward pass on a synthetic page tile (a few dark strokes on white) so lazy
+    initialisation inside the runtime happens before real traffic arrives.
+    """
+    size = getattr(model, 'image_size', None) or config.MODEL_INPUT_SIZE
+    tile = np.full((size, size, 3), 255, dtype=np.uint8)
+    for i in range(4):
+        x = size // 8 + i * size // 5
+        tile[size // 3:size // 3 + size // 12, x:x + size // 16] = 0
+    _infer_tiles(model, [tile], 1)
+
+
+def _choose_scales(image: np.ndarray, model, scales: List[int], policy: str, batch_size: int):
     """
-    Runs multi-scale SAHI sliced inference for 99% accuracy mission.
+    Applies the scale policy. Returns (scales to run, full-page predictions from the probe pass or None).
     """
+    if policy == 'fixed':
+        return scales, None
+
+    probe, names = None, None
+    glyph_height = None
+    if policy == 'probe':
+        # The full-page pass is part of every sliced run anyway, so it doubles as the probe
+        (probe,), names = _infer_tiles(model, [image], batch_size)
+        glyph_height = glyph_height_from_boxes(probe)
+    if glyph_height is None:
+        glyph_height = estimate_glyph_height_components(image)
+    if glyph_height is None:
+        return scales, probe
+
+    input_size = getattr(model, 'image_size', None) or config.MODEL_INPUT_SIZE
+    chosen = select_scales(glyph_height, scales, input_size, config.ADAPTIVE_GLYPH_TARGET_PX, config.ADAPTIVE_SCALE_BAND)
+    return chosen, probe
+
+
+def run_detection(image: np.ndarray, model: DetectorBackend = None,
+                  scales: List[int] = None, batch_size: int = None,
+                  scale_policy: str = None, scale_merge: str = None,
+                  progress: Callable[[int, int], None] = None,
+                  timings: Dict[str, float] = None, counts: Dict[str, int] = None) -> DetectionResult:
+    """
+    Runs multi-scale sliced inference for 99% accuracy mission.
+    All tile windows of the selected scales are planned up front (windows shared between scales
+    are inferred once), then each scale is merged with NMM the way SAHI's get_sliced_prediction does.
+    scale_policy picks which scales run (see SCALE_POLICIES); scale_merge='nmm' also merges
+    duplicates across scales.
+    Uses the process-wide default model unless a worker passes its own model or the shared TileScheduler.
+    With the tile cache on, the slice grid is anchored to the page's ink and tiles whose ink
+    matches an earlier tile reuse its boxes instead of being inferred (see TileCache).
+    Tiles with less ink than SKIP_INK_RATIO are not inferred at all.
+    `progress(done, total)` reports sliced tiles inferred so far. Pass a dict as `timings` to
+    receive per-stage durations in milliseconds (scale selection, slicing, inference and merge per scale),
+    and a dict as `counts` to receive tile and box counts before and after merging.
+    """
+    if model is None:
+        model = get_detection_model()
+    if timings is None:
+        timings = {}
+    if counts is None:
+        counts = {}
+    clock = time.perf_counter()
+
+    def lap(stage):
+        nonlocal clock
+        now = time.perf_counter()
+        timings[stage] = round((now - clock) * 1000, 2)
+        clock = now
+
     # Run inference at two different slice scales to catch all swara sizes
-    scales = [400, 600]
-    all_predictions = []
-    
+    scales = list(scales or config.SLICE_SCALES)
+    batch_size = batch_size or config.TILE_BATCH_SIZE
+    scale_policy = scale_policy or config.SCALE_POLICY
+    scale_merge = scale_merge or config.SCALE_MERGE
+    if scale_policy not in SCALE_POLICIES:
+        raise ValueError(f"Unknown scale policy: {scale_policy}")
+    if scale_merge not in SCALE_MERGES:
+        raise ValueError(f"Unknown scale merge: {scale_merge}")
+
+    height, width = image.shape[:2]
+    scales, probe = _choose_scales(image, model, scales, scale_policy, batch_size)
+    lap('scale_select')
+    mask, region = None, None
+    if tile_cache.enabled or config.SKIP_INK_RATIO > 0:
+        # One binarised page serves the blank-tile filter and the ink-anchored grid
+        mask = ink_mask(image, config.INK_THRESHOLD)
+    if tile_cache.enabled:
+        # Grid anchored to the ink, so a cropped or shifted re-upload lands on the same tiles
+        region = ink_region(mask)
+    windows, scale_index = plan_tiles(height, width, scales, overlap_ratio=config.SLICE_OVERLAP, region=region)
+    tiles = crop_tiles(image, windows)
+    lap('slice')
+
+    # Reuse the probe for the full-page window instead of inferring it twice
+    tile_predictions = [None] * len(windows)
+    if probe is not None:
+        for i in np.flatnonzero((windows == [0, 0, width, height]).all(axis=1)):
+            tile_predictions[i] = probe
+    skipped = 0
+    if config.SKIP_INK_RATIO > 0:
+        # Blank margins and staff spacing have nothing to detect
+        for i in np.flatnonzero(blank_tiles(mask, windows, config.SKIP_INK_RATIO)):
+            if tile_predictions[i] is None:
+                tile_predictions[i] = np.zeros((0, 6), dtype=np.float32)
+                skipped += 1
+        lap('skip_blank')
+    done = len(windows) - sum(p is None for p in tile_predictions)
+    counts['tiles'] = len(windows)
+    counts['tiles_skipped'] = skipped
+    counts['tiles_inferred'] = 0
+    counts['tiles_reused'] = 0
+    if progress is not None:
+        progress(done, len(windows))
+
+    # One scale at a time so each scale's cost is measurable; tiles of different scales differ in
+    # shape, so they would not have shared a forward pass anyway
+    names = category_names(model) if not isinstance(model, TileScheduler) else model.names
     for size in scales:
-        result = get_sliced_prediction(
-            image,
-            detection_model,
-            slice_height=size,
-            slice_width=size,
-            overlap_height_ratio=0.3, # Increased overlap for better continuity
-            overlap_width_ratio=0.3,
-            postprocess_type="NMM",
-            postprocess_match_threshold=0.5
-        )
-        all_predictions.extend(result.object_prediction_list)
-    
-    # Create a simple class to mimic SAHI result structure for app.py
-    class SimpleResult:
-        def __init__(self, predictions):
-            self.object_prediction_list = predictions
-            
-    return SimpleResult(all_predictions)
+        todo = [i for i in scale_index[size] if tile_predictions[i] is None]
+        keys = {}
+        if todo and tile_cache.enabled:
+            for i, key in zip(todo, tile_cache.keys(model, [tiles[i] for i in todo])):
+                cached = tile_cache.get(key)
+                if cached is None:
+                    keys[i] = key
+                else:
+                    tile_predictions[i] = cached
+            counts['tiles_reused'] += len(todo) - len(keys)
+            done += len(todo) - len(keys)
+            todo = list(keys)
+        if todo:
+            tile_progress = None
+            if progress is not None:
+                tile_progress = lambda n, base=done: progress(base + n, len(windows))
+            outputs, names = _infer_tiles(model, [tiles[i] for i in todo], batch_size, tile_progress)
+            for i, out in zip(todo, outputs):
+                tile_predictions[i] = out
+                if i in keys:
+                    tile_cache.put(keys[i], out)
+            done += len(todo)
+            counts['tiles_inferred'] += len(todo)
+        lap(f'infer@{size}')
+    boxes, scores, class_ids, tile_index = shift_to_page(tile_predictions, windows, height, width)
+    counts['boxes_raw'] = len(boxes)
+
+    all_boxes, all_scores, all_class_ids = [], [], []
+    for size in scales:
+        in_scale = np.isin(tile_index, scale_index[size])
+        merged = nmm(boxes[in_scale], scores[in_scale], class_ids[in_scale], match_threshold=0.5)
+        all_boxes.append(merged[0])
+        all_scores.append(merged[1])
+        all_class_ids.append(merged[2])
+        lap(f'merge@{size}')
+    boxes, scores, class_ids = np.concatenate(all_boxes), np.concatenate(all_scores), np.concatenate(all_class_ids)
+
+    if scale_merge == 'nmm' and len(scales) > 1:
+        # Same NMM as within a scale, applied to the duplicates each scale found
+        boxes, scores, class_ids = nmm(boxes, scores, class_ids, match_threshold=0.5)
+        lap('merge_cross_scale')
+    counts['boxes_merged'] = len(boxes)
+
+    return DetectionResult(boxes, scores, class_ids, names, scales)
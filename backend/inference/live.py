@@ -0,0 +1,149 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Long side of the grey frame motion is estimated on; phase correlation cost grows with area
+MOTION_SIDE = 256
+
+
+def downscale(img: np.ndarray, max_side: int) -> np.ndarray:
+    """`img` with its long side capped at `max_side` (unchanged if already smaller)."""
+    scale = max_side / max(img.shape[:2])
+    if scale >= 1:
+        return img
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+class MotionEstimator:
+    """
+    Global translation between consecutive camera frames by phase correlation on a small grey
+    copy of each frame. The peak response says how well the frames agree: it collapses when the
+    camera moves to another page, zooms or rotates, which the tracker treats as a scene change.
+    """
+
+    def __init__(self, side: int = MOTION_SIDE):
+        self.side = side
+        self._prev = None
+        self._window = None
+        self._scale = 1.0
+
+    def reset(self):
+        self._prev = None
+
+    def update(self, frame: np.ndarray) -> Optional[Tuple[float, float, float]]:
+        """(dx, dy, response) of `frame` relative to the previous one in frame pixels, or None for the first frame."""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        small = downscale(gray, self.side).astype(np.float32)
+        scale = frame.shape[1] / small.shape[1]
+        prev, self._prev = self._prev, small
+        if prev is None or prev.shape != small.shape:
+            self._window = cv2.createHanningWindow(small.shape[::-1], cv2.CV_32F)
+            self._scale = scale
+            return None
+        (dx, dy), response = cv2.phaseCorrelate(prev, small, self._window)
+        return dx * self._scale, dy * self._scale, response
+
+
+class LiveTracker:
+    """
+    Detections for one live-camera session without running the detector on every frame.
+    Boxes come from the last keyframe and follow the camera by the accumulated frame-to-frame
+    motion; a new keyframe is requested when the scene changes, the boxes have drifted far or
+    the last one is getting old. One keyframe is analysed at a time: frames seen meanwhile keep
+    a second offset, so its boxes land where the page is when the result arrives.
+    """
+
+    def __init__(self, keyframe_interval_s: float = 3.0, min_response: float = 0.2, max_drift: float = 0.25):
+        self.keyframe_interval_s = keyframe_interval_s
+        self.min_response = min_response
+        self.max_drift = max_drift
+        self.motion = MotionEstimator()
+        self.detections: List[Dict] = []
+        self.frame_size = None
+        self._offset = np.zeros(2)
+        self._anchored = False
+        self._pending = None
+        self._last_keyframe_at = None
+
+    @property
+    def keyframe_pending(self) -> bool:
+        return self._pending is not None
+
+    def observe(self, frame: np.ndarray) -> Dict:
+        """Registers a frame; returns its motion and why a keyframe is needed (or None)."""
+        height, width = frame.shape[:2]
+        resized = self.frame_size is not None and self.frame_size != (width, height)
+        self.frame_size = (width, height)
+        if resized:
+            self.motion.reset()
+        estimate = self.motion.update(frame)
+
+        reason = None
+        if estimate is None:
+            dx = dy = 0.0
+            response = None
+            if resized or not self._anchored:
+                reason = 'scene_change' if resized else 'first_frame'
+        else:
+            dx, dy, response = estimate
+            if response < self.min_response:
+                reason = 'scene_change'
+        if reason == 'scene_change':
+            # Old boxes (and a keyframe of the old scene still running) no longer match the page
+            self.detections = []
+            self._anchored = False
+            if self._pending is not None:
+                self._pending['stale'] = True
+        else:
+            self._offset += (dx, dy)
+            if self._pending is not None:
+                self._pending['offset'] += (dx, dy)
+
+        if reason is None:
+            if not self._anchored:
+                reason = 'no_detections'
+            elif np.abs(self._offset).max() > self.max_drift * max(width, height):
+                reason = 'drift'
+            elif time.monotonic() - self._last_keyframe_at > self.keyframe_interval_s:
+                reason = 'interval'
+        return {
+            'dx': round(float(dx), 2),
+            'dy': round(float(dy), 2),
+            'response': round(float(response), 3) if response is not None else None,
+            'keyframe_reason': reason,
+        }
+
+    def start_keyframe(self, frame_id: int):
+        self._pending = {'frame': frame_id, 'offset': np.zeros(2), 'stale': False}
+
+    def finish_keyframe(self, detections: Optional[List[Dict]]) -> bool:
+        """
+        Adopts a keyframe's detections (None if its analysis failed). Returns False when they
+        were dropped because the scene changed while the keyframe was being analysed.
+        """
+        pending, self._pending = self._pending, None
+        if pending is None or pending['stale'] or detections is None:
+            return False
+        self.detections = detections
+        self._offset = pending['offset']
+        self._anchored = True
+        self._last_keyframe_at = time.monotonic()
+        return True
+
+    def current(self) -> List[Dict]:
+        """The keyframe's detections moved to the latest frame; boxes that left the frame are omitted."""
+        if not self.detections:
+            return []
+        width, height = self.frame_size
+        dx, dy = self._offset
+        tracked = []
+        for det in self.detections:
+            x1, y1, x2, y2 = det['bbox']
+            box = [min(max(x1 + dx, 0), width), min(max(y1 + dy, 0), height),
+                   min(max(x2 + dx, 0), width), min(max(y2 + dy, 0), height)]
+            if box[2] - box[0] < 1 or box[3] - box[1] < 1:
+                continue
+            tracked.append({**det, 'bbox': [int(round(v)) for v in box]})
+        return tracked
@@ -0,0 +1,163 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import config
+from inference.detector import (
+    INFERENCE_BACKENDS, MODEL_PATH, close_tile_scheduler, load_detection_model, model_path_for
+)
+
+logger = logging.getLogger(__name__)
+
+# Weights the admin endpoint may switch to
+MODELS_DIR = MODEL_PATH.parent
+
+
+@lru_cache(maxsize=32)
+def _file_digest(path: str, mtime_ns: int, size: int) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def version_tag(path) -> str:
+    """'<file stem>-<content hash>': the same weights always get the same tag, new weights a new one."""
+    path = Path(path)
+    files = [path]
+    if path.suffix == '.xml':
+        # OpenVINO IR keeps the weights next to the graph
+        files.append(path.with_suffix('.bin'))
+    digests = []
+    for f in files:
+        if f.exists():
+            stat = f.stat()
+            digests.append(_file_digest(str(f), stat.st_mtime_ns, stat.st_size))
+    if not digests:
+        return f"{path.stem}-missing"
+    digest = digests[0]
+    if len(digests) > 1:
+        digest = hashlib.blake2b(''.join(digests).encode(), digest_size=16).hexdigest()
+    return f"{path.stem}-{digest[:12]}"
+
+
+class ModelVersion:
+    """One set of weights: its tag, backend and file, plus the loaded backend once loaded."""
+
+    def __init__(self, tag: str, backend: str, path: str):
+        self.tag = tag
+        self.backend = backend
+        self.path = path
+        self.model = None
+        self.loaded_at = None
+        self.load_ms = None
+
+    @property
+    def fork_safe(self) -> bool:
+        return INFERENCE_BACKENDS[self.backend].fork_safe
+
+    def spec(self) -> Tuple[str, str, str]:
+        """What a worker needs to find this version in its registry, or to load it itself."""
+        return self.tag, self.backend, self.path
+
+    def info(self) -> Dict:
+        return {
+            "version": self.tag,
+            "backend": self.backend,
+            "path": self.path,
+            "loaded_at": datetime.fromtimestamp(self.loaded_at, timezone.utc).isoformat() if self.loaded_at else None,
+            "load_ms": self.load_ms,
+        }
+
+
+class ModelRegistry:
+    """
+    Model versions loaded in this process and the one new work goes to.
+    The inference pool loads a version here once, before starting its workers: thread workers
+    predict through views of that one backend, and process workers forked afterwards inherit
+    its memory copy-on-write. Backends that cannot survive a fork (ONNX Runtime and OpenVINO
+    own thread pools) are loaded by each process worker instead.
+    """
+
+    def __init__(self):
+        self._versions: Dict[str, ModelVersion] = {}
+        self._active: Optional[str] = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def version_for(self, path=None, backend: str = None) -> ModelVersion:
+        """The registered version for these weights, or a new unloaded one (default: the configured model)."""
+        backend = backend or config.INFERENCE_BACKEND
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend: {backend}")
+        path = str(path or model_path_for(backend))
+        tag = version_tag(path)
+        with self._lock:
+            version = self._versions.get(tag)
+        return version if version is not None else ModelVersion(tag, backend, path)
+
+    def load(self, version: ModelVersion, intra_op_threads: int = None) -> ModelVersion:
+        """Loads the weights of `version` unless already loaded, and registers it."""
+        with self._load_lock:
+            with self._lock:
+                registered = self._versions.get(version.tag)
+            if registered is not None and registered.model is not None:
+                return registered
+            started = time.perf_counter()
+            model = load_detection_model(version.backend, intra_op_threads, version.path)
+            model.version = version.tag
+            version.model = model
+            version.loaded_at = time.time()
+            version.load_ms = round((time.perf_counter() - started) * 1000, 1)
+            with self._lock:
+                self._versions[version.tag] = version
+            logger.info(f"Loaded model {version.tag} ({version.backend}) in {version.load_ms} ms (pid={os.getpid()})")
+            return version
+
+    def ensure(self, spec: Tuple[str, str, str], intra_op_threads: int = None) -> ModelVersion:
+        """The loaded version for a worker: shared (thread or forked worker) or loaded here (spawned worker)."""
+        tag, backend, path = spec
+        with self._lock:
+            version = self._versions.get(tag)
+        if version is None:
+            version = ModelVersion(tag, backend, path)
+        return self.load(version, intra_op_threads)
+
+    def activate(self, version: ModelVersion):
+        with self._lock:
+            self._versions[version.tag] = version
+            self._active = version.tag
+
+    def active(self) -> Optional[ModelVersion]:
+        with self._lock:
+            return self._versions.get(self._active) if self._active else None
+
+    def active_tag(self) -> str:
+        """Tag of the model serving new requests (before the pool starts: of the configured weights)."""
+        active = self.active()
+        return active.tag if active is not None else version_tag(model_path_for())
+
+    def release(self, tag: str):
+        """Drops a retired version so its weights can be freed once no worker uses them."""
+        with self._lock:
+            if tag == self._active:
+                return
+            self._versions.pop(tag, None)
+        close_tile_scheduler(tag)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "active": self._active,
+                "loaded": [v.tag for v in self._versions.values() if v.model is not None],
+            }
+
+
+model_registry = ModelRegistry()
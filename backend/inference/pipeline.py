@@ -0,0 +1,390 @@
+import io
+import math
+import os
+import struct
+import time
+import zipfile
+from datetime import datetime
+
+import cv2
+import numpy as np
+from typing import Callable, List, Dict, Optional, Tuple, Union
+
+import compact
+import config
+from inference.detector import run_detection, tile_cache
+from inference.model_registry import model_registry
+from inference.post_process import PostProcessor
+from inference.preprocess import enhance_notation, enhance_strip, page_skew
+from inference.slicing import DetectionResult
+
+# Initialize post-processor with lower threshold for "90% accuracy" mission
+post_processor = PostProcessor(confidence_threshold=0.15, iou_threshold=0.5)
+
+
+class InvalidImageError(ValueError):
+    """Raised when uploaded bytes cannot be decoded as an image."""
+
+
+class ImageTooLargeError(InvalidImageError):
+    """Raised for pages beyond the pixel or memory limits (answered with 413)."""
+
+
+# JPEG start-of-frame markers (baseline, progressive, lossless, ...) carry the image size
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def image_dimensions(content: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) read from a PNG or JPEG header without decoding; None for other formats."""
+    if content[:8] == b'\x89PNG\r\n\x1a\n' and len(content) >= 24:
+        return struct.unpack('>II', content[16:24])
+    if content[:2] != b'\xff\xd8':
+        return None
+    i = 2
+    while i + 9 <= len(content):
+        if content[i] != 0xFF:
+            return None
+        marker = content[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+        if marker in _JPEG_SOF:
+            height, width = struct.unpack('>HH', content[i + 5:i + 9])
+            return width, height
+        i += 2 + struct.unpack('>H', content[i + 2:i + 4])[0]
+    return None
+
+
+def check_pixels(width: int, height: int):
+    if config.MAX_IMAGE_PIXELS and width * height > config.MAX_IMAGE_PIXELS:
+        raise ImageTooLargeError(
+            f"Image of {width}x{height} pixels exceeds the limit of {config.MAX_IMAGE_PIXELS} pixels"
+        )
+
+
+def decode_image(content: bytes) -> np.ndarray:
+    if not content:
+        raise InvalidImageError("Empty image file")
+    # Refuse oversized PNG/JPEG pages before allocating their pixels
+    size = image_dimensions(content)
+    if size is not None:
+        check_pixels(*size)
+    nparr = np.frombuffer(content, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        raise InvalidImageError("Invalid image file")
+    check_pixels(img.shape[1], img.shape[0])
+    return img
+
+
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff')
+# PDF pages are rendered at this resolution (notation scans are usually 200-300 dpi)
+PDF_RENDER_DPI = 200
+
+
+def split_pages(content: bytes, filename: str = '', max_pages: int = None) -> List[Tuple[str, Union[bytes, np.ndarray]]]:
+    """
+    Expands one upload into (name, page) pairs for /detect_batch: a zip of images,
+    a multi-page TIFF or PDF, or a single image. Plain images stay encoded so they
+    can be decoded in parallel later; TIFF/PDF pages come back decoded.
+    """
+    name = filename or 'upload'
+    lower = name.lower()
+    if zipfile.is_zipfile(io.BytesIO(content)):
+        pages = []
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            for info in sorted(archive.infolist(), key=lambda i: i.filename):
+                if info.is_dir() or not info.filename.lower().endswith(IMAGE_SUFFIXES + ('.pdf',)):
+                    continue
+                for page in split_pages(archive.read(info), info.filename, max_pages):
+                    pages.append(page)
+                    _check_page_count(pages, max_pages)
+        return pages
+    if content[:5] == b'%PDF-' or lower.endswith('.pdf'):
+        return _pdf_pages(content, name, max_pages)
+    if content[:4] in (b'II*\x00', b'MM\x00*'):
+        ok, frames = cv2.imdecodemulti(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+        if not ok or not frames:
+            raise InvalidImageError(f"Invalid TIFF file: {name}")
+        if len(frames) > 1:
+            _check_page_count(frames, max_pages)
+            return [(f"{name}#{i + 1}", _to_bgr(frame)) for i, frame in enumerate(frames)]
+    return [(name, content)]
+
+
+def _check_page_count(pages, max_pages: int):
+    if max_pages is not None and len(pages) > max_pages:
+        raise InvalidImageError(f"Batch exceeds {max_pages} pages")
+
+
+def _to_bgr(img: np.ndarray) -> np.ndarray:
+    if img.ndim == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    if img.shape[2] == 4:
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    return img
+
+
+def _pdf_pages(content: bytes, name: str, max_pages: int = None) -> List[Tuple[str, np.ndarray]]:
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        raise InvalidImageError("PDF input needs the optional 'pypdfium2' package")
+    try:
+        pdf = pdfium.PdfDocument(content)
+    except pdfium.PdfiumError:
+        raise InvalidImageError(f"Invalid PDF file: {name}")
+    try:
+        if max_pages is not None and len(pdf) > max_pages:
+            raise InvalidImageError(f"Batch exceeds {max_pages} pages")
+        pages = []
+        for i in range(len(pdf)):
+            rgb = pdf[i].render(scale=PDF_RENDER_DPI / 72, rev_byteorder=True).to_numpy()
+            pages.append((f"{name}#{i + 1}", cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)))
+        return pages
+    finally:
+        pdf.close()
+
+
+# Bytes per pixel held at once: the decoded BGR page (plus its downscaled copy, if any) and the
+# working set of enhance_notation (deskewed BGR, two grey planes, NL-means' padded copy)
+PAGE_BYTES_PER_PIXEL = 3
+WORKING_BYTES_PER_PIXEL = 6
+
+
+def plan_page(height: int, width: int) -> Dict:
+    """
+    Memory policy for one page: the downscale factor (DOWNSCALE_MAX_PIXELS), and the strip
+    height when the estimated peak would exceed MAX_PAGE_MEMORY_MB at full height.
+    Raises ImageTooLargeError when the page cannot fit at all.
+    """
+    check_pixels(width, height)
+    pixels = height * width
+    scale = 1.0
+    if config.DOWNSCALE_MAX_PIXELS and pixels > config.DOWNSCALE_MAX_PIXELS:
+        scale = math.sqrt(config.DOWNSCALE_MAX_PIXELS / pixels)
+    h, w = max(1, round(height * scale)), max(1, round(width * scale))
+
+    fixed = PAGE_BYTES_PER_PIXEL * (pixels + (h * w if scale < 1 else 0))
+    budget = config.MAX_PAGE_MEMORY_MB * 2 ** 20
+    strip_rows = None
+    if budget and fixed + WORKING_BYTES_PER_PIXEL * h * w > budget:
+        strip_rows = min(config.STRIP_HEIGHT, (budget - fixed) // (WORKING_BYTES_PER_PIXEL * w))
+        # A strip must hold the largest slice plus the overlap that catches glyphs on its edge
+        if strip_rows < max(config.SLICE_SCALES) + config.STRIP_OVERLAP:
+            need = (fixed + WORKING_BYTES_PER_PIXEL * w * (max(config.SLICE_SCALES) + config.STRIP_OVERLAP)) / 2 ** 20
+            raise ImageTooLargeError(
+                f"Image of {width}x{height} pixels needs about {need:.0f} MB, "
+                f"over the {config.MAX_PAGE_MEMORY_MB} MB per-page limit"
+            )
+    rows = strip_rows or h
+    return {
+        'scale': scale,
+        'size': (h, w),
+        'strip_rows': strip_rows,
+        'estimated_peak_mb': round((fixed + WORKING_BYTES_PER_PIXEL * w * rows) / 2 ** 20, 1),
+    }
+
+
+def strip_bounds(height: int, rows: int, overlap: int) -> List[Tuple[int, int, int, int]]:
+    """
+    (y0, y1, own0, own1) per strip: strips of `rows` rows overlapping by `overlap`, the last
+    one shifted up to end at the page edge. A strip owns the rows up to the middle of each
+    overlap, so a glyph seen by two strips is kept from exactly one of them.
+    """
+    starts = list(range(0, max(1, height - overlap), rows - overlap))
+    bounds = []
+    for y0 in starts:
+        y1 = min(y0 + rows, height)
+        bounds.append([max(0, y1 - rows), y1])
+        if y1 == height:
+            break
+    strips = []
+    for i, (y0, y1) in enumerate(bounds):
+        own0 = 0 if i == 0 else (y0 + bounds[i - 1][1]) // 2
+        own1 = height if i == len(bounds) - 1 else (bounds[i + 1][0] + y1) // 2
+        strips.append((y0, y1, own0, own1))
+    return strips
+
+
+def _rss_mb() -> Optional[float]:
+    # Resident set size of the whole process (Linux); other workers' pages count too
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _detect_in_strips(img: np.ndarray, model, rows: int, profile: str, timings: Dict, detect_timings: Dict,
+                      counts: Dict, rss: List, progress=None, **options) -> DetectionResult:
+    """Preprocesses and detects one horizontal strip at a time, so only one strip's buffers are alive."""
+    start = time.perf_counter()
+    # The skew is a page property; estimate it once on a small copy, then rotate each strip straight out of the page
+    angle = page_skew(img, profile, max_side=2048)
+    timings['skew_estimate'] = round((time.perf_counter() - start) * 1000, 2)
+
+    parts, scales, names = [], [], None
+    done = 0
+    for y0, y1, own0, own1 in strip_bounds(img.shape[0], rows, config.STRIP_OVERLAP):
+        strip = enhance_strip(img, angle, y0, y1, profile, timings)
+        rss.append(_rss_mb())
+        strip_timings, strip_counts = {}, {}
+        strip_progress = None
+        if progress is not None:
+            # The total grows as strips are planned
+            strip_progress = lambda n, total, base=done: progress(base + n, base + total)
+        result = run_detection(strip, model, progress=strip_progress, timings=strip_timings,
+                               counts=strip_counts, **options)
+        del strip
+        for stage, ms in strip_timings.items():
+            detect_timings[stage] = round(detect_timings.get(stage, 0.0) + ms, 2)
+        for key, n in strip_counts.items():
+            counts[key] = counts.get(key, 0) + n
+        done += strip_counts.get('tiles', 0)
+
+        boxes = result.boxes.copy()
+        boxes[:, [1, 3]] += y0
+        centers = (boxes[:, 1] + boxes[:, 3]) / 2
+        owned = (centers >= own0) & (centers < own1)
+        parts.append((boxes[owned], result.scores[owned], result.class_ids[owned]))
+        scales += [size for size in result.scales if size not in scales]
+        names = result.names
+    counts['strips'] = len(parts)
+    return DetectionResult(np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts]),
+                           np.concatenate([p[2] for p in parts]), names, scales)
+
+
+def analyze_image(img: np.ndarray, model=None, scale_policy: str = None,
+                  scale_merge: str = None, profile: str = None,
+                  progress: Callable[[int, int], None] = None) -> Tuple[List[Dict], Dict]:
+    """
+    Full CPU pipeline for one page: Clear-Ink Filter -> sliced detection -> post-processing.
+    Returns the ordered detection dicts (label, score, bbox) and pipeline info for the response.
+    `progress(done, total)` is forwarded to run_detection for tile progress.
+    info['timings'] holds the preprocessing stages and info['detect_ms'] the detection stages
+    plus post-processing, all in milliseconds; info['counts'] has the tile and box counts and
+    info['memory'] the page's memory plan (see plan_page); info['model_version'] tags the
+    weights that produced the boxes. Very large pages are downscaled and/or processed in
+    strips; boxes always refer to the pixels of `img`.
+    """
+    profile = profile or config.PREPROCESS_PROFILE
+    timings = {}
+    detect_timings = {}
+    counts = {}
+    height, width = img.shape[:2]
+    plan = plan_page(height, width)
+    rss = [_rss_mb()]
+
+    work = img
+    if plan['scale'] < 1:
+        start = time.perf_counter()
+        h, w = plan['size']
+        work = cv2.resize(img, (w, h), interpolation=cv2.INTER_AREA)
+        timings['downscale'] = round((time.perf_counter() - start) * 1000, 2)
+
+    options = {'scale_policy': scale_policy, 'scale_merge': scale_merge}
+    if plan['strip_rows'] is None:
+        # Apply Clear-Ink Filter
+        enhanced_img = enhance_notation(work, profile, timings)
+        rss.append(_rss_mb())
+
+        # Run detection
+        result = run_detection(enhanced_img, model, progress=progress, timings=detect_timings, counts=counts,
+                               **options)
+        del enhanced_img
+    else:
+        result = _detect_in_strips(work, model, plan['strip_rows'], profile, timings, detect_timings,
+                                   counts, rss, progress, **options)
+    del work
+
+    if plan['scale'] < 1:
+        # Back to the coordinates of the uploaded page
+        result.boxes = np.minimum(result.boxes / plan['scale'], [width, height, width, height])
+
+    # Minimal post-processing (just overlap removal), on the same integer boxes the API returns
+    start = time.perf_counter()
+    int_boxes = result.boxes.astype(np.int64).astype(np.float64)
+    order = post_processor.process_arrays(int_boxes, result.scores.astype(np.float64))
+    detect_timings['post_process'] = round((time.perf_counter() - start) * 1000, 2)
+
+    # Convert result to expected format
+    detections = result.take(order).to_dicts()
+    counts['detections'] = len(detections)
+
+    samples = [r for r in rss if r is not None]
+    memory = {
+        'estimated_peak_mb': plan['estimated_peak_mb'],
+        'downscale': round(plan['scale'], 4),
+        'strips': counts.get('strips', 1),
+        'process_rss_peak_mb': round(max(samples), 1) if samples else None,
+    }
+    info = {'scales': result.scales, 'profile': profile, 'timings': timings, 'detect_ms': detect_timings,
+            'counts': counts, 'memory': memory, 'names': result.names,
+            'model_version': getattr(model, 'version', None)}
+    return detections, info
+
+
+def build_result(detections: List[Dict], info: Dict) -> Dict:
+    """
+    The /detect result of analyze_image's output, in the columnar form (see compact.py) that
+    responses, the result cache and scans.db take; no per-box objects are built.
+    """
+    result = compact.columns(detections, info.get('names'))
+    result.update(
+        timestamp=datetime.utcnow().isoformat() + 'Z',
+        model_info=info.get('model_version') or "YOLOv8-Swaralipi-Direct",
+        scales_used=info['scales'],
+        preprocess_profile=info['profile'],
+        preprocess_ms=info['timings'],
+        page_memory=info.get('memory'),
+        tile_stats=_tile_stats(info.get('counts')),
+        cached=False,
+    )
+    return result
+
+
+def _tile_stats(counts):
+    if not counts or 'tiles' not in counts:
+        return None
+    return {
+        'planned': counts['tiles'],
+        'inferred': counts['tiles_inferred'],
+        'reused': counts['tiles_reused'],
+        'skipped': counts['tiles_skipped'],
+        'skip_ratio': round(counts['tiles_skipped'] / counts['tiles'], 3) if counts['tiles'] else 0.0,
+    }
+
+
+def pipeline_settings(scale_policy: str = None, scale_merge: str = None, profile: str = None) -> Dict:
+    """Everything that changes analyze_image output for the same pixels (used as the cache key)."""
+    active = model_registry.active()
+    return {
+        'backend': active.backend if active is not None else config.INFERENCE_BACKEND,
+        # Content hash of the weights, so a hot-swapped model never answers from the old one's results
+        'model_version': model_registry.active_tag(),
+        'profile': profile or config.PREPROCESS_PROFILE,
+        'scales': config.SLICE_SCALES,
+        'overlap': config.SLICE_OVERLAP,
+        'scale_policy': scale_policy or config.SCALE_POLICY,
+        'scale_merge': scale_merge or config.SCALE_MERGE,
+        'glyph_target': config.ADAPTIVE_GLYPH_TARGET_PX,
+        'scale_band': config.ADAPTIVE_SCALE_BAND,
+        'downscale_max_pixels': config.DOWNSCALE_MAX_PIXELS,
+        'page_memory_mb': config.MAX_PAGE_MEMORY_MB,
+        'strip_height': config.STRIP_HEIGHT,
+        'strip_overlap': config.STRIP_OVERLAP,
+        'tile_grid': 'ink' if tile_cache.enabled else 'page',
+        'ink_threshold': config.INK_THRESHOLD,
+        'skip_ink_ratio': config.SKIP_INK_RATIO,
+        'confidence_threshold': post_processor.confidence_threshold,
+        'iou_threshold': post_processor.iou_threshold,
+    }
+
+
+def analyze_image_bytes(content: bytes, model=None, **options) -> Tuple[List[Dict], Dict]:
+    """Worker entry point for /detect: decode the upload and run the full pipeline."""
+    return analyze_image(decode_image(content), model, **options)
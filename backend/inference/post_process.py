@@ -10,98 +10,136 @@ class PostProcessor:
         """
         Main pipeline: Filter -> Resolve Conflicts -> Sort
         """
-        # 1. Base Filter (Confidence + Geometric)
-        filtered = []
-        for d in detections:
-            # Confidence floor
-            if d['score'] < self.confidence_threshold:
-                continue
-            
-            filtered.append(d)
-        
-        if not filtered:
+        if not detections:
             return []
 
+        boxes = np.array([d['bbox'] for d in detections], dtype=np.float64).reshape(-1, 4)
+        scores = np.array([d['score'] for d in detections], dtype=np.float64)
+        order = self.process_arrays(boxes, scores)
+
+        sorted_detections = [detections[i] for i in order]
+        # Line-grouping helpers are part of the output detections
+        for d in sorted_detections:
+            bbox = d['bbox']
+            d['cy'] = (bbox[1] + bbox[3]) / 2
+            d['h'] = bbox[3] - bbox[1]
+        return sorted_detections
+
+    def process_arrays(self, boxes: np.ndarray, scores: np.ndarray) -> np.ndarray:
+        """
+        Same pipeline on (N, 4) xyxy boxes and (N,) scores.
+        Returns indices of the surviving detections in reading order.
+        """
+        # 1. Base Filter (Confidence + Geometric)
+        # Confidence floor
+        candidates = np.flatnonzero(~(scores < self.confidence_threshold))
+        if len(candidates) == 0:
+            return candidates
+
         # 2. Conflict Resolution (Non-Maximum Suppression)
         # Keep highest confidence when boxes overlap significantly
-        resolved = self._resolve_conflicts(filtered)
+        resolved = candidates[self._resolve_conflicts(boxes[candidates], scores[candidates])]
 
         # 3. Spatial Sorting (Multi-line)
-        sorted_detections = self._spatial_sort(resolved)
+        return resolved[self._spatial_sort(boxes[resolved])]
 
-        return sorted_detections
+    def _resolve_conflicts(self, boxes: np.ndarray, scores: np.ndarray) -> np.ndarray:
+        """
+        Keep higher confidence box if overlap (IoU) > threshold.
+        Returns the kept indices, highest confidence first.
+        """
+        # Sort by confidence descending (stable, like sorted(..., reverse=True))
+        order = np.argsort(-scores, kind='stable')
+        boxes = boxes[order]
+        n = len(boxes)
+
+        # Refined overlap handling:
+        # If two boxes overlap heavily (>0.5), remove the weaker one.
+        # If they overlap slightly, they might be adjacent swaras - keep both.
+        if self.iou_threshold <= 0:
+            # Even disjoint boxes suppress each other, so every pair is a candidate
+            first, second = np.triu_indices(n, k=1)
+        else:
+            first, second = self._overlapping_pairs(boxes)
+        iou = self._pairwise_iou(boxes[first], boxes[second])
+        hit = iou >= self.iou_threshold
+        first, second = first[hit], second[hit]
 
-    def _resolve_conflicts(self, detections: List[Dict]) -> List[Dict]:
-        """Keep higher confidence box if overlap (IoU) > threshold."""
-        if not detections: return []
-        
-        # Sort by confidence descending
-        dets = sorted(detections, key=lambda x: x['score'], reverse=True)
+        # Adjacency list: for each box, the weaker boxes it suppresses if kept
+        by_first = np.argsort(first, kind='stable')
+        first, second = first[by_first], second[by_first]
+        starts = np.searchsorted(first, np.arange(n + 1))
+
+        suppressed = np.zeros(n, dtype=bool)
         keep = []
-        
-        while dets:
-            best = dets.pop(0)
-            keep.append(best)
-            
-            # Refined overlap handling: 
-            # If two boxes overlap heavily (>0.5), remove the weaker one.
-            # If they overlap slightly, they might be adjacent swaras - keep both.
-            dets = [d for d in dets if self._calculate_iou(best['bbox'], d['bbox']) < self.iou_threshold]
-            
-        return keep
-
-    def _calculate_iou(self, boxA, boxB):
-        xA = max(boxA[0], boxB[0])
-        yA = max(boxA[1], boxB[1])
-        xB = min(boxA[2], boxB[2])
-        yB = min(boxA[3], boxB[3])
-        
-        interArea = max(0, xB - xA) * max(0, yB - yA)
-        boxAArea = (boxA[2] - boxA[0]) * (boxA[3] - boxA[1])
-        boxBArea = (boxB[2] - boxB[0]) * (boxB[3] - boxB[1])
-        
-        if boxAArea + boxBArea - interArea == 0:
-            return 0
-            
-        iou = interArea / float(boxAArea + boxBArea - interArea)
-        return iou
-
-    def _spatial_sort(self, detections: List[Dict]) -> List[Dict]:
+        for i in range(n):
+            if suppressed[i]:
+                continue
+            keep.append(i)
+            suppressed[second[starts[i]:starts[i + 1]]] = True
+
+        return order[np.array(keep, dtype=np.int64)]
+
+    @staticmethod
+    def _overlapping_pairs(boxes: np.ndarray):
+        """
+        All pairs (i, j), i < j in score order, whose boxes intersect with positive area.
+        Sweeps over boxes sorted by x1 so only horizontally overlapping neighbours are compared.
+        """
+        by_x = np.argsort(boxes[:, 0], kind='stable')
+        x1 = boxes[by_x, 0]
+        x2 = boxes[by_x, 2]
+        # Boxes after position p in x1 order whose left edge lies before box p's right edge
+        ends = np.searchsorted(x1, x2, side='left')
+        counts = np.maximum(ends - np.arange(len(x1)) - 1, 0)
+        if counts.sum() == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+
+        left = np.repeat(np.arange(len(x1)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        right = left + 1 + offsets
+        a, b = by_x[left], by_x[right]
+
+        overlap_y = (np.minimum(boxes[a, 3], boxes[b, 3]) - np.maximum(boxes[a, 1], boxes[b, 1])) > 0
+        a, b = a[overlap_y], b[overlap_y]
+        return np.minimum(a, b), np.maximum(a, b)
+
+    @staticmethod
+    def _pairwise_iou(boxA: np.ndarray, boxB: np.ndarray) -> np.ndarray:
+        xA = np.maximum(boxA[:, 0], boxB[:, 0])
+        yA = np.maximum(boxA[:, 1], boxB[:, 1])
+        xB = np.minimum(boxA[:, 2], boxB[:, 2])
+        yB = np.minimum(boxA[:, 3], boxB[:, 3])
+
+        interArea = np.maximum(0, xB - xA) * np.maximum(0, yB - yA)
+        boxAArea = (boxA[:, 2] - boxA[:, 0]) * (boxA[:, 3] - boxA[:, 1])
+        boxBArea = (boxB[:, 2] - boxB[:, 0]) * (boxB[:, 3] - boxB[:, 1])
+
+        union = boxAArea + boxBArea - interArea
+        return np.divide(interArea, union, out=np.zeros_like(interArea), where=union != 0)
+
+    def _spatial_sort(self, boxes: np.ndarray) -> np.ndarray:
         """
         Groups detections into lines using vertical centers (Y-center) for stability.
+        Returns the reading-order permutation of `boxes`.
         """
-        if not detections: return []
-        
-        # Add center-y for calculation
-        for d in detections:
-            bbox = d['bbox']
-            d['cy'] = (bbox[1] + bbox[3]) / 2
-            d['h'] = bbox[3] - bbox[1]
-        
+        if len(boxes) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        cy = (boxes[:, 1] + boxes[:, 3]) / 2
+        h = boxes[:, 3] - boxes[:, 1]
+
         # Sort primarily by Y-center
-        dets = sorted(detections, key=lambda x: x['cy'])
-        
+        by_cy = np.argsort(cy, kind='stable')
+
         # Calculate adaptive line height based on average swara height
-        avg_h = np.mean([d['h'] for d in dets])
+        avg_h = np.mean(h)
         line_threshold = avg_h * 0.6  # If centers are within 60% of avg height, same line
-        
-        rows = []
-        if dets:
-            current_row = [dets[0]]
-            for i in range(1, len(dets)):
-                prev = current_row[-1]
-                curr = dets[i]
-                
-                # If Y centers are close enough, they belong to the same line
-                if abs(curr['cy'] - prev['cy']) < line_threshold:
-                    current_row.append(curr)
-                else:
-                    rows.append(sorted(current_row, key=lambda x: x['bbox'][0]))
-                    current_row = [curr]
-            rows.append(sorted(current_row, key=lambda x: x['bbox'][0]))
-        
-        final_sequence = []
-        for row in rows:
-            final_sequence.extend(row)
-            
-        return final_sequence
+
+        # If consecutive Y centers are close enough, they belong to the same line
+        new_line = np.abs(np.diff(cy[by_cy])) >= line_threshold
+        row = np.concatenate([[0], np.cumsum(new_line)])
+
+        # Left to right within each line, lines top to bottom
+        return by_cy[np.lexsort((boxes[by_cy, 0], row))]
@@ -0,0 +1,51 @@
+import math
+from typing import List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+# 'fixed' runs every configured slice scale, 'components' sizes glyphs from connected
+# components of the binarized page, 'probe' sizes them from the full-page model pass.
+SCALE_POLICIES = ('fixed', 'components', 'probe')
+# 'concat' keeps each scale's merged boxes side by side, 'nmm' also merges across scales
+SCALE_MERGES = ('concat', 'nmm')
+
+_MIN_SAMPLES = 5
+
+
+def estimate_glyph_height_components(image: np.ndarray) -> Optional[float]:
+    """Median height of glyph-like ink blobs, or None when the page has too few of them."""
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)[1]
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+
+    # Skip the background label, specks, staff/bar lines and page-sized blobs
+    w = stats[1:, cv2.CC_STAT_WIDTH]
+    h = stats[1:, cv2.CC_STAT_HEIGHT]
+    area = stats[1:, cv2.CC_STAT_AREA]
+    plausible = (h >= 4) & (area >= 12) & (w < 8 * h) & (h < 8 * w) & (h < gray.shape[0] / 4)
+    if plausible.sum() < _MIN_SAMPLES:
+        return None
+    return float(np.median(h[plausible]))
+
+
+def glyph_height_from_boxes(boxes: np.ndarray) -> Optional[float]:
+    """Median height of detected boxes, or None when there are too few to trust."""
+    if len(boxes) < _MIN_SAMPLES:
+        return None
+    return float(np.median(boxes[:, 3] - boxes[:, 1]))
+
+
+def select_scales(glyph_height: float, scales: Sequence[int], input_size: int,
+                  target_px: float, band: float) -> List[int]:
+    """
+    Picks the slice size(s) that bring glyphs closest to target_px once a tile is resized to the
+    model input. Every scale within `band` (a ratio) of the best match is kept, so pages whose
+    glyphs sit between two scales still get both passes.
+    """
+    errors = {
+        size: abs(math.log(glyph_height * input_size / size / target_px))
+        for size in scales
+    }
+    best = min(errors.values())
+    return [size for size in scales if errors[size] <= best + math.log(band)]
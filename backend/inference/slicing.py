@@ -0,0 +1,197 @@
+import numpy as np
+from typing import Dict, List, Sequence, Tuple
+
+
+def get_tile_windows(height: int, width: int, size: int, overlap_ratio: float = 0.3) -> np.ndarray:
+    """
+    Tile layout identical to SAHI's get_slice_bboxes: a size x size grid stepping by
+    (1 - overlap) * size, with the last row/column pulled back inside the page.
+    Returns an (N, 4) int array of [x1, y1, x2, y2] windows.
+    """
+    overlap = int(overlap_ratio * size)
+    step = size - overlap
+
+    def starts(extent):
+        if extent <= size:
+            return np.zeros(1, dtype=np.int64)
+        positions = np.arange(0, extent - size, step, dtype=np.int64)
+        return np.append(positions, extent - size)
+
+    ys = starts(height)
+    xs = starts(width)
+    y1, x1 = np.meshgrid(ys, xs, indexing='ij')
+    x1 = x1.ravel()
+    y1 = y1.ravel()
+    x2 = np.minimum(x1 + size, width)
+    y2 = np.minimum(y1 + size, height)
+    return np.stack([x1, y1, x2, y2], axis=1)
+
+
+def plan_tiles(height: int, width: int, scales: Sequence[int], overlap_ratio: float = 0.3,
+               include_full_image: bool = True,
+               region: Tuple[int, int, int, int] = None) -> Tuple[np.ndarray, Dict[int, np.ndarray]]:
+    """
+    Computes the tile windows of every scale up front so they can be inferred in shared batches.
+    Windows that several scales have in common (e.g. the full-page standard prediction SAHI
+    adds to every sliced run) are inferred only once.
+    `region` (x1, y1, x2, y2) lays the slice grid over that part of the page instead of the
+    whole page; the full-page window still covers everything.
+    Returns (unique windows, {scale: indices into the unique windows}).
+    """
+    rx1, ry1, rx2, ry2 = region or (0, 0, width, height)
+    per_scale = {}
+    for size in scales:
+        windows = get_tile_windows(ry2 - ry1, rx2 - rx1, size, overlap_ratio) + [rx1, ry1, rx1, ry1]
+        if include_full_image and len(windows) > 1:
+            windows = np.vstack([windows, [[0, 0, width, height]]])
+        per_scale[size] = windows
+
+    stacked = np.vstack(list(per_scale.values()))
+    unique, inverse = np.unique(stacked, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    scale_index = {}
+    start = 0
+    for size, windows in per_scale.items():
+        scale_index[size] = inverse[start:start + len(windows)]
+        start += len(windows)
+    return unique, scale_index
+
+
+def crop_tiles(image: np.ndarray, windows: np.ndarray) -> List[np.ndarray]:
+    """Views into the page for each window (no pixel copies)."""
+    return [image[y1:y2, x1:x2] for x1, y1, x2, y2 in windows]
+
+
+def shift_to_page(tile_predictions: List[np.ndarray], windows: np.ndarray,
+                  height: int, width: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Maps per-tile (M, 6) [x1, y1, x2, y2, score, class_id] predictions to page coordinates.
+    Returns (boxes, scores, class_ids, tile_index) with invalid (empty) boxes dropped.
+    """
+    counts = np.array([len(p) for p in tile_predictions], dtype=np.int64)
+    if counts.sum() == 0:
+        return (np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32),
+                np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+    preds = np.concatenate([p for p in tile_predictions if len(p)], axis=0).astype(np.float32)
+    tile_index = np.repeat(np.arange(len(windows)), counts)
+    offsets = np.tile(windows[tile_index, :2], 2).astype(np.float32)
+
+    boxes = np.clip(preds[:, :4], 0, None) + offsets
+    np.clip(boxes[:, 0::2], 0, width, out=boxes[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, height, out=boxes[:, 1::2])
+
+    valid = (boxes[:, 0] < boxes[:, 2]) & (boxes[:, 1] < boxes[:, 3])
+    return boxes[valid], preds[valid, 4], preds[valid, 5].astype(np.int64), tile_index[valid]
+
+
+def nmm(boxes: np.ndarray, scores: np.ndarray, class_ids: np.ndarray,
+        match_threshold: float = 0.5, class_agnostic: bool = False):
+    """
+    Non-Maximum Merging with the IOS (intersection over smaller area) metric, ported from
+    SAHI's NMMPostprocess. Merging is transitive: each box, strongest first, claims the weaker
+    unclaimed boxes it matches for its keeper (itself, or the box that claimed it). Every keeper
+    then absorbs its claimed boxes in the order they were claimed, each one only if it still matches the grown
+    box (union box, max score, category of the stronger box); claimed boxes that do not are dropped.
+    Returns merged (boxes, scores, class_ids) ordered by descending score.
+    """
+    if len(boxes) == 0:
+        return boxes, scores, class_ids
+
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    # Score descending; ties by coordinates, as SAHI orders them
+    order = np.lexsort((y2, x2, y1, x1, -scores))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+
+    keep_to_merge = {}
+    # Boxes of different classes never merge, so each class is matched on its own (as SAHI batches it)
+    groups = [order] if class_agnostic else [order[class_ids[order] == c] for c in np.unique(class_ids)]
+    for group in groups:
+        keep_to_merge.update(_keep_to_merge(boxes[group], scores[group], areas[group], group, match_threshold))
+
+    merged_boxes, merged_scores, merged_classes = [], [], []
+    for keep in sorted(keep_to_merge, key=rank.__getitem__):
+        claimed = keep_to_merge[keep]
+        box, score, class_id = boxes[keep].copy(), scores[keep], class_ids[keep]
+        for j in claimed:
+            area = (box[2] - box[0]) * (box[3] - box[1])
+            if _ios(box, boxes[j:j + 1], area, areas[j:j + 1])[0] < match_threshold:
+                continue
+            box[:2] = np.minimum(box[:2], boxes[j, :2])
+            box[2:] = np.maximum(box[2:], boxes[j, 2:])
+            if scores[j] >= score:
+                class_id = class_ids[j]
+            score = max(score, scores[j])
+        merged_boxes.append(box)
+        merged_scores.append(score)
+        merged_classes.append(class_id)
+
+    return (np.array(merged_boxes, dtype=boxes.dtype).reshape(-1, 4),
+            np.array(merged_scores, dtype=scores.dtype), np.array(merged_classes, dtype=class_ids.dtype))
+
+
+def _keep_to_merge(boxes: np.ndarray, scores: np.ndarray, areas: np.ndarray, indices: np.ndarray,
+                   match_threshold: float):
+    """
+    SAHI's transitive claiming over boxes given in merge order, `indices` being their input
+    indices: keeper -> input indices of the boxes it will try to absorb, in claiming order.
+    """
+    merge_to_keep = np.full(len(boxes), -1, dtype=np.int64)
+    keep_to_merge = {}
+    for i in range(len(boxes)):
+        if merge_to_keep[i] < 0:
+            merge_to_keep[i] = i
+            keep_to_merge[int(indices[i])] = []
+        keeper = merge_to_keep[i]
+
+        free = np.flatnonzero(merge_to_keep[i + 1:] < 0) + i + 1
+        matched = free[_ios(boxes[i], boxes[free], areas[i], areas[free]) >= match_threshold]
+        # Later boxes are weaker, or equal-scored and sorting after i by coordinates; i may claim
+        # those only when their coordinates are equal to its own
+        tied = matched[scores[matched] == scores[i]]
+        if len(tied):
+            matched = np.setdiff1d(matched, tied[(boxes[tied] != boxes[i]).any(axis=1)])
+        if len(matched):
+            merge_to_keep[matched] = keeper
+            # In input order per claiming box, like SAHI's np.where over the class
+            keep_to_merge[int(indices[keeper])].extend(np.sort(indices[matched]).tolist())
+    return keep_to_merge
+
+
+def _ios(box: np.ndarray, others: np.ndarray, area, other_areas: np.ndarray) -> np.ndarray:
+    """Intersection over the smaller area of `box` against each of `others`."""
+    iw = np.minimum(box[2], others[:, 2]) - np.maximum(box[0], others[:, 0])
+    ih = np.minimum(box[3], others[:, 3]) - np.maximum(box[1], others[:, 1])
+    inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+    smaller = np.minimum(area, other_areas)
+    return np.divide(inter, smaller, out=np.zeros_like(inter), where=smaller > 0)
+
+
+class DetectionResult:
+    """Page-level detections held as parallel NumPy arrays."""
+
+    def __init__(self, boxes: np.ndarray, scores: np.ndarray, class_ids: np.ndarray, names: Dict[int, str],
+                 scales: List[int] = None):
+        self.boxes = boxes
+        self.scores = scores
+        self.class_ids = class_ids
+        self.names = names
+        # Slice sizes that actually ran for this page
+        self.scales = scales or []
+
+    def __len__(self):
+        return len(self.scores)
+
+    def take(self, indices: np.ndarray) -> 'DetectionResult':
+        return DetectionResult(self.boxes[indices], self.scores[indices], self.class_ids[indices],
+                               self.names, self.scales)
+
+    def to_dicts(self) -> List[Dict]:
+        bboxes = self.boxes.astype(np.int64).tolist()
+        return [
+            {'label': self.names[int(c)], 'class_id': int(c), 'score': float(s), 'bbox': b}
+            for b, s, c in zip(bboxes, self.scores.tolist(), self.class_ids.tolist())
+        ]
@@ -0,0 +1,124 @@
+import hashlib
+import itertools
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Margin kept around the ink when the tile grid is anchored to it
+INK_MARGIN = 8
+
+
+def ink_mask(image: np.ndarray, threshold: int) -> np.ndarray:
+    """Dark pixels of an enhanced page (uint8, 1 = ink); the basis for blank tiles and the ink region."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    return (gray < threshold).view(np.uint8)
+
+
+def ink_region(mask: np.ndarray, margin: int = INK_MARGIN) -> Optional[Tuple[int, int, int, int]]:
+    """(x1, y1, x2, y2) around all ink plus `margin`, or None for a blank page."""
+    x, y, w, h = cv2.boundingRect(mask)
+    if w == 0 or h == 0:
+        return None
+    height, width = mask.shape
+    return max(0, x - margin), max(0, y - margin), min(width, x + w + margin), min(height, y + h + margin)
+
+
+def blank_tiles(mask: np.ndarray, windows: np.ndarray, min_ink_ratio: float) -> np.ndarray:
+    """
+    Boolean per window: True when less than `min_ink_ratio` of its pixels are ink, i.e. margin
+    or staff spacing with nothing a glyph could be made of.
+    """
+    blank = np.zeros(len(windows), dtype=bool)
+    for i, (x1, y1, x2, y2) in enumerate(windows):
+        area = (x2 - x1) * (y2 - y1)
+        blank[i] = np.count_nonzero(mask[y1:y2, x1:x2]) < min_ink_ratio * area
+    return blank
+
+
+class TileCache:
+    """
+    Per-process LRU of detector outputs keyed by tile content, so a re-uploaded page only
+    re-infers the tiles that changed. Keys hash the enhanced tile's pixels, exactly what the
+    detector sees, so a hit always returns the boxes the model would give. Boxes are stored in
+    tile coordinates, so a hit on a tile that moved (crop or translation) is reprojected by its
+    new window.
+    Entries are scoped to the model version (or weights file) and thresholds that produced
+    them, so workers serving the same model share them and a swapped-in model starts clean;
+    models without a file are scoped to the object.
+    """
+
+    def __init__(self, max_entries: int = 0):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_tokens = weakref.WeakKeyDictionary()
+        self._token_counter = itertools.count()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _token(self, model):
+        version = getattr(model, 'version', None)
+        if version is not None:
+            # Registry tags already hash the weights' content
+            return (f"{type(model).__name__}:{version}:"
+                    f"{getattr(model, 'confidence_threshold', None)}:{getattr(model, 'image_size', None)}")
+        path = getattr(model, 'model_path', None)
+        if path is not None:
+            # The mtime changes when the weights are replaced, so a reloaded model never sees old boxes
+            mtime = os.path.getmtime(path) if os.path.exists(path) else None
+            return (f"{type(model).__name__}:{path}:{mtime}:"
+                    f"{getattr(model, 'confidence_threshold', None)}:{getattr(model, 'image_size', None)}")
+        # Otherwise a fresh token per model object
+        with self._lock:
+            token = self._model_tokens.get(model)
+            if token is None:
+                token = next(self._token_counter)
+                self._model_tokens[model] = token
+            return token
+
+    def keys(self, model, tiles):
+        token = self._token(model)
+        keys = []
+        for tile in tiles:
+            h = hashlib.blake2b(digest_size=16)
+            h.update(f"{token}:{tile.shape}:{tile.dtype}".encode())
+            h.update(np.ascontiguousarray(tile).data)
+            keys.append(h.digest())
+        return keys
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            boxes = self._entries.get(key)
+            if boxes is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return boxes
+
+    def put(self, key: bytes, boxes: np.ndarray):
+        with self._lock:
+            self._entries[key] = boxes
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,396 @@
+import asyncio
+import gc
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor, ThreadPoolExecutor
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Each worker thread (or process) keeps its own model here
+_worker_state = threading.local()
+
+
+def _settle(future: Future, result=None, error: BaseException = None):
+    # The caller may cancel between any cancelled() check and here; its result is then unwanted
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+class PoolSaturated(Exception):
+    """Raised when every worker is busy and the admission queue is full."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+
+class SwapInProgress(Exception):
+    """Raised when a model swap is requested while another is running or the pool is still starting."""
+
+
+# Forked workers inherit the parent's loaded weights; without fork every process loads its own
+_CAN_FORK = 'fork' in multiprocessing.get_all_start_methods()
+
+
+def _init_worker(spec, torch_threads: int = 0):
+    from inference.detector import get_tile_scheduler
+    from inference.model_registry import model_registry
+
+    _worker_state.error = None
+    _worker_state.warmup_ms = None
+    _worker_state.version = spec[0]
+    started = time.perf_counter()
+    try:
+        if torch_threads and spec[1] == 'torch':
+            # Process workers would otherwise each spin up one torch thread per core
+            import torch
+            torch.set_num_threads(torch_threads)
+        # Thread workers and forked processes find the weights already loaded by the pool;
+        # spawned processes (or fork-unsafe backends) load their own copy here
+        version = model_registry.ensure(spec, intra_op_threads=torch_threads or None)
+        if config.MICRO_BATCHING:
+            # Workers only preprocess; their tiles share forward passes through the scheduler
+            _worker_state.model = get_tile_scheduler(version.model)
+        else:
+            _worker_state.model = version.model.worker_view()
+    except Exception as e:
+        # Raising here would break the whole executor; _warm_up reports it instead
+        logger.error(f"Loading the detection model failed: {e}")
+        _worker_state.model = None
+        _worker_state.error = f"{type(e).__name__}: {e}"
+    _worker_state.load_ms = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(f"Inference worker ready (pid={os.getpid()}, thread={threading.current_thread().name}, "
+                f"model={spec[0]})")
+
+
+def _warm_up():
+    """Runs one synthetic tile through this worker's model so the first real scan is not the slow one."""
+    from inference.detector import warm_up
+
+    if _worker_state.error:
+        raise RuntimeError(_worker_state.error)
+    if _worker_state.warmup_ms is None:
+        started = time.perf_counter()
+        warm_up(_worker_state.model)
+        _worker_state.warmup_ms = round((time.perf_counter() - started) * 1000, 1)
+    return {
+        'worker': f"{os.getpid()}/{threading.current_thread().name}",
+        'version': _worker_state.version,
+        'load_ms': _worker_state.load_ms,
+        'warmup_ms': _worker_state.warmup_ms,
+    }
+
+
+def _run_job(fn, args, kwargs, submitted_at: float):
+    # Wall-clock time so the wait can be measured across process boundaries
+    started_at = time.time()
+    result = fn(*args, model=_worker_state.model, **kwargs)
+    return result, started_at - submitted_at, time.time() - started_at
+
+
+class InferencePool:
+    """
+    Fixed pool of inference workers behind a bounded admission queue. The weights are loaded
+    once into model_registry and shared by the workers (see ModelRegistry); with micro-batching
+    the workers share the TileScheduler instead. Jobs are called as fn(*args, model=..., **kwargs).
+    swap_model() replaces the model without dropping work: new jobs go to a fresh, warmed-up set
+    of workers while the old set finishes what it already accepted.
+    """
+
+    def __init__(self, workers: int = 2, mode: str = 'thread', max_queue: int = 8, retry_after: int = 2):
+        if mode not in ('thread', 'process'):
+            raise ValueError(f"Unknown worker mode: {mode}")
+        self.workers = max(1, workers)
+        self.mode = mode
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+
+        self._executor = None
+        self._version = None
+        # Jobs accepted while the first model version is still loading
+        self._pending = []
+        self._load_error = None
+        self._lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._swaps = 0
+        self._waits = deque(maxlen=256)
+        self._service_times = deque(maxlen=256)
+        self._started_at = None
+        self._ready_at = None
+        self._ready_workers = {}
+        self._warmup_errors = []
+
+    def start(self, version=None):
+        """Loads `version` (default: the configured weights) and starts the workers, in the background."""
+        with self._lock:
+            if self._started_at is not None:
+                return
+            self._started_at = time.monotonic()
+        if self.mode == 'process' and config.MICRO_BATCHING:
+            logger.warning("Micro-batching only shares batches between workers of one process; use thread workers")
+        # Model loading and warm-up happen off the startup path; readiness() tracks their progress
+        threading.Thread(target=self._open_first, args=(version,), name='inference-loader', daemon=True).start()
+
+    def _open_first(self, version):
+        from inference.model_registry import model_registry
+
+        try:
+            version = version or model_registry.version_for()
+            executor, warm_ups = self._open(version)
+        except Exception as e:
+            logger.error(f"Loading the detection model failed: {e}")
+            with self._lock:
+                self._load_error = f"{type(e).__name__}: {e}"
+                pending, self._pending = self._pending, []
+                self._in_flight -= len(pending)
+                self._failed += len(pending)
+            for outer, *_ in pending:
+                _settle(outer, error=RuntimeError(self._load_error))
+            return
+
+        model_registry.activate(version)
+        with self._lock:
+            self._executor, self._version = executor, version
+            pending, self._pending = self._pending, []
+            # Callers that gave up while the model loaded are not run at all
+            self._in_flight -= sum(outer.cancelled() for outer, *_ in pending)
+            inners = [(outer, executor.submit(_run_job, *job)) for outer, *job in pending if not outer.cancelled()]
+        for warm_up in warm_ups:
+            warm_up.add_done_callback(self._on_warm_up)
+        for outer, inner in inners:
+            self._link(inner, outer)
+        logger.info(f"Inference pool started: {self.workers} {self.mode} workers, queue size {self.max_queue}, "
+                    f"model {version.tag}")
+
+    def _open(self, version):
+        """
+        New executor whose workers serve `version`, plus one warm-up future per worker.
+        Shared weights are loaded here, before any worker exists, so workers never load them again.
+        """
+        from inference.model_registry import model_registry
+
+        shared = self.mode == 'thread' or (version.fork_safe and _CAN_FORK)
+        if shared:
+            model_registry.load(version)
+        if self.mode == 'thread':
+            executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix='inference', initializer=_init_worker,
+                initargs=(version.spec(),)
+            )
+            return executor, [executor.submit(_warm_up) for _ in range(self.workers)]
+
+        torch_threads = max(1, (os.cpu_count() or 1) // self.workers)
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context('fork') if shared else None,
+            initializer=_init_worker, initargs=(version.spec(), torch_threads)
+        )
+        if not shared:
+            return executor, [executor.submit(_warm_up) for _ in range(self.workers)]
+        # Objects the collector never visits keep their pages shared with the children;
+        # the first submit forks every worker, after which the parent can collect normally again
+        gc.freeze()
+        try:
+            return executor, [executor.submit(_warm_up) for _ in range(self.workers)]
+        finally:
+            gc.unfreeze()
+
+    def swap_model(self, version, timeout: float = None) -> dict:
+        """
+        Hot-swaps to `version`: loads it, starts and warms up a new set of workers, then sends
+        new jobs there. Jobs running or queued on the old workers finish on the old model; those
+        workers then exit and the old weights are released. Blocks until the switch (or failure).
+        """
+        from inference.model_registry import model_registry
+
+        if not self._swap_lock.acquire(blocking=False):
+            raise SwapInProgress("Another model swap is in progress")
+        try:
+            with self._lock:
+                if self._executor is None:
+                    raise SwapInProgress("The inference pool has not finished starting")
+            started = time.perf_counter()
+            executor, warm_ups = self._open(version)
+            ready, errors = {}, []
+            for warm_up in warm_ups:
+                try:
+                    info = warm_up.result(timeout)
+                    ready[info['worker']] = info
+                except Exception as e:
+                    errors.append(f"{type(e).__name__}: {e}")
+            if errors:
+                executor.shutdown(wait=False, cancel_futures=True)
+                model_registry.release(version.tag)
+                raise RuntimeError(f"Model {version.tag} failed to warm up: {errors[-1]}")
+
+            with self._lock:
+                old_executor, old_version = self._executor, self._version
+                self._executor, self._version = executor, version
+                self._ready_workers = ready
+                self._warmup_errors = []
+                self._swaps += 1
+            model_registry.activate(version)
+            threading.Thread(target=self._retire, args=(old_executor, old_version),
+                             name='inference-retire', daemon=True).start()
+            swap_ms = round((time.perf_counter() - started) * 1000, 1)
+            logger.info(f"Swapped model {old_version.tag} -> {version.tag} in {swap_ms} ms")
+            return {"previous": old_version.tag, "active": version.tag, "swap_ms": swap_ms}
+        finally:
+            self._swap_lock.release()
+
+    def _retire(self, executor, version):
+        # Runs the jobs the old workers already accepted, then lets them exit
+        executor.shutdown(wait=True)
+        from inference.model_registry import model_registry
+
+        model_registry.release(version.tag)
+        gc.collect()
+        logger.info(f"Retired model {version.tag}")
+
+    def _on_warm_up(self, future: Future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        with self._lock:
+            if error is not None:
+                self._warmup_errors.append(str(error))
+                return
+            info = future.result()
+            self._ready_workers[info['worker']] = info
+            if self._ready_at is None:
+                self._ready_at = time.monotonic()
+                logger.info(f"Inference pool ready after {self._ready_at - self._started_at:.1f}s "
+                            f"(load {info['load_ms']} ms, warm-up {info['warmup_ms']} ms)")
+
+    @property
+    def ready(self) -> bool:
+        return self._ready_at is not None
+
+    def readiness(self) -> dict:
+        """Model load state for /readyz: ready once at least one worker has loaded and warmed up."""
+        with self._lock:
+            workers = list(self._ready_workers.values())
+            if workers:
+                state = 'ready'
+            elif self._load_error or (self._warmup_errors and len(self._warmup_errors) >= self.workers):
+                state = 'failed'
+            elif self._started_at is None:
+                state = 'stopped'
+            else:
+                state = 'loading'
+            return {
+                "state": state,
+                "backend": self._version.backend if self._version else config.INFERENCE_BACKEND,
+                "version": self._version.tag if self._version else None,
+                "swaps": self._swaps,
+                "workers": self.workers,
+                "workers_ready": len(workers),
+                "load_ms": max((w['load_ms'] for w in workers), default=None),
+                "warmup_ms": max((w['warmup_ms'] for w in workers), default=None),
+                "ready_after_s": round(self._ready_at - self._started_at, 2) if self._ready_at else None,
+                "errors": ([self._load_error] if self._load_error else []) + self._warmup_errors[-3:],
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            pending, self._pending = self._pending, []
+            self._started_at = None
+        for outer, *_ in pending:
+            outer.cancel()
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._in_flight - self.workers)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Queues a job, raising PoolSaturated instead of waiting when the queue is full."""
+        if self._started_at is None:
+            self.start()
+        outer = Future()
+        with self._lock:
+            if self._load_error:
+                raise RuntimeError(self._load_error)
+            if self._in_flight >= self.workers + self.max_queue:
+                self._rejected += 1
+                raise PoolSaturated(self._estimate_retry_after())
+            self._in_flight += 1
+            if self._executor is None:
+                # Dispatched by _open_first once the workers exist
+                self._pending.append((outer, fn, args, kwargs, time.time()))
+                return outer
+            # Under the lock, so a concurrent swap cannot retire this executor in between
+            inner = self._executor.submit(_run_job, fn, args, kwargs, time.time())
+        self._link(inner, outer)
+        return outer
+
+    async def run(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def _link(self, inner: Future, outer: Future):
+        inner.add_done_callback(lambda f: self._on_done(f, outer))
+        # A caller that gives up (request timed out, client went away) also drops the job if it
+        # has not started yet
+        outer.add_done_callback(lambda f: inner.cancel() if f.cancelled() else None)
+
+    def _on_done(self, inner: Future, outer: Future):
+        with self._lock:
+            self._in_flight -= 1
+        if inner.cancelled() or outer.cancelled():
+            # Nobody waits for the result any more (or the executor was shut down under the job)
+            outer.cancel()
+            return
+        error = inner.exception()
+        if error is not None:
+            with self._lock:
+                self._failed += 1
+            _settle(outer, error=error)
+            return
+        result, wait, service = inner.result()
+        with self._lock:
+            self._completed += 1
+            self._waits.append(wait)
+            self._service_times.append(service)
+        _settle(outer, result)
+
+    def _estimate_retry_after(self) -> int:
+        # Time for the current queue to drain at the recent per-job service time
+        if not self._service_times:
+            return self.retry_after
+        avg_service = sum(self._service_times) / len(self._service_times)
+        drain = avg_service * (self.queue_depth + 1) / self.workers
+        return max(self.retry_after, math.ceil(drain))
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                "mode": self.mode,
+                "model_version": self._version.tag if self._version else None,
+                "workers": self.workers,
+                "in_flight": self._in_flight,
+                "queue_depth": self.queue_depth,
+                "queue_capacity": self.max_queue,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(1000 * sum(waits) / len(waits), 1) if waits else 0.0,
+                "p95_wait_ms": round(1000 * waits[math.ceil(0.95 * len(waits)) - 1], 1) if waits else 0.0,
+            }
@@ -0,0 +1,228 @@
+import argparse
+import os
+import signal
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import datetime
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import config
+import database
+from inference.model_registry import model_registry
+from inference.pipeline import (
+    IMAGE_SUFFIXES, InvalidImageError, analyze_image, build_result, decode_image, split_pages
+)
+from inference.worker_pool import InferencePool
+
+INGEST_SUFFIXES = IMAGE_SUFFIXES + ('.pdf',)
+PROGRESS_EVERY_S = 5.0
+
+
+def analyze_file(path: str, name: str, model=None, **options):
+    """
+    Worker side: every page of one file through the pipeline (no HTTP, no JSON).
+    Returns (page name, detections, info, error) per page; pages that cannot be read carry the error.
+    """
+    try:
+        with open(path, 'rb') as f:
+            pages = split_pages(f.read(), name)
+    except (OSError, InvalidImageError) as e:
+        return [(name, None, None, str(e))]
+    results = []
+    for page_name, page in pages:
+        try:
+            img = decode_image(page) if isinstance(page, bytes) else page
+            detections, info = analyze_image(img, model, **options)
+            results.append((page_name, detections, info, None))
+        except InvalidImageError as e:
+            results.append((page_name, None, None, str(e)))
+    return results
+
+
+def _create_checkpoint_table(conn):
+    # Progress lives next to the scans it produced and is committed in the same transaction,
+    # so a file is either fully stored and marked done or neither
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS ingest_files (
+            path TEXT PRIMARY KEY,
+            size INTEGER,
+            mtime_ns INTEGER,
+            status TEXT,
+            pages INTEGER,
+            scan_ids TEXT,
+            error TEXT,
+            finished_at TEXT
+        )
+        '''
+    )
+    conn.commit()
+
+
+def find_files(root: Path):
+    return sorted(p for p in root.rglob('*') if p.is_file() and p.suffix.lower() in INGEST_SUFFIXES)
+
+
+def pending_files(conn, files, retry_failed: bool):
+    """
+    Files without a checkpoint row (or with a failed one when retrying), and files whose size
+    or modification time changed since their row was written.
+    """
+    finished = {path: (status, size, mtime_ns) for path, status, size, mtime_ns
+                in conn.execute('SELECT path, status, size, mtime_ns FROM ingest_files')}
+    skip = {'done', 'partial'} if retry_failed else {'done', 'partial', 'failed'}
+    pending = []
+    for p in files:
+        status, size, mtime_ns = finished.get(str(p.resolve()), (None, None, None))
+        stat = p.stat()
+        if status not in skip or (size, mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            pending.append(p)
+    return pending
+
+
+def commit(conn, finished) -> int:
+    """
+    Stores the scans of finished files and their checkpoint rows in one transaction. Each file
+    carries the stat taken when it was queued, so a file changed while it was being analysed
+    does not match its row and is picked up again by the next run.
+    """
+    pages = 0
+    with conn:
+        for path, stat, pages_out in finished:
+            results, errors = [], []
+            for page_name, detections, info, error in pages_out:
+                if error is not None:
+                    errors.append(f"{page_name}: {error}")
+                    continue
+                result = build_result(detections, info)
+                result['source'] = page_name
+                results.append(result)
+            scan_ids = database.insert_scans(conn, results)
+            status = 'done' if not errors else ('partial' if scan_ids else 'failed')
+            conn.execute(
+                'INSERT OR REPLACE INTO ingest_files VALUES (?,?,?,?,?,?,?,?)',
+                (str(path.resolve()), stat.st_size, stat.st_mtime_ns, status, len(pages_out),
+                 ','.join(map(str, scan_ids)), '; '.join(errors) or None, datetime.utcnow().isoformat() + 'Z')
+            )
+            pages += len(pages_out)
+    return pages
+
+
+def _format_eta(seconds: float) -> str:
+    if seconds == float('inf'):
+        return '?'
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Analyse a directory tree of notation pages into scans.db without the HTTP server. "
+                    "Interrupted runs resume where they stopped."
+    )
+    parser.add_argument('root', help="Directory of page images / PDFs (searched recursively)")
+    parser.add_argument('--db', default=database.DB_PATH)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument('--backend', default=config.INFERENCE_BACKEND, choices=['torch', 'onnx', 'openvino'])
+    parser.add_argument('--weights', help="Weights file (default: the backend's configured model)")
+    parser.add_argument('--profile', default=config.PREPROCESS_PROFILE)
+    parser.add_argument('--scale-policy', default=config.SCALE_POLICY)
+    parser.add_argument('--commit-every', type=int, default=64, help="Files per database transaction")
+    parser.add_argument('--retry-failed', action='store_true', help="Analyse files that failed in earlier runs again")
+    parser.add_argument('--limit', type=int, help="Stop after this many files")
+    args = parser.parse_args()
+
+    root = Path(args.root)
+    if not root.is_dir():
+        print(f"Not a directory: {root}")
+        sys.exit(1)
+
+    database.DB_PATH = args.db
+    conn = database.get_connection()
+    _create_checkpoint_table(conn)
+
+    files = find_files(root)
+    todo = pending_files(conn, files, args.retry_failed)
+    print(f"{len(files)} files under {root}, {len(files) - len(todo)} already ingested, {len(todo)} to go")
+    if args.limit is not None:
+        todo = todo[:args.limit]
+    if not todo:
+        return
+
+    # Workers inherit an ignored SIGINT, so Ctrl-C only reaches this process, which then
+    # stores the files already finished before exiting
+    default_sigint = signal.signal(signal.SIGINT, signal.SIG_IGN)
+    pool = InferencePool(workers=args.workers, mode='process', max_queue=args.workers)
+    pool.start(model_registry.version_for(args.weights, args.backend))
+    while not pool.ready:
+        state = pool.readiness()
+        if state['state'] == 'failed':
+            print(f"Model failed to load: {state['errors']}")
+            sys.exit(1)
+        time.sleep(0.2)
+    signal.signal(signal.SIGINT, default_sigint)
+    print(f"Model {pool.readiness()['version']} ready on {args.workers} workers")
+
+    options = {'profile': args.profile, 'scale_policy': args.scale_policy}
+    capacity = pool.workers + pool.max_queue
+    queue = iter(todo)
+    in_flight = {}
+    finished = []
+    files_done = pages_done = failed = 0
+    started = last_report = time.monotonic()
+    interrupted = False
+    try:
+        while True:
+            for path in queue:
+                future = pool.submit(analyze_file, str(path), str(path.relative_to(root)), **options)
+                in_flight[future] = (path, path.stat())
+                if len(in_flight) >= capacity:
+                    break
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, stat = in_flight.pop(future)
+                try:
+                    pages_out = future.result()
+                except Exception as e:
+                    pages_out = [(str(path.relative_to(root)), None, None, f"{type(e).__name__}: {e}")]
+                failed += all(error is not None for *_, error in pages_out)
+                finished.append((path, stat, pages_out))
+            if len(finished) >= args.commit_every:
+                pages_done += commit(conn, finished)
+                files_done += len(finished)
+                finished = []
+
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_EVERY_S:
+                last_report = now
+                files_seen = files_done + len(finished)
+                pages_seen = pages_done + sum(len(pages_out) for *_, pages_out in finished)
+                rate = files_seen / (now - started)
+                eta = (len(todo) - files_seen) / rate if rate else float('inf')
+                print(f"{files_seen}/{len(todo)} files  {pages_seen / (now - started):.2f} pages/s  "
+                      f"{failed} failed  ETA {_format_eta(eta)}", flush=True)
+    except KeyboardInterrupt:
+        interrupted = True
+        print("Interrupted; storing finished files. Run the same command again to resume.")
+    finally:
+        if finished:
+            pages_done += commit(conn, finished)
+            files_done += len(finished)
+        pool.shutdown()
+        conn.close()
+
+    elapsed = time.monotonic() - started
+    print(f"{'Stopped after' if interrupted else 'Ingested'} {files_done} files / {pages_done} pages in "
+          f"{elapsed:.1f}s ({pages_done / elapsed:.2f} pages/s), {failed} failed")
+    if interrupted:
+        sys.exit(130)
+
+
+if __name__ == '__main__':
+    main()
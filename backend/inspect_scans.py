@@ -1,15 +1,7 @@
-import sqlite3
-import json
+from database import get_history
 
-conn = sqlite3.connect('scans.db')
-cursor = conn.cursor()
-cursor.execute('SELECT timestamp, result_json FROM scans ORDER BY timestamp DESC LIMIT 10')
-rows = cursor.fetchall()
-
-for ts, res_json in rows:
-    data = json.loads(res_json)
-    detections = data.get('detections', [])
-    print(f"\n{ts}:")
+for scan in get_history(10):
+    detections = scan['result'].get('detections', [])
+    print(f"\n{scan['timestamp']}:")
     for d in detections:
         print(f"  - Label: '{d.get('label')}' | Symbol: '{d.get('symbol')}'")
-conn.close()
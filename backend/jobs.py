@@ -0,0 +1,402 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+from database import DB_PATH
+
+logger = logging.getLogger(__name__)
+
+# Kept next to scans.db so both live (and get backed up) together
+JOBS_DB_PATH = os.path.join(os.path.dirname(DB_PATH), 'jobs.db')
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+# Progress rows are rewritten at most this often per job
+PROGRESS_INTERVAL = 0.25
+
+# Columns added after the first jobs.db release, created on older files when the queue opens
+_ADDED_COLUMNS = {
+    'owner': 'TEXT',
+    'lease_until': 'REAL',
+}
+
+
+class JobError(Exception):
+    """Raised by a job handler with a message that is safe to show the client."""
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+class JobQueue:
+    """
+    Persistent priority queue of /jobs scans in jobs.db.
+    Jobs hold the uploaded bytes until they finish, so a restart only loses the
+    work in progress. A claimed job is leased to the claiming queue (`owner`) and the
+    lease is renewed while it runs (see JobRunner); a running job whose lease ran out
+    belonged to a process that died and goes back to 'queued', unless it has already
+    been claimed `max_attempts` times, in which case it fails instead of taking the
+    next process down with it. Several processes can share one jobs.db this way.
+    Higher priority first, then oldest first.
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH, retention_seconds: float = 7 * 24 * 3600,
+                 max_attempts: int = 3, lease_seconds: float = 60.0):
+        self.path = path
+        self.retention = retention_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # Jobs claimed here whose outcome is not recorded yet; only their leases are renewed
+        self._held = set()
+        self._local = threading.local()
+        self._ready = False
+        self._init_lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self.init()
+            conn = _connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def init(self) -> int:
+        """Creates the table, reclaims jobs with expired leases and drops expired ones. Returns jobs requeued."""
+        with self._init_lock:
+            if self._ready:
+                return 0
+            conn = _connect(self.path)
+            try:
+                with conn:
+                    conn.execute(
+                        '''
+                        CREATE TABLE IF NOT EXISTS jobs (
+                            id TEXT PRIMARY KEY,
+                            status TEXT NOT NULL,
+                            priority INTEGER NOT NULL DEFAULT 0,
+                            created_at REAL NOT NULL,
+                            started_at REAL,
+                            finished_at REAL,
+                            options_json TEXT,
+                            payload BLOB,
+                            filename TEXT,
+                            progress_done INTEGER DEFAULT 0,
+                            progress_total INTEGER,
+                            attempts INTEGER DEFAULT 0,
+                            result_json TEXT,
+                            scan_id INTEGER,
+                            error TEXT,
+                            owner TEXT,
+                            lease_until REAL
+                        )
+                        '''
+                    )
+                    existing = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+                    for column, kind in _ADDED_COLUMNS.items():
+                        if column not in existing:
+                            conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {kind}')
+                    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_next ON jobs(status, priority DESC, created_at)')
+                    requeued, given_up = self._reclaim(conn)
+                    conn.execute(
+                        "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                        (time.time() - self.retention,)
+                    )
+            finally:
+                conn.close()
+            self._log_reclaimed(requeued, given_up)
+            self._ready = True
+            return requeued
+
+    def _reclaim(self, conn: sqlite3.Connection) -> tuple:
+        """Requeues (or fails, past max_attempts) running jobs whose lease expired. Returns both counts."""
+        now = time.time()
+        stale = "status = 'running' AND (lease_until IS NULL OR lease_until < ?)"
+        given_up = conn.execute(
+            f'''
+            UPDATE jobs SET status = 'failed', finished_at = ?, payload = NULL, owner = NULL, lease_until = NULL,
+                            error = 'The scan was interrupted ' || attempts || ' times; not retried again'
+            WHERE {stale} AND attempts >= ?
+            ''',
+            (now, now, self.max_attempts)
+        ).rowcount
+        requeued = conn.execute(
+            f'''
+            UPDATE jobs SET status = 'queued', started_at = NULL, progress_done = 0, owner = NULL, lease_until = NULL
+            WHERE {stale}
+            ''',
+            (now,)
+        ).rowcount
+        return requeued, given_up
+
+    @staticmethod
+    def _log_reclaimed(requeued: int, given_up: int):
+        if requeued:
+            logger.info(f"Requeued {requeued} interrupted jobs")
+        if given_up:
+            logger.warning(f"Failed {given_up} interrupted jobs that ran out of attempts")
+
+    def reclaim(self) -> int:
+        """Reclaims jobs of processes that stopped renewing their leases since the queue was opened."""
+        conn = self._conn()
+        with conn:
+            requeued, given_up = self._reclaim(conn)
+        self._log_reclaimed(requeued, given_up)
+        return requeued
+
+    def renew(self) -> int:
+        """Extends the leases of the jobs this queue is running. Returns how many."""
+        held = list(self._held)
+        if not held:
+            return 0
+        conn = self._conn()
+        with conn:
+            return conn.execute(
+                f'''
+                UPDATE jobs SET lease_until = ?
+                WHERE owner = ? AND status = 'running' AND id IN ({','.join('?' * len(held))})
+                ''',
+                (time.time() + self.lease_seconds, self.owner, *held)
+            ).rowcount
+
+    def submit(self, payload: bytes, options: dict, priority: int = 0, filename: str = None) -> str:
+        job_id = uuid.uuid4().hex
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                '''
+                INSERT INTO jobs (id, status, priority, created_at, options_json, payload, filename)
+                VALUES (?, 'queued', ?, ?, ?, ?, ?)
+                ''',
+                (job_id, priority, time.time(), json.dumps(options), sqlite3.Binary(payload), filename)
+            )
+        return job_id
+
+    def claim(self) -> Optional[dict]:
+        """Atomically moves the next queued job to 'running' and returns it with its payload."""
+        conn = self._conn()
+        # IMMEDIATE takes the write lock up front so two runners cannot claim the same row
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                '''
+                SELECT id, priority, options_json, payload, filename FROM jobs
+                WHERE status = 'queued' ORDER BY priority DESC, created_at LIMIT 1
+                '''
+            ).fetchone()
+            if row is not None:
+                now = time.time()
+                conn.execute(
+                    '''
+                    UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1,
+                                    owner = ?, lease_until = ?
+                    WHERE id = ?
+                    ''',
+                    (now, self.owner, now + self.lease_seconds, row[0])
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        self._held.add(row[0])
+        return {'id': row[0], 'priority': row[1], 'options': json.loads(row[2] or '{}'),
+                'payload': bytes(row[3]), 'filename': row[4]}
+
+    def finish(self, job_id: str, result: dict, scan_id: int = None) -> bool:
+        """Stores the result of a job this queue holds; False when it no longer does (see _lost)."""
+        # Released even if the write fails, so the lease lapses and the job is reclaimed
+        self._held.discard(job_id)
+        conn = self._conn()
+        with conn:
+            # The upload is no longer needed once the result is stored
+            updated = conn.execute(
+                '''
+                UPDATE jobs SET status = 'done', finished_at = ?, result_json = ?, scan_id = ?, payload = NULL,
+                                progress_done = COALESCE(progress_total, progress_done)
+                WHERE id = ? AND owner = ? AND status = 'running'
+                ''',
+                (time.time(), json.dumps(result, ensure_ascii=False), scan_id, job_id, self.owner)
+            ).rowcount
+        return updated > 0 or self._lost(job_id, 'result')
+
+    def fail(self, job_id: str, error: str) -> bool:
+        """Marks a job this queue holds as failed; False when it no longer does (see _lost)."""
+        self._held.discard(job_id)
+        conn = self._conn()
+        with conn:
+            updated = conn.execute(
+                '''
+                UPDATE jobs SET status = 'failed', finished_at = ?, error = ?, payload = NULL
+                WHERE id = ? AND owner = ? AND status = 'running'
+                ''',
+                (time.time(), error, job_id, self.owner)
+            ).rowcount
+        return updated > 0 or self._lost(job_id, 'failure')
+
+    def _lost(self, job_id: str, outcome: str) -> bool:
+        # The lease lapsed (a stalled heartbeat) and the job was reclaimed, so another claim owns it now
+        logger.warning(f"Job {job_id} is no longer leased to this process; its {outcome} was not recorded")
+        return False
+
+    def get(self, job_id: str) -> Optional[dict]:
+        row = self._conn().execute(
+            '''
+            SELECT id, status, priority, created_at, started_at, finished_at, filename,
+                   progress_done, progress_total, result_json, scan_id, error
+            FROM jobs WHERE id = ?
+            ''',
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = {
+            'id': row[0],
+            'status': row[1],
+            'priority': row[2],
+            'created_at': row[3],
+            'started_at': row[4],
+            'finished_at': row[5],
+            'filename': row[6],
+            'progress': {'tiles_done': row[7], 'tiles_total': row[8]},
+            'scan_id': row[10],
+            'error': row[11],
+        }
+        if row[1] == 'queued':
+            job['queue_position'] = self._conn().execute(
+                '''
+                SELECT COUNT(*) FROM jobs WHERE status = 'queued'
+                AND (priority > ? OR (priority = ? AND created_at < ?))
+                ''',
+                (row[2], row[2], row[3])
+            ).fetchone()[0]
+        job['result'] = json.loads(row[9]) if row[9] else None
+        return job
+
+    def counts(self) -> dict:
+        rows = self._conn().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update(dict(rows))
+        return counts
+
+
+class JobProgress:
+    """
+    Picklable progress callback for analyze_image: writes tile progress of one job
+    to jobs.db, throttled to PROGRESS_INTERVAL. Works from thread and process workers.
+    """
+
+    def __init__(self, job_id: str, path: str = JOBS_DB_PATH):
+        self.job_id = job_id
+        self.path = path
+        self._last = 0.0
+
+    def __call__(self, done: int, total: int):
+        now = time.monotonic()
+        if done < total and now - self._last < PROGRESS_INTERVAL:
+            return
+        self._last = now
+        try:
+            conn = _connect(self.path)
+            try:
+                with conn:
+                    conn.execute('UPDATE jobs SET progress_done = ?, progress_total = ? WHERE id = ?',
+                                 (done, total, self.job_id))
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            # Progress is advisory; never fail the scan over it
+            logger.warning(f"Progress update for job {self.job_id} failed: {e}")
+
+
+class JobRunner:
+    """
+    Background threads that claim jobs from a JobQueue and hand them to `handler`, plus
+    one that renews the leases of the jobs they run and reclaims jobs of dead processes.
+    """
+
+    def __init__(self, jobs: JobQueue, handler: Callable[[dict], tuple], workers: int = 1,
+                 poll_interval: float = 1.0):
+        self.jobs = jobs
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        self.jobs.init()
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'job-runner-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name='job-lease', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def notify(self):
+        """Wakes an idle runner right away instead of at the next poll."""
+        self._wake.set()
+
+    def shutdown(self):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _heartbeat(self):
+        # A few renewals per lease, so one slow write does not let a live job's lease lapse
+        while not self._stop.wait(self.jobs.lease_seconds / 3):
+            try:
+                self.jobs.renew()
+                if self.jobs.reclaim():
+                    self._wake.set()
+            except sqlite3.Error as e:
+                logger.error(f"Renewing job leases failed: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self.jobs.claim()
+            except sqlite3.Error as e:
+                logger.error(f"Claiming a job failed: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            try:
+                result, scan_id = self.handler(job)
+            except JobError as e:
+                self._record(self.jobs.fail, job['id'], str(e))
+                continue
+            except Exception as e:
+                logger.error(f"Job {job['id']} failed: {e}")
+                self._record(self.jobs.fail, job['id'], "Backend Analysis Failed. Check server logs.")
+                continue
+            self._record(self.jobs.finish, job['id'], result, scan_id)
+
+    @staticmethod
+    def _record(outcome: Callable, job_id: str, *args):
+        # A locked or failing jobs.db must not end the runner thread; the job is no longer renewed,
+        # so its lease lapses and it is reclaimed and run again
+        try:
+            outcome(job_id, *args)
+        except sqlite3.Error as e:
+            logger.error(f"Recording the outcome of job {job_id} failed: {e}")
@@ -1,3 +1,10 @@
+import json
+import re
+from pathlib import Path
+from typing import Dict, List
+
+MODEL_CLASSES_PATH = Path(__file__).resolve().parents[2] / "model_classes.json"
+
 SWARA_TO_SEMITONE = {
     'sa': 1,
     're1': 2,
@@ -30,80 +37,129 @@ SWARA_DETAILS = {
     'Sa': ("Sa", "स")
 }
 
+# SWARA_DETAILS key for each SWARA_TO_SEMITONE key
+_SWARA_KEYS = {
+    'sa': 'Sa',
+    're1': 'Re♭ (Komal Re)',
+    're': 'Re',
+    'ga1': 'Ga♭ (Komal Ga)',
+    'ga': 'Ga',
+    'ma': 'Ma',
+    'ma2': 'Ma♯ (Tivra Ma)',
+    'pa': 'Pa',
+    'dha1': 'Dha♭ (Komal Dha)',
+    'dha': 'Dha',
+    'ni1': 'Ni♭ (Komal Ni)',
+    'ni': 'Ni',
+}
+
+# Model labels mark the saptak with a dot: 'Sa(dot above)' is taar (upper) Sa, 'Sa(dot below)' mandra (lower)
+OCTAVES = {
+    'dot above': 'Upper',
+    'dot below': 'Lower',
+    'no dot': 'Middle',
+}
+
+_LABEL_RE = re.compile(r'^\s*([A-Za-z]+\d?)\s*(?:\((.*)\))?\s*$')
+
+# label -> details, filled on first sight of each label
+_resolved = {}
+
+
+def _resolve(label: str) -> dict:
+    match = _LABEL_RE.match(label)
+    swara = match.group(1).lower() if match else None
+    if swara in SWARA_TO_SEMITONE:
+        english, symbol = SWARA_DETAILS[_SWARA_KEYS[swara]]
+        mark = (match.group(2) or 'no dot').strip().lower()
+        return {
+            "english": english,
+            "symbol": symbol,
+            "numeric": SWARA_TO_SEMITONE[swara],
+            "octave": OCTAVES.get(mark, 'Middle'),
+        }
+    for swara, key in _SWARA_KEYS.items():
+        if label == key:
+            english, symbol = SWARA_DETAILS[key]
+            return {"english": english, "symbol": symbol, "numeric": SWARA_TO_SEMITONE[swara], "octave": 'Middle'}
+    # Not a swara (e.g. 'Handwriting')
+    return {"english": label, "symbol": label, "numeric": -1, "octave": None}
+
+
 def get_swara_details(label: str):
-    """Returns (English Name, Symbol, Numeric (1-12), Octave) with ultra-robust lookup."""
+    """
+    Returns {english, symbol, numeric (1-12, -1 for non-swara classes), octave (Upper/Middle/Lower)}.
+    Each distinct label is parsed once; the returned dict is shared, so treat it as read-only.
+    """
     label = str(label)
-    
-    # 1. Direct Lookup (Exact)
-    details = SWARA_DETAILS.get(label)
-    
-    # 2. Robust lookup (Case-insensitive, Prefix matching, Suffix stripping)
-    if not details:
-        label_clean = label.split('(')[0].strip().lower() # 'Sa(dot)' -> 'sa'
-        label_lower = label.lower()
-        
-        # Priority 1: Case-insensitive match on full label
-        for key, val in SWARA_DETAILS.items():
-            if key.lower() == label_lower:
-                details = val
-                break
-        
-        # Priority 2: Match on clean prefix (e.g., 'Sa' from 'Sa(no dot)')
-        if not details:
-            for key, val in SWARA_DETAILS.items():
-                key_clean = key.split('(')[0].strip().lower()
-                if key_clean == label_clean:
-                    details = val
-                    break
-                    
-    # 3. Fallback to basic swara identification if still not found
-    if not details:
-        base_swaras = ['sa', 're', 'ga', 'ma', 'pa', 'dha', 'ni']
-        label_lower = label.lower()
-        for base in base_swaras:
-            if base in label_lower:
-                # Find the first matching base swara details
-                # Check for Komal/Tivra keywords
-                is_komal = 'komal' in label_lower or '♭' in label_lower or '_' in label_lower
-                is_tivra = 'tivra' in label_lower or '♯' in label_lower or 'm2' in label_clean or 'ma2' in label_clean
-                
-                for key, val in SWARA_DETAILS.items():
-                    k_lower = key.lower()
-                    if k_lower.startswith(base):
-                        if is_komal and ('komal' in k_lower or '♭' in k_lower):
-                            details = val
-                            break
-                        if is_tivra and ('tivra' in k_lower or '♯' in k_lower):
-                            details = val
-                            break
-                        if not is_komal and not is_tivra and 'komal' not in k_lower and 'tivra' not in k_lower and '♭' not in k_lower and '♯' not in k_lower:
-                            details = val
-                            break
-                if not details: # Default to base if specialized version not found
-                    for key, val in SWARA_DETAILS.items():
-                        if key.lower().startswith(base):
-                            details = val
-                            break
-                if details: break
-                
-    if not details:
-        details = (label, label)
-    
-    # Optional mapping for numeric values based on clean label
-    label_clean = label.split('(')[0].strip().lower()
-    numeric = SWARA_TO_SEMITONE.get(label_clean, -1)
-    if numeric == -1: # Try base lookup
-        for base, num in SWARA_TO_SEMITONE.items():
-            if base in label_clean:
-                numeric = num
-                break
-    
-    return {
-        "english": details[0],
-        "symbol": details[1],
-        "numeric": numeric,
-        "octave": "Natural" # Default
-    }
+    details = _resolved.get(label)
+    if details is None:
+        details = _resolved[label] = _resolve(label)
+    return details
+
+
+class LabelTable:
+    """
+    Class id -> swara details for one model, built once from its class names
+    (model_classes.json or the loaded model's names), so the detection loop does a list index.
+    """
+
+    def __init__(self, names: Dict[int, str]):
+        size = max(names) + 1 if names else 0
+        self.labels = [None] * size
+        self.details = [None] * size
+        for class_id, label in names.items():
+            self.labels[class_id] = label
+            self.details[class_id] = get_swara_details(label)
+
+    def __getitem__(self, class_id: int) -> dict:
+        return self.details[class_id]
+
+
+_tables = {}
+
+
+def label_table(names: Dict[int, str]) -> LabelTable:
+    """Cached LabelTable for a names mapping (one per distinct model)."""
+    key = tuple(sorted(names.items()))
+    table = _tables.get(key)
+    if table is None:
+        table = _tables[key] = LabelTable(names)
+    return table
+
+
+def load_model_classes(path: str = None) -> Dict[int, str]:
+    """Class names shipped with the model (model_classes.json at the repo root)."""
+    path = path or MODEL_CLASSES_PATH
+    with open(path, encoding='utf-8') as f:
+        return {int(k): v for k, v in json.load(f).items()}
+
 
 def map_swara_to_num(label: str) -> int:
     return get_swara_details(label)["numeric"]
+
+
+# Devanagari symbol -> semitone, so phrases can also be typed as 'स रे ग'
+_SYMBOL_TO_SEMITONE = {SWARA_DETAILS[key][1]: SWARA_TO_SEMITONE[swara] for swara, key in _SWARA_KEYS.items()}
+
+
+def parse_phrase(text: str) -> List[int]:
+    """
+    Semitones (1-12) of a typed phrase such as 'Sa Re Ga Ma2 Pa', '1 3 5 6 8' or 'स रे ग'.
+    Tokens are separated by spaces, commas or dashes; octave marks (' and .) are ignored,
+    as numeric_sequence has no octave either. Raises ValueError on an unknown token.
+    """
+    notes = []
+    for token in re.split(r'[\s,;\-]+', text.strip()):
+        swara = token.strip("'.").lower()
+        if not swara:
+            continue
+        if swara.isdigit() and 1 <= int(swara) <= 12:
+            notes.append(int(swara))
+        elif swara in SWARA_TO_SEMITONE:
+            notes.append(SWARA_TO_SEMITONE[swara])
+        elif token in _SYMBOL_TO_SEMITONE:
+            notes.append(_SYMBOL_TO_SEMITONE[token])
+        else:
+            raise ValueError(f"Unknown swara: {token}")
+    return notes
@@ -0,0 +1,228 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# Stage durations range from sub-millisecond merges to multi-second denoising on large pages
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+REQUEST_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _series(name: str, labels: Dict[str, str]) -> str:
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic count; like every counter here its name ends in _total, which is also its sample name."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.kind = 'counter'
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=STAGE_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.kind = 'histogram'
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            labels = dict(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, counts):
+                yield self.name + '_bucket', {**labels, 'le': _number(bound)}, count
+            yield self.name + '_sum', labels, total
+            yield self.name + '_count', labels, counts[-1]
+
+
+class Gauge:
+    """Value read at scrape time from `collect`, which returns a number or {label value: number}."""
+
+    def __init__(self, name: str, help: str, collect: Callable, labelname: str = None, kind: str = 'gauge'):
+        self.name, self.help, self.labelname, self.kind = name, help, labelname, kind
+        self.collect = collect
+
+    def samples(self):
+        value = self.collect()
+        if value is None:
+            return
+        if self.labelname is None:
+            yield self.name, {}, value
+            return
+        for label, v in value.items():
+            yield self.name, {self.labelname: label}, v
+
+
+class Registry:
+    """Process-local metrics rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=STAGE_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, collect: Callable, labelname: str = None, kind: str = 'gauge') -> Gauge:
+        return self.register(Gauge(name, help, collect, labelname, kind))
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                # One broken collector must not take the whole scrape down
+                lines.append(f'# {metric.name} collection failed: {_escape(e)}')
+                continue
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{_series(name, labels)} {_number(value)}' for name, labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    'swaralipi_stage_duration_seconds', 'Time spent in each pipeline stage.', ('stage',))
+request_seconds = registry.histogram(
+    'swaralipi_http_request_duration_seconds', 'HTTP request latency by route and status.',
+    ('method', 'route', 'status'), REQUEST_BUCKETS)
+pages_counter = registry.counter(
+    'swaralipi_pages_total', 'Pages analysed, by how the result was produced.', ('source',))
+tiles_counter = registry.counter(
+    'swaralipi_tiles_total', 'Sliced tiles planned, run through the model, reused from the tile cache or skipped as blank.', ('kind',))
+page_memory_bytes = registry.histogram(
+    'swaralipi_page_memory_estimate_bytes', 'Estimated peak working memory per analysed page.', (),
+    tuple(mb * 2 ** 20 for mb in (32, 64, 128, 256, 512, 1024, 2048)))
+live_frames_counter = registry.counter(
+    'swaralipi_live_frames_total', 'Live camera frames received, dropped under backpressure, tracked or sent to the detector.',
+    ('kind',))
+boxes_counter = registry.counter(
+    'swaralipi_boxes_total', 'Detection boxes before NMM, after NMM and after post-processing.', ('stage',))
+
+
+class Trace:
+    """Stage durations (milliseconds) of one request, for the Server-Timing header."""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, ms: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + ms
+
+    def server_timing(self) -> str:
+        # Header tokens cannot contain '@' or '.', so "detect.infer@400" becomes "detect-infer-400"
+        return ', '.join(
+            f'{stage.replace(".", "-").replace("@", "-")};dur={ms:.1f}' for stage, ms in self.stages.items()
+        )
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar('swaralipi_trace', default=None)
+
+
+def start_trace() -> Trace:
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+def record_stage(stage: str, ms: float):
+    stage_seconds.observe(ms / 1000, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, ms)
+
+
+@contextmanager
+def span(stage: str):
+    """Times the block as `stage` for /metrics and the current request's trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, (time.perf_counter() - start) * 1000)
+
+
+def record_stages(prefix: str, timings: Dict[str, float]):
+    for stage, ms in timings.items():
+        record_stage(f'{prefix}.{stage}', ms)
+
+
+def record_pipeline(info: dict):
+    """Stage timings and tile/box counts of one analyze_image run (computed on the worker)."""
+    record_stages('preprocess', info.get('timings', {}))
+    record_stages('detect', info.get('detect_ms', {}))
+    counts = info.get('counts', {})
+    pages_counter.inc(source='analysed')
+    if 'tiles' in counts:
+        tiles_counter.inc(counts['tiles'], kind='planned')
+        tiles_counter.inc(counts['tiles_inferred'], kind='inferred')
+        tiles_counter.inc(counts.get('tiles_reused', 0), kind='reused')
+        tiles_counter.inc(counts.get('tiles_skipped', 0), kind='skipped')
+    for stage in ('boxes_raw', 'boxes_merged'):
+        if stage in counts:
+            boxes_counter.inc(counts[stage], stage=stage[len('boxes_'):])
+    if 'detections' in counts:
+        boxes_counter.inc(counts['detections'], stage='final')
+    memory = info.get('memory')
+    if memory:
+        page_memory_bytes.observe(memory['estimated_peak_mb'] * 2 ** 20)
+
+
+def flatten(stats: Optional[dict], keys: Iterable[str]) -> Optional[dict]:
+    """Picks numeric fields of a stats() dict as {key: value} for a labelled gauge."""
+    if stats is None:
+        return None
+    return {k: stats[k] for k in keys if isinstance(stats.get(k), (int, float))}
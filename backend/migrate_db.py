@@ -0,0 +1,41 @@
+import argparse
+import shutil
+import sys
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import database
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert scans.db to the normalized detections schema")
+    parser.add_argument('--db', default=database.DB_PATH)
+    parser.add_argument('--no-backup', action='store_true', help="Skip copying the database to <db>.bak first")
+    args = parser.parse_args()
+
+    if not Path(args.db).exists():
+        print(f"Database not found at {args.db}")
+        sys.exit(1)
+    if not args.no_backup:
+        shutil.copyfile(args.db, args.db + '.bak')
+        print(f"Backup written to {args.db}.bak")
+
+    database.DB_PATH = args.db
+    conn = database._connect()
+    try:
+        with conn:
+            database._create_schema(conn)
+            converted = database.migrate(conn)
+        scans = conn.execute('SELECT COUNT(*) FROM scans').fetchone()[0]
+        detections = conn.execute('SELECT COUNT(*) FROM detections').fetchone()[0]
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+    print(f"Converted {converted} scans; {scans} scans / {detections} detections stored")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from database import get_connection
+
+# Bump when detection/mapping semantics change so stale results stop matching
+CACHE_VERSION = 3
+
+
+class ResultCache:
+    """
+    Content-addressed /detect result cache.
+    Keys hash the decoded pixels together with the pipeline settings; values are the
+    columnar results (see compact.py). An in-memory LRU sits in front of a persistent table in scans.db,
+    both bounded by entry count and TTL.
+    """
+
+    def __init__(self, max_entries: int = 256, max_disk_entries: int = 10000,
+                 ttl_seconds: float = 7 * 24 * 3600, persistent: bool = True):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl_seconds
+        self.persistent = persistent
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_ready = False
+        self._hits_memory = 0
+        self._hits_disk = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def make_key(img: np.ndarray, settings: dict) -> str:
+        h = hashlib.blake2b(digest_size=20)
+        h.update(json.dumps({'v': CACHE_VERSION, **settings}, sort_keys=True).encode())
+        h.update(f"{img.shape}{img.dtype}".encode())
+        h.update(np.ascontiguousarray(img).data)
+        return h.hexdigest()
+
+    def _connect(self):
+        conn = get_connection()
+        if not self._db_ready:
+            conn.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    key TEXT PRIMARY KEY,
+                    created_at REAL,
+                    last_access REAL,
+                    result_json TEXT
+                )
+                '''
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_result_cache_access ON result_cache(last_access)')
+            conn.commit()
+            self._db_ready = True
+        return conn
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self._hits_memory += 1
+                    return value
+                del self._memory[key]
+                self._evictions += 1
+
+        if self.persistent:
+            conn = self._connect()
+            with conn:
+                row = conn.execute('SELECT created_at, result_json FROM result_cache WHERE key = ?', (key,)).fetchone()
+                if row is not None and now - row[0] > self.ttl:
+                    conn.execute('DELETE FROM result_cache WHERE key = ?', (key,))
+                elif row is not None:
+                    conn.execute('UPDATE result_cache SET last_access = ? WHERE key = ?', (now, key))
+
+            if row is not None and now - row[0] <= self.ttl:
+                value = json.loads(row[1])
+                with self._lock:
+                    self._remember(key, row[0], value)
+                    self._hits_disk += 1
+                return value
+            if row is not None:
+                with self._lock:
+                    self._evictions += 1
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def put(self, key: str, value: dict):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+        if not self.persistent:
+            return
+
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO result_cache (key, created_at, last_access, result_json) VALUES (?,?,?,?)',
+                (key, now, now, json.dumps(value, ensure_ascii=False))
+            )
+            # Expired rows first, then least recently used beyond the size limit
+            cur = conn.execute('DELETE FROM result_cache WHERE created_at < ?', (now - self.ttl,))
+            evicted = cur.rowcount
+            cur = conn.execute(
+                '''
+                DELETE FROM result_cache WHERE key IN (
+                    SELECT key FROM result_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+                ''',
+                (self.max_disk_entries,)
+            )
+            evicted += cur.rowcount
+        with self._lock:
+            self._evictions += evicted
+
+    def _remember(self, key: str, created_at: float, value: dict):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits_memory + self._hits_disk + self._misses
+            return {
+                "entries": len(self._memory),
+                "hits_memory": self._hits_memory,
+                "hits_disk": self._hits_disk,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round((self._hits_memory + self._hits_disk) / lookups, 3) if lookups else 0.0,
+            }
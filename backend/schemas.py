@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List
 
 
 class Detection(BaseModel):
@@ -19,6 +19,12 @@ class DetectResponse(BaseModel):
     overall_confidence: float
     timestamp: str | None = None
     model_info: str | None = None
+    scales_used: List[int] | None = None
+    preprocess_profile: str | None = None
+    preprocess_ms: Dict[str, float] | None = None
+    page_memory: Dict[str, int | float | None] | None = None
+    tile_stats: Dict[str, int | float] | None = None
+    cached: bool = False
 
 
 class ScanRecord(BaseModel):
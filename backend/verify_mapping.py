@@ -4,7 +4,7 @@ from pathlib import Path
 # Add backend to path
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 
-from mapping.swara_map import get_swara_details
+from mapping.swara_map import get_swara_details, label_table, load_model_classes
 
 test_cases = [
     ("Sa(no dot)", 1, "Middle"),
@@ -31,14 +31,24 @@ def verify():
         octave = result['octave']
         
         status = " PASS" if numeric == expected_num and octave == expected_octave else " FAIL"
-        if status == "❌ FAIL":
+        if status == " FAIL":
             print(f"{status} | Label: {label:15} | Expected: ({expected_num}, {expected_octave}) | Got: ({numeric}, {octave})")
         else:
             print(f"{status} | Label: {label:15} | Result: ({numeric}, {octave})")
             success_count += 1
             
+    # The class-id table used by /detect must agree with label lookup for every model class
+    names = load_model_classes()
+    table = label_table(names)
+    table_ok = True
+    for class_id, label in sorted(names.items()):
+        if table[class_id] != get_swara_details(label) or table.labels[class_id] != label:
+            print(f" FAIL | Class {class_id:2d} ({label}) resolves differently by id: {table[class_id]}")
+            table_ok = False
+    print(f" {'PASS' if table_ok else 'FAIL'} | Class id table covers {len(names)} model classes")
+
     print(f"\nVerification Complete: {success_count}/{len(test_cases)} passed.")
-    if success_count == len(test_cases):
+    if success_count == len(test_cases) and table_ok:
         sys.exit(0)
     else:
         sys.exit(1)
@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import Navbar from '../components/Navbar';
-import { getHistory } from '../services/api';
+import { getHistory, getScan } from '../services/api';
 
 const History: React.FC = () => {
   const [history, setHistory] = useState<any[]>([]);
@@ -63,8 +63,10 @@ const History: React.FC = () => {
               <div
                 key={h.id}
                 onClick={() => {
-                  sessionStorage.setItem('lastResult', JSON.stringify(h.result));
-                  navigate('/result');
+                  getScan(h.id).then(scan => {
+                    sessionStorage.setItem('lastResult', JSON.stringify(scan.result));
+                    navigate('/result');
+                  }).catch(err => console.error("Failed to open scan:", err));
                 }}
                 className="group relative bg-white border border-gray-100 rounded-2xl p-5 hover:border-black transition-all active:scale-[0.98] cursor-pointer"
               >
@@ -79,7 +81,7 @@ const History: React.FC = () => {
                   </div>
                   <div className="text-right">
                     <span className="text-lg font-black italic leading-none">
-                      {(h.result.overall_confidence * 100).toFixed(0)}%
+                      {(h.overall_confidence * 100).toFixed(0)}%
                     </span>
                     <p className="text-[9px] font-bold text-gray-400 uppercase tracking-tighter">Match</p>
                   </div>
@@ -87,12 +89,12 @@ const History: React.FC = () => {
 
                 <div className="flex items-center gap-2">
                   <div className="flex gap-1.5 flex-wrap">
-                    {h.result.numeric_sequence.slice(0, 6).map((n: number, i: number) => (
+                    {h.numeric_sequence.slice(0, 6).map((n: number, i: number) => (
                       <span key={i} className="w-7 h-7 flex items-center justify-center bg-gray-50 border border-gray-100 text-black text-[11px] font-black rounded-lg">
                         {n}
                       </span>
                     ))}
-                    {h.result.numeric_sequence.length > 6 && (
+                    {h.numeric_sequence.length > 6 && (
                       <span className="text-gray-300 text-xs font-black self-center ml-1">...</span>
                     )}
                   </div>
@@ -34,12 +34,14 @@ export async function uploadImage(file: File, confidence = 0.3) {
 }
 
 /**
- * Fetches the history of previous notation scans.
+ * Fetches the history of previous notation scans (summaries only, no detections).
  * @param limit Number of records to retrieve.
+ * @param beforeId Return scans older than this id (for loading the next page).
  */
-export async function getHistory(limit = 50) {
+export async function getHistory(limit = 50, beforeId?: number) {
   try {
-    const res = await fetch(`${API_BASE}/history?limit=${limit}`, {
+    const cursor = beforeId !== undefined ? `&before_id=${beforeId}` : '';
+    const res = await fetch(`${API_BASE}/history?limit=${limit}&fields=summary${cursor}`, {
       method: 'GET',
     });
 
@@ -51,4 +53,18 @@ export async function getHistory(limit = 50) {
   
     return [];
   }
-}
\ No newline at end of file
+}
+
+/**
+ * Fetches one stored scan with its full detection result.
+ * @param id Scan id from the history list.
+ */
+export async function getScan(id: number) {
+  const res = await fetch(`${API_BASE}/history/${id}`, {
+    method: 'GET',
+  });
+
+  if (!res.ok) throw new Error(`HTTP Error ${res.status}`);
+
+  return await res.json();
+}